@@ -5,20 +5,39 @@ import logging
 
 from metabot.modules import admin
 from metabot import multibot
+from metabot import shard
 from metabot.util import humanize
+from metabot.util import logutil
+from metabot.util import metrics
 from metabot.util import modutil
 
 
 def main():  # pylint: disable=missing-docstring
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-v', '--verbose', action='store_true')
-    args = parser.parse_args()
+    args = _build_parser().parse_args()
+
+    logutil.configure(level=args.verbose and logging.DEBUG or logging.INFO,
+                      json_lines=args.log_json,
+                      update_levels=dict(args.log_update),
+                      sample=args.log_sample)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
 
-    logging.basicConfig(
-        format='%(asctime)s %(levelname)s %(threadName)s %(filename)s:%(lineno)s] %(message)s',
-        level=args.verbose and logging.DEBUG or logging.INFO)
+    if args.shards > 1:
+        return shard.run(args.shards,
+                         'metabot.modules',
+                         'config',
+                         save_interval=args.save_interval,
+                         storage=args.storage,
+                         workers=args.workers,
+                         poller=args.poller,
+                         metrics_port=args.metrics_port)
 
-    mybot = multibot.MultiBot(modutil.load_modules('metabot.modules'), confdir='config')
+    mybot = multibot.MultiBot(modutil.load_modules('metabot.modules'),
+                              confdir='config',
+                              save_interval=args.save_interval,
+                              storage=args.storage,
+                              workers=args.workers,
+                              poller=args.poller)
     if not mybot.conf['bots']:
         print()
         print("Hi! Before I can start, I need at least one bot's Telegram token. If you don't have "
@@ -57,7 +76,79 @@ def main():  # pylint: disable=missing-docstring
         print()
         print('    /_bootstrap %s' % admin.BOOTSTRAP_TOKEN)
         print()
-    mybot.run()
+    try:
+        mybot.run()
+    finally:
+        mybot.conf.flush()
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('--save-interval',
+                        type=float,
+                        default=0,
+                        metavar='SECONDS',
+                        help='write config changes in the background at most once every SECONDS '
+                        '(default: write them immediately)')
+    parser.add_argument('--storage',
+                        choices=('yaml', 'sqlite'),
+                        default='yaml',
+                        help='store config as one YAML file per top-level key, or as one row per '
+                        'setting in config/botconf.sqlite3 (imported from the YAML files on first '
+                        'use)')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=0,
+                        metavar='N',
+                        help='process updates for different chats concurrently in N threads '
+                        '(default: process all updates one at a time)')
+    parser.add_argument('--poller',
+                        choices=('threads', 'asyncio'),
+                        default='threads',
+                        help='long-poll each bot in its own thread, or all bots from a single '
+                        'asyncio event loop; either way, updates and jobs are processed in threads '
+                        '(asyncio implies --workers 8 if --workers is not given)')
+    parser.add_argument('--shards',
+                        type=int,
+                        default=0,
+                        metavar='N',
+                        help='split bots across N worker processes, with this process saving the '
+                        'config and polling calendars for all of them')
+    parser.add_argument('--log-json',
+                        action='store_true',
+                        help='log one JSON object per line, including structured fields')
+    parser.add_argument('--log-sample',
+                        type=float,
+                        default=1,
+                        metavar='FRACTION',
+                        help='only log this fraction of incoming updates (default: 1)')
+    parser.add_argument('--log-update',
+                        action='append',
+                        type=_update_level,
+                        default=[],
+                        metavar='TYPE=LEVEL',
+                        help='log incoming updates of TYPE (like message or inline_query) at LEVEL '
+                        '(like debug or info), or not at all if LEVEL is off (default: info)')
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=0,
+        metavar='PORT',
+        help='serve Prometheus-style metrics at http://127.0.0.1:PORT/metrics (with '
+        '--shards, each worker process serves its own at PORT+1, PORT+2, etc.)')
+    return parser
+
+
+def _update_level(spec):
+    update_type, sep, level = spec.partition('=')
+    if not update_type or not sep:
+        raise argparse.ArgumentTypeError('expected TYPE=LEVEL, not %r' % spec)
+    if level.lower() == 'off':
+        return update_type, None
+    if not isinstance(levelno := logging.getLevelName(level.upper()), int):
+        raise argparse.ArgumentTypeError('unknown log level %r' % level)
+    return update_type, levelno
 
 
 if __name__ == '__main__':
@@ -1,29 +1,69 @@
 """Self-managing bot/module configuration store."""
 
+import atexit
 import contextlib
 import logging
 import os
+import threading
+import time
 
 from metabot.util import dicttools
 from metabot.util import jsonutil
+from metabot.util import logutil
+from metabot.util import metrics
+from metabot.util import sqliteconf
 from metabot.util import yamlutil
 
 
-class BotConf(dicttools.ImplicitTrackingDict):
+class BotConf(dicttools.ImplicitTrackingDict):  # pylint: disable=too-many-instance-attributes
     """Self-managing bot/module configuration store."""
 
     confdir = None
+    store = None
+    _flusher = None
 
-    def __init__(self, confdir=None):  # pylint: disable=too-many-branches
-        super().__init__()
+    # pylint: disable=too-many-arguments,too-many-branches,too-many-locals
+    def __init__(self,
+                 confdir=None,
+                 *,
+                 save_interval=None,
+                 storage='yaml',
+                 concurrent=False,
+                 publish=None):
+        if concurrent:
+            # Each thread logs (and finalizes) its own changes.
+            super().__init__(log=dicttools.PerThread(dict), maybe_empty=dicttools.PerThread(set))
+        else:
+            super().__init__()
+        self.concurrent = concurrent
+        # If provided, finalized changes are passed to publish({path: value}) rather than being
+        # written to disk (by this process).
+        self.publish = publish
+        self._dirty = set()
+        self._fnames = set()
+        self.lock = threading.RLock()
+        # The idents of threads currently inside record_mutations.
+        self._writers = set()
+        self.save_interval = save_interval
+        self._flush_lock = threading.Lock()
+        self._pending = threading.Event()
         if confdir:  # pylint: disable=too-many-nested-blocks
             self.confdir = confdir
             if not os.path.isdir(confdir):
                 os.makedirs(confdir, 0o700)  # pragma: no cover
+            if storage == 'sqlite':
+                self.store = sqliteconf.Store(os.path.join(confdir, 'botconf.sqlite3'))
+            if self.store:
+                sqliteconf.populate(self, self.store)
             else:
                 for fname in os.listdir(confdir):
                     if fname.endswith('.yaml'):
                         self[fname[:-len('.yaml')]] = yamlutil.load(os.path.join(confdir, fname))
+                # What was just loaded is already on disk, so don't mark it dirty (unless it's
+                # being imported into a new SQLite store).
+                if self.store is None:
+                    super().finalize()
+                    self._fnames.update(self)
 
             # Schema update: Remove after 2019-03-26 (https://github.com/nmlorg/metabot/issues/18).
             if not self['bots']:
@@ -70,36 +110,160 @@ class BotConf(dicttools.ImplicitTrackingDict):
                             if value is not None:
                                 groupconf['daily'][key] = value
 
-        self._fnames = set(self)
+    def finalize(self):
+        """Trim empty hanging dicts, clear the audit log, and return a copy of the log.
+
+        All logged paths are remembered for the next save().
+        """
+
+        with self.lock:
+            log = super().finalize()
+            self._dirty.update(log)
+        if self.publish and log:
+            self.publish({path: value for path, (value, _) in log.items()})
+        return log
+
+    def _trim(self):
+        # Another thread partway through an update may be about to write into a dict that looks
+        # empty now, so only trim (always while holding self.lock) while no other thread is
+        # partway through one. Anything skipped is checked again by this thread's next finalize().
+        with self.lock:
+            if not self._writers - {threading.get_ident()}:
+                super()._trim()
+
+    def apply(self, changes):
+        """Set {path: value} for each change (where None removes path).
+
+        If this store publishes its changes, the applied changes (which presumably came from
+        another publisher) are not logged.
+        """
+
+        with self.lock:
+            for path, value in changes.items():
+                parent = self
+                for key in path[:-1]:
+                    parent = parent.view(key)
+                parent[path[-1]] = value
+                if self.publish:
+                    self.log.pop(path, None)
 
     @contextlib.contextmanager
     def record_mutations(self, ctx):
-        """Capture and record all changes to the bot config."""
-
-        try:
-            yield self
-        finally:
-            log = self.finalize()
-            if log:
-                mgr = ctx.mgr
-                userdata = []
-                if hasattr(mgr, 'user_id'):
-                    userdata.append(f'{mgr.user_id}')
-                    if mgr.user_username:
-                        userdata.append(f'@{mgr.user_username}')
-                    if mgr.user_name:
-                        userdata.append(repr(mgr.user_name))
-                for path, (value, orig) in sorted(log.items()):
-                    pathstr = '.'.join('%s' % part for part in path)
-                    logging.info('[%s] %s: %r -> %r', ' '.join(userdata), pathstr, orig, value)
-                self.save()
+        """Capture and record all changes to the bot config.
+
+        Unless the store is concurrent (where each thread's changes are logged separately), the
+        store is locked until the changes have been recorded.
+        """
+
+        ident = threading.get_ident()
+        with (not self.concurrent and self.lock or contextlib.nullcontext()):
+            with self.lock:
+                self._writers.add(ident)
+            try:
+                yield self
+            finally:
+                log = self.finalize()
+                with self.lock:
+                    self._writers.discard(ident)
+                if log:
+                    logutil.log_changes(logutil.Lazy(_describe_user, ctx.mgr), log)
+                    self.save()
 
     def save(self):
-        """Serialize the store to disk (if confdir was provided at creation)."""
-
-        if self.confdir:
-            for fname in self._fnames.difference(self):
-                os.remove(os.path.join(self.confdir, fname + '.yaml'))  # pragma: no cover
-            self._fnames = set(self)
-            for fname, data in self.items():
-                yamlutil.dump(os.path.join(self.confdir, fname + '.yaml'), data)
+        """Serialize the changed parts of the store to disk (if confdir was provided at creation).
+
+        Only files whose top-level key appears in the (current or a finalized) mutation log are
+        rewritten (or, with SQLite storage, only the logged paths themselves). If save_interval was
+        provided at creation, this just schedules a background flush, so bursts of changes are
+        coalesced into at most one write per save_interval seconds.
+        """
+
+        if not self.save_interval:
+            return self.flush()
+        with self.lock:
+            self._dirty.update(self.log)
+        self._pending.set()
+        if not self._flusher:
+            self._flusher = threading.Thread(target=self._flush_periodically,
+                                             name='botconf',
+                                             daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def _flush_periodically(self):
+        while True:
+            self._pending.wait()
+            time.sleep(self.save_interval)
+            self._pending.clear()
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('While saving %s:', self.confdir)
+
+    def flush(self):
+        """Immediately write all changes to disk."""
+
+        if not self.confdir or self.publish:
+            return
+        with self._flush_lock, metrics.timer('conf_flush_seconds'):
+            if self.store is not None:
+                self._flush_sqlite()
+            else:
+                self._flush_yaml()
+
+    def _flush_sqlite(self):
+        with self.lock:
+            rows = {path: self._leaf(path) for path in self._dirty.union(self.log)}
+            self._dirty = set()
+        self.store.commit(rows)
+
+    def _flush_yaml(self):
+        # Copy everything that needs to be written while holding the lock, then do the slow
+        # serialization without blocking further changes.
+        with self.lock:
+            removed = self._fnames.difference(self)
+            self._fnames.intersection_update(self)
+            fnames = {path[0] for path in self._dirty.union(self.log)}
+            self._dirty = set()
+            snapshot = {fname: _snapshot(self[fname]) for fname in sorted(fnames) if fname in self}
+            self._fnames.update(snapshot)
+        for fname in removed:
+            os.remove(os.path.join(self.confdir, fname + '.yaml'))  # pragma: no cover
+        for fname, data in snapshot.items():
+            yamlutil.dump(os.path.join(self.confdir, fname + '.yaml'), data)
+
+    def _leaf(self, path):
+        """Return the current value of the leaf at path (or None if path isn't a leaf)."""
+
+        value = self
+        for key in path:
+            if not isinstance(value, dict):
+                return
+            value = value.get(key)
+        if isinstance(value, list):
+            return list(value)
+        if not isinstance(value, dict):
+            return value
+
+
+def _describe_user(mgr):
+    userdata = []
+    if hasattr(mgr, 'user_id'):
+        userdata.append(f'{mgr.user_id}')
+        if mgr.user_username:
+            userdata.append(f'@{mgr.user_username}')
+        if mgr.user_name:
+            userdata.append(repr(mgr.user_name))
+    return ' '.join(userdata)
+
+
+def _snapshot(value):
+    """Return a deep copy of value built from plain dicts and lists."""
+
+    # dict.copy and list.copy are atomic, so this is safe even while other threads are making
+    # changes.
+    if isinstance(value, dict):
+        return {k: _snapshot(v) for k, v in dict.copy(value).items()}
+    if isinstance(value, list):
+        return [_snapshot(v) for v in list.copy(value)]
+    return value
@@ -2,6 +2,100 @@
 
 import hashlib
 import logging
+import sys
+import threading
+
+
+class Event:
+    """A compact, immutable calendar event, readable like a dict."""
+
+    __slots__ = ('description', 'end', 'id', 'local_id', 'location', 'start', 'summary', 'updated',
+                 'sortkey')
+    _fields = __slots__[:-1]
+
+    def __init__(self, local):
+        self.__setstate__(tuple(local[k] for k in self._fields))
+
+    def __getstate__(self):
+        return tuple(getattr(self, k) for k in self._fields)
+
+    def __setstate__(self, state):
+        fields = {}
+        for k, value in zip(self._fields, state):
+            if k in ('start', 'end'):
+                value = float(value)
+            elif k != 'description' and isinstance(value, str):
+                value = sys.intern(value)
+            fields[k] = value
+            object.__setattr__(self, k, value)
+        object.__setattr__(self, 'sortkey',
+                           (fields['start'], fields['end'], fields['summary'], fields['local_id']))
+
+    def __setattr__(self, k, value):
+        raise AttributeError('Event objects are immutable.')
+
+    def __contains__(self, k):
+        return k in self._fields
+
+    def __eq__(self, other):
+        if isinstance(other, Event):
+            return self.__getstate__() == other.__getstate__()
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    def __getitem__(self, k):
+        if k not in self._fields:
+            raise KeyError(k)
+        return getattr(self, k)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return 'Event(%r)' % dict(self.items())
+
+    def copy(self):
+        """Return self (Events are immutable)."""
+
+        return self
+
+    def get(self, k, default=None):
+        """Return self[k] if k is a field, else default."""
+
+        if k not in self._fields:
+            return default
+        return getattr(self, k)
+
+    def items(self):
+        """Return a list of (field, value) pairs."""
+
+        return [(k, getattr(self, k)) for k in self._fields]
+
+    def keys(self):
+        """Return the list of fields."""
+
+        return list(self._fields)
+
+    def values(self):
+        """Return the list of field values."""
+
+        return [getattr(self, k) for k in self._fields]
+
+
+def sort_key(event):
+    """Return the (start, end, summary, local_id) key used to order events (or event dicts)."""
+
+    if isinstance(event, Event):
+        return event.sortkey
+    return (event['start'], event['end'], event['summary'], event['local_id'])
+
+
+class SyncTokenExpired(Exception):
+    """The sync token passed to Calendar.poll_changes is no longer accepted by the provider."""
 
 
 class Calendar:
@@ -9,12 +103,19 @@ class Calendar:
 
     caltype = 'base'
     last_update = None
+    sync_token = None
 
     def __init__(self, calid):
         caltype, self.calpath = calid.split(':', 1)
         assert caltype == self.caltype
         self.calcode = self._hashid(calid)
         self.events = {}
+        # The local_ids of all events added, removed, or updated since the last time a consumer
+        # (like MultiCalendar.poll) cleared this.
+        self.changes = set()
+        # Held while events, changes, and the sync state are updated, since calendars may be polled
+        # from a background thread while others read them.
+        self.lock = threading.RLock()
 
     @staticmethod
     def _hashid(uid):
@@ -28,7 +129,7 @@ class Calendar:
             location = location.replace('\n', ', ')
         local_id = local.get('local_id') or '%s:%s' % (self.calcode, self._hashid(local['id']))
 
-        return {
+        return Event({
             'description': local.get('description') or '',
             'end': local['end'],
             'id': local['id'],
@@ -37,27 +138,36 @@ class Calendar:
             'start': local['start'],
             'summary': local.get('summary') or '',
             'updated': local['updated'],
-        }
+        })
 
     def _removed(self, proto_id):
-        local_id = '%s:%s' % (self.calcode, self._hashid(proto_id))
-        local = self.events.pop(local_id, None)
+        return self.__removed_local('%s:%s' % (self.calcode, self._hashid(proto_id)))
+
+    def __removed_local(self, local_id):
+        with self.lock:
+            local = self.events.pop(local_id, None)
+            if local:
+                self.changes.add(local_id)
         if local:
             logging.info('Event %s (%s) was removed.', local['id'], local['summary'])
             return True
 
     def _updated(self, proto):
-        local = self._normalize(self.event_proto_to_local(proto))
-        oldlocal = self.events.get(local['local_id'])
+        return self.__updated_local(self._normalize(self.event_proto_to_local(proto)))
+
+    def __updated_local(self, local):
+        with self.lock:
+            oldlocal = self.events.get(local['local_id'])
+            if oldlocal == local:
+                return
+            self.events[local['local_id']] = local
+            self.changes.add(local['local_id'])
+            if not self.last_update or self.last_update < local['updated']:
+                self.last_update = local['updated']
         if not oldlocal:
             logging.info('Event %s (%s) added.', local['id'], local['summary'])
-        elif oldlocal != local:
-            logging.info('Event %s (%s) updated.', local['id'], local['summary'])
         else:
-            return
-        self.events[local['local_id']] = local
-        if not self.last_update or self.last_update < local['updated']:
-            self.last_update = local['updated']
+            logging.info('Event %s (%s) updated.', local['id'], local['summary'])
         return True
 
     def add(self, local):
@@ -66,15 +176,19 @@ class Calendar:
         newlocal = self._normalize(
             self.event_proto_to_local(self.proto_add(self.event_local_to_proto(local))))
         logging.info('Added event %s (%s).', newlocal['id'], newlocal['summary'])
-        self.events[newlocal['local_id']] = newlocal
-        if not self.last_update or self.last_update < newlocal['updated']:
-            self.last_update = newlocal['updated']
+        with self.lock:
+            self.events[newlocal['local_id']] = newlocal
+            self.changes.add(newlocal['local_id'])
+            if not self.last_update or self.last_update < newlocal['updated']:
+                self.last_update = newlocal['updated']
         return newlocal
 
     def remove(self, local_id):
         """Remove an event (given as calcode:localcode)."""
 
-        currentlocal = self.events.pop(local_id)
+        with self.lock:
+            currentlocal = self.events.pop(local_id)
+            self.changes.add(local_id)
         self.proto_remove(currentlocal['id'])
         logging.info('Removed event %s (%s).', currentlocal['id'], currentlocal['summary'])
 
@@ -86,14 +200,54 @@ class Calendar:
             self.event_proto_to_local(
                 self.proto_update(currentlocal['id'], self.event_local_to_proto(local))))
         logging.info('Updated event %s (%s).', newlocal['id'], newlocal['summary'])
-        self.events[newlocal['local_id']] = newlocal
-        if not self.last_update or self.last_update < newlocal['updated']:
-            self.last_update = newlocal['updated']
+        with self.lock:
+            self.events[newlocal['local_id']] = newlocal
+            self.changes.add(local_id)
+            self.changes.add(newlocal['local_id'])
+            if not self.last_update or self.last_update < newlocal['updated']:
+                self.last_update = newlocal['updated']
         return newlocal
 
+    def poll(self):
+        """Check the data provider for updates.
+
+        The default implementation asks poll_changes for everything that changed since the last
+        sync_token, falling back to a full resync if the provider has expired that token.
+        """
+
+        if self.sync_token is not None:
+            try:
+                return self._sync(self.sync_token)
+            except SyncTokenExpired:
+                logging.info('Sync token for %s expired; resyncing.', self.calpath)
+        return self._sync(None)
+
+    def _sync(self, since):
+        protos, removed_ids, sync_token = self.poll_changes(since)
+        locals_ = [self._normalize(self.event_proto_to_local(proto)) for proto in protos]
+        with self.lock:
+            # A full resync implicitly removes every event the provider didn't mention.
+            stale = set()
+            if since is None:
+                stale.update(self.events)
+            updated = False
+            for local in locals_:
+                stale.discard(local['local_id'])
+                updated = self.__updated_local(local) or updated
+            for proto_id in removed_ids:
+                updated = self._removed(proto_id) or updated
+            for local_id in stale:
+                updated = self.__removed_local(local_id) or updated
+            self.sync_token = sync_token
+        return updated
+
     @staticmethod
-    def poll():  # pragma: no cover
-        """Check the data provider for updates."""
+    def poll_changes(since):  # pragma: no cover
+        """Ask the data provider for all events changed since the given sync token.
+
+        Return (updated_protos, removed_proto_ids, next_sync_token). If since is None, return every
+        event (removed_proto_ids is ignored). If since has expired, raise SyncTokenExpired.
+        """
 
         raise NotImplementedError
 
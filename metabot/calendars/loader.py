@@ -2,6 +2,8 @@
 
 import importlib
 import logging
+import os
+import threading
 
 from metabot.util import pickleutil
 
@@ -29,35 +31,114 @@ def get(calid):
 
 
 class _CachingCalendarMixin:
+    """Persist a calendar as a snapshot (<calcode>.pickle) plus a journal of changes since.
+
+    Every mutation appends one record--{local_id: event or None} plus the calendar's
+    _journal_attrs--to <calcode>.journal. Once the journal outgrows the snapshot, the journal is set
+    aside as <calcode>.journal.compacting and a fresh snapshot (of everything) is written in the
+    background.
+    """
+
     _cache_dir = 'calendars'
+    # The (small) attributes besides events that need to survive between snapshots.
+    _journal_attrs = ('last_update', 'sync_token')
+    _compact_min = 64 * 1024
+    _compact_ratio = 1
 
     def __init__(self, calid):
         super().__init__(calid)
         self.__fname = '%s/%s.pickle' % (self._cache_dir, self.calcode)
+        self.__journal = '%s/%s.journal' % (self._cache_dir, self.calcode)
+        self.__compactor = None
+        # Held while appending to the journal or starting a compaction, since calendars can be
+        # polled (and so saved) from multiple threads.
+        self.__lock = threading.RLock()
         data = pickleutil.load(self.__fname)
         if data:
-            self.__dict__.update(data)
-
-    def __save(self):
-        logging.info('Rewriting %r.', self.__fname)
-        self.__dict__.update(pickleutil.dump(self.__fname, self.__dict__))
+            self.__dict__.update(
+                (k, v) for k, v in data.items() if not k.startswith('_CachingCalendarMixin__'))
+        self.__snapshot_size = os.path.exists(self.__fname) and os.path.getsize(self.__fname) or 0
+        compacting = os.path.exists(self.__journal + '.compacting')
+        for fname in (self.__journal + '.compacting', self.__journal):
+            for events, attrs in pickleutil.load_all(fname):
+                for local_id, local in events.items():
+                    if local is None:
+                        self.events.pop(local_id, None)
+                    else:
+                        self.events[local_id] = local
+                self.__dict__.update(attrs)
+        if compacting:  # A previous compaction was interrupted.
+            self.__compact()
+            self.__compactor.join()
+
+    def __state(self):
+        with self.lock:
+            state = {
+                k: v
+                for k, v in self.__dict__.items()
+                if k not in ('changes', 'lock') and not k.startswith('_CachingCalendarMixin__')
+            }
+            state['events'] = dict(self.events)
+        return state
+
+    def __save(self, local_ids):
+        with self.lock:
+            attrs = {k: getattr(self, k) for k in self._journal_attrs}
+            record = ({local_id: self.events.get(local_id) for local_id in local_ids}, attrs)
+        with self.__lock:
+            size = pickleutil.append(self.__journal, record)
+            if size > max(self._compact_min, self._compact_ratio * self.__snapshot_size):
+                self.__compact()
+
+    def __compact(self):
+        with self.__lock:
+            if self.__compactor and self.__compactor.is_alive():
+                return
+            self.__start_compaction()
+
+    def __start_compaction(self):
+        state = pickleutil.optimize(self.__state())
+        compacting = self.__journal + '.compacting'
+        if not os.path.exists(compacting) and os.path.exists(self.__journal):
+            os.replace(self.__journal, compacting)
+        elif os.path.exists(self.__journal):  # Keep the interrupted compaction's records too.
+            with open(self.__journal, 'rb') as journal, open(compacting, 'ab') as fobj:
+                fobj.write(journal.read())
+            os.remove(self.__journal)
+
+        def _write():
+            logging.info('Rewriting %r.', self.__fname)
+            pickleutil.write(self.__fname, state)
+            self.__snapshot_size = os.path.getsize(self.__fname)
+            if os.path.exists(compacting):
+                os.remove(compacting)
+
+        self.__compactor = threading.Thread(target=_write,
+                                            daemon=True,
+                                            name='compact-' + self.calcode)
+        self.__compactor.start()
 
     def poll(self):  # pylint: disable=missing-docstring
         if super().poll():
-            self.__save()
+            with self.lock:
+                local_ids = set(self.changes)
+            if local_ids:
+                self.__save(local_ids)
+            else:  # The calendar didn't itemize what changed, so just snapshot everything.
+                self.__compact()
             return True
 
     def add(self, local):  # pylint: disable=missing-docstring
         ret = super().add(local)
-        self.__save()
+        self.__save({ret['local_id']})
         return ret
 
     def remove(self, local_id):  # pylint: disable=missing-docstring
         ret = super().remove(local_id)
-        self.__save()
+        self.__save({local_id})
         return ret
 
     def update(self, local_id, local):  # pylint: disable=missing-docstring
         ret = super().update(local_id, local)
-        self.__save()
+        self.__save({local_id, ret['local_id']})
         return ret
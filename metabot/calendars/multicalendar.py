@@ -1,32 +1,76 @@
 """A manager that blends multiple base.Calendar objects' events together."""
 
-import operator
+import bisect
+import concurrent.futures
+import contextlib
+import logging
+import threading
 import time
 
+from metabot.calendars import base
 from metabot.calendars import loader
+from metabot.util import intervalindex
+from metabot.util import metrics
 
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
 
-class MultiCalendar:
+
+class MultiCalendar:  # pylint: disable=too-many-instance-attributes
     """A manager that blends multiple base.Calendar objects' events together."""
 
     _current_index = None
+    _timeline = None
+    generation = 0
+    # If set, calendars are polled by another process, which sends their changes to apply().
+    remote = False
 
-    def __init__(self):
+    def __init__(self, *, poll_workers=8, poll_timeout=60):
         self.calendars = {}
         self.by_local_id = {}
         self.ordered = []
+        self.index = intervalindex.IntervalIndex([], [])
+        self._views = {}
+        self.poll_workers = poll_workers
+        self.poll_timeout = poll_timeout
+        self.poll_times = {}
+        self._polling = {}
+        self._poll_slots = threading.BoundedSemaphore(max(poll_workers, 1))
 
     def _rebuild(self):
-        self.ordered.sort(key=operator.itemgetter('start', 'end', 'summary', 'local_id'))
-        current_index = None
-        by_local_id = {}
-        now = time.time()
-        for i, event in enumerate(self.ordered):
-            by_local_id[event['local_id']] = i
-            if current_index is None and event['end'] >= now:
-                current_index = i
-        self._current_index = current_index
-        self.by_local_id = by_local_id
+        self.ordered.sort(key=base.sort_key)
+        self.by_local_id = {event['local_id']: i for i, event in enumerate(self.ordered)}
+        self._reindex()
+
+    def _merge(self, calendar):
+        """Patch self.ordered and self.by_local_id in place with calendar's pending changes."""
+
+        ordered = self.ordered
+        by_local_id = self.by_local_id
+        first = len(ordered)
+        with _locked(calendar):
+            changes = [(local_id, calendar.events.get(local_id)) for local_id in calendar.changes]
+            calendar.changes.clear()
+        removed = [by_local_id.pop(local_id) for local_id, _ in changes if local_id in by_local_id]
+        for index in sorted(removed, reverse=True):
+            ordered.pop(index)
+            first = index
+        for _, event in changes:
+            if event:
+                index = bisect.bisect_left(ordered, base.sort_key(event), key=base.sort_key)
+                ordered.insert(index, event)
+                first = min(first, index)
+        for i in range(first, len(ordered)):
+            by_local_id[ordered[i]['local_id']] = i
+
+    def _reindex(self):
+        self.index = intervalindex.IntervalIndex([event['start'] for event in self.ordered],
+                                                 [event['end'] for event in self.ordered])
+        self._current_index = next(self.index.search(time.time(), float('inf')), None)
+        self.generation += 1
+        self._views = {}
 
     @property
     def current_index(self):
@@ -54,11 +98,28 @@ class MultiCalendar:
         """Add a new calendar to the manager (if it's not already installed)."""
 
         if calid not in self.calendars:
-            self.calendars[calid] = loader.get(calid)
-            self.ordered.extend(self.calendars[calid].events.values())
+            self.calendars[calid] = calendar = loader.get(calid)
+            with _locked(calendar):
+                self.ordered.extend(calendar.events.values())
+                if (changes := getattr(calendar, 'changes', None)):
+                    changes.clear()
             self._rebuild()
         return self.calendars[calid]
 
+    def apply(self, calid, events):
+        """Apply {local_id: event (or None if removed)} changes to calid without polling it."""
+
+        calendar = self.add(calid)
+        with _locked(calendar):
+            for local_id, event in events.items():
+                if event is None:
+                    calendar.events.pop(local_id, None)
+                else:
+                    calendar.events[local_id] = event
+            calendar.changes.update(events)
+        self._merge(calendar)
+        self._reindex()
+
     def get_event(self, local_id=None):
         """Retrieve a specific event, plus the event immediately before and after it."""
 
@@ -78,50 +139,206 @@ class MultiCalendar:
     def get_overlap(self, start, end):
         """Find all events whose [start, end] range overlaps the given [start, end] range."""
 
-        for event in self.ordered:
-            if event['start'] > end:
-                break
-            if event['end'] >= start:
-                yield event
+        for i in self.index.search(start, end):
+            yield self.ordered[i]
+
+    def get_overlaps(self, queries):
+        """For each (calcodes, start, end) in queries, list the indexes into self.ordered of events
+        from those calendars overlapping [start, end].
+
+        If NumPy is available, all queries are answered together from a columnar Timeline;
+        otherwise each falls back to self.view(calcodes).get_overlap(start, end).
+        """
+
+        if numpy is None:
+            results = []
+            for calcodes, start, end in queries:
+                events = self.view(calcodes).get_overlap(start, end)
+                results.append([self.by_local_id[event['local_id']] for event in events])
+            return results
+        if not self._timeline or self._timeline.generation != self.generation:
+            self._timeline = Timeline(self)
+        return self._timeline.get_overlaps(queries)
+
+    def _poll_calendar(self, calid):
+        if (calendar := self.calendars.get(calid)) is None:
+            return
+        start = time.monotonic()
+        try:
+            return calendar.poll()
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('While polling %s:', calid)
+        finally:
+            self.poll_times[calid] = elapsed = time.monotonic() - start
+            logging.info('Polled %s in %.3f seconds.', calid, elapsed)
+            metrics.observe('calendar_poll_seconds', elapsed, calendar=calid)
+            metrics.gauge('calendar_events', len(calendar.events), calendar=calid)
+
+    def _poll_all(self):
+        """Poll all installed calendars, returning {calid: updated} for those that finished."""
+
+        if self.poll_workers <= 1:
+            return {calid: self._poll_calendar(calid) for calid in self.calendars}
+
+        for calid in self.calendars:
+            if calid not in self._polling:
+                self._polling[calid] = self._submit(calid)
+        concurrent.futures.wait(self._polling.values(), timeout=self.poll_timeout)
+
+        finished = {}
+        for calid, future in list(self._polling.items()):
+            if not future.done():
+                logging.info('Still waiting for %s after %s seconds.', calid, self.poll_timeout)
+                continue
+            result = self._polling.pop(calid).result()
+            # The calendar may have been removed while it was being polled.
+            if calid in self.calendars:
+                finished[calid] = result
+        return finished
+
+    def _submit(self, calid):
+        """Poll calid in a daemon thread, once one of self.poll_workers slots is free.
+
+        The threads are daemons (unlike a ThreadPoolExecutor's), so a poll stuck past poll_timeout
+        can't keep the process from exiting.
+        """
+
+        future = concurrent.futures.Future()
+
+        def _run():
+            with self._poll_slots:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(self._poll_calendar(calid))
+
+        threading.Thread(target=_run, daemon=True, name='multicalendar-poll').start()
+        return future
 
     def poll(self):
-        """Poll all installed calendars for updates."""
-
-        updated = False
-        for calendar in self.calendars.values():
-            updated = calendar.poll() or updated
-        if updated:
+        """Poll all installed calendars for updates.
+
+        Calendars are polled concurrently by up to self.poll_workers threads. Calendars still
+        polling after self.poll_timeout seconds are left running, and their changes are picked up
+        by a later poll.
+        """
+
+        if self.remote:
+            return False
+        finished = self._poll_all()
+        updated = any(finished.values())
+        # Calendars that don't itemize their changes force a full rebuild.
+        if any(result and not getattr(self.calendars[calid], 'changes', None)
+               for calid, result in finished.items()):
             self.ordered = []
-            for calendar in self.calendars.values():
-                self.ordered.extend(calendar.events.values())
+            for calid, calendar in self.calendars.items():
+                with _locked(calendar):
+                    # Calendars still being polled keep their changes, to be journaled (and merged
+                    # again, harmlessly) once they finish.
+                    if calid not in self._polling and (changes := getattr(
+                            calendar, 'changes', None)):
+                        changes.clear()
+                    self.ordered.extend(list(calendar.events.values()))
             self._rebuild()
+        else:
+            merged = False
+            for calid in finished:
+                if getattr(self.calendars[calid], 'changes', None):
+                    self._merge(self.calendars[calid])
+                    merged = True
+            if merged:
+                self._reindex()
+                updated = True
         return updated
 
     def view(self, calcodes):
         """A MultiCalendar-like object that operates on a subset of the installed calendars."""
 
-        return View(self, calcodes)
+        calcodes = frozenset(calcodes)
+        if (view := self._views.get(calcodes)) is None:
+            self._views[calcodes] = view = View(self, calcodes)
+        return view
+
+
+def _locked(calendar):
+    # Test doubles may not have a lock.
+    return getattr(calendar, 'lock', None) or contextlib.nullcontext()
+
+
+class Timeline:  # pylint: disable=too-few-public-methods
+    """NumPy arrays of the start, end, and calendar of each event in MultiCalendar.ordered."""
+
+    def __init__(self, multical):
+        self.generation = multical.generation
+        self.calcodes = {}
+        cals = [
+            self.calcodes.setdefault(event['local_id'].split(':', 1)[0], len(self.calcodes))
+            for event in multical.ordered
+        ]
+        self.cals = numpy.array(cals, dtype=numpy.intp)
+        self.starts = numpy.array([event['start'] for event in multical.ordered], dtype=float)
+        self.ends = numpy.array([event['end'] for event in multical.ordered], dtype=float)
+        # The latest end of any event up to and including each index (so it's sorted, too).
+        self.maxends = numpy.maximum.accumulate(self.ends)
+
+    def get_overlaps(self, queries):
+        """For each (calcodes, start, end) in queries, list the indexes of overlapping events."""
+
+        queries = list(queries)
+        qstarts = numpy.array([start for _, start, _ in queries], dtype=float)
+        qends = numpy.array([end for _, _, end in queries], dtype=float)
+        # Every overlapping event lies in [lo, hi): events before lo all ended before the query
+        # started, and events from hi on all start after the query ends.
+        los = numpy.searchsorted(self.maxends, qstarts, side='left')
+        his = numpy.searchsorted(self.starts, qends, side='right')
+        allowed_by_calcodes = {}
+        results = []
+        for (calcodes, start, _), lo, hi in zip(queries, los, his):
+            calcodes = frozenset(calcodes)
+            if (allowed := allowed_by_calcodes.get(calcodes)) is None:
+                allowed = numpy.zeros(len(self.calcodes), dtype=bool)
+                allowed[[
+                    self.calcodes[calcode] for calcode in calcodes if calcode in self.calcodes
+                ]] = True
+                allowed_by_calcodes[calcodes] = allowed
+            mask = (self.ends[lo:hi] >= start) & allowed[self.cals[lo:hi]]
+            results.append((numpy.flatnonzero(mask) + lo).tolist())
+        return results
 
 
 class View:
     """A MultiCalendar-like object that operates on a subset of the installed calendars."""
 
+    generation = None
+
     def __init__(self, multical, calcodes):
         self.multical = multical
-        self.calcodes = calcodes
+        self.calcodes = frozenset(calcodes)
+        self.by_local_id = {}
+        self.ordered = []
+        self.index = intervalindex.IntervalIndex([], [])
+
+    def _refresh(self):
+        """Rebuild this view's own index arrays if multical has changed since they were built."""
+
+        multical = self.multical
+        if self.generation == multical.generation:
+            return
+        self.ordered = [
+            event for event in multical.ordered
+            if event['local_id'].split(':', 1)[0] in self.calcodes
+        ]
+        self.by_local_id = {event['local_id']: i for i, event in enumerate(self.ordered)}
+        self.index = intervalindex.IntervalIndex([event['start'] for event in self.ordered],
+                                                 [event['end'] for event in self.ordered])
+        self.generation = multical.generation
 
     @property
     def current_index(self):
         """The index into self.multical.ordered of the current event."""
 
-        cur = self.multical.current_index
-        if cur is None:
-            return
-        while self.multical.ordered[cur]['local_id'].split(':', 1)[0] not in self.calcodes:
-            if cur == len(self.multical.ordered) - 1:
-                return
-            cur += 1
-        return cur
+        self._refresh()
+        cur = next(self.index.search(time.time(), float('inf')), None)
+        if cur is not None:
+            return self.multical.by_local_id[self.ordered[cur]['local_id']]
 
     @property
     def current_local_id(self):
@@ -134,35 +351,27 @@ class View:
     def get_event(self, local_id=None):
         """Retrieve a specific event, plus the event immediately before and after it."""
 
+        self._refresh()
         if local_id is None:
-            index = self.current_index
+            local_id = self.current_local_id
+        if (index := self.by_local_id.get(local_id)) is not None:
+            event = self.ordered[index]
+            nextindex = index + 1
+        elif (index := self.multical.by_local_id.get(local_id)) is not None:
+            # The event exists, but isn't in this view; find its neighbors from this view.
+            event = self.multical.ordered[index]
+            index = nextindex = bisect.bisect_left(self.ordered,
+                                                   base.sort_key(event),
+                                                   key=base.sort_key)
         else:
-            index = self.multical.by_local_id.get(local_id)
-        if index is None:
             return None, None, None
-        prevev = nextev = None
-
-        previndex = index - 1
-        while previndex >= 0:
-            prevev = self.multical.ordered[previndex]
-            if prevev['local_id'].split(':', 1)[0] in self.calcodes:
-                break
-            prevev = None
-            previndex -= 1
-
-        nextindex = index + 1
-        while nextindex <= len(self.multical.ordered) - 1:
-            nextev = self.multical.ordered[nextindex]
-            if nextev['local_id'].split(':', 1)[0] in self.calcodes:
-                break
-            nextev = None
-            nextindex += 1
-
-        return prevev, self.multical.ordered[index], nextev
+        prevev = index > 0 and self.ordered[index - 1] or None
+        nextev = nextindex < len(self.ordered) and self.ordered[nextindex] or None
+        return prevev, event, nextev
 
     def get_overlap(self, start, end):
         """Find all events whose [start, end] range overlaps the given [start, end] range."""
 
-        for event in self.multical.get_overlap(start, end):
-            if event['local_id'].split(':', 1)[0] in self.calcodes:
-                yield event
+        self._refresh()
+        for i in self.index.search(start, end):
+            yield self.ordered[i]
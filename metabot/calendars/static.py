@@ -9,15 +9,28 @@ class Calendar(base.Calendar):
     caltype = 'static'
     __last_id = 0
     __last_update = 0
+    min_sync_token = 0
     poll_result = False
 
     def __init__(self, calid):
         super().__init__(calid)
         self.__live_events = {}
+        self.__removed = {}
 
     def poll(self):  # pylint: disable=arguments-differ
         return self.poll_result
 
+    def poll_changes(self, since):  # pylint: disable=arguments-differ
+        if since is None:
+            return list(self.__live_events.values()), (), self.__last_update
+        if since < self.min_sync_token:
+            raise base.SyncTokenExpired(since)
+        updated = [
+            proto for proto in self.__live_events.values() if proto['UPDATED'] > 1000 + since
+        ]
+        removed = [proto_id for proto_id, when in self.__removed.items() if when > since]
+        return updated, removed, self.__last_update
+
     @staticmethod
     def event_proto_to_local(proto):
         return {key.lower(): value for key, value in proto.items()}
@@ -44,3 +57,5 @@ class Calendar(base.Calendar):
 
     def proto_remove(self, proto_id):  # pylint: disable=arguments-differ
         self.__live_events.pop(proto_id)
+        self.__last_update += 1
+        self.__removed[proto_id] = self.__last_update
@@ -1,5 +1,10 @@
 """Tests for metabot.calendars.base (using static.Calendar instead of a local class)."""
 
+import pickle
+
+import pytest
+
+from metabot.calendars import base
 from metabot.calendars import static
 
 
@@ -108,6 +113,87 @@ def test_server():
         'updated': 6000,
     })
 
+    assert calendar.changes == {'c2cf0008:be76331b'}
+    calendar.changes.clear()
+
     assert calendar._removed('alpha')
     assert calendar.events == {}
     assert not calendar._removed('alpha')
+    assert calendar.changes == {'c2cf0008:be76331b'}
+
+
+def test_sync():
+    """Test base.Calendar.poll's incremental sync protocol (via static.Calendar.poll_changes)."""
+
+    calendar = static.Calendar('static:dummy')
+    assert calendar.sync_token is None
+    poll = lambda: base.Calendar.poll(calendar)
+
+    # Simulate changes made directly through the data provider.
+    calendar.proto_add({'START': 2000, 'END': 3000, 'SUMMARY': 'Alpha'})
+    calendar.proto_add({'START': 4000, 'END': 5000, 'SUMMARY': 'Bravo'})
+
+    assert poll()
+    assert calendar.sync_token == 2
+    assert sorted(local['summary'] for local in calendar.events.values()) == ['Alpha', 'Bravo']
+    assert calendar.changes == {'c2cf0008:356a192b', 'c2cf0008:da4b9237'}
+    calendar.changes.clear()
+
+    assert not poll()
+    assert calendar.sync_token == 2
+
+    calendar.proto_update('1', {'SUMMARY': 'New Alpha'})
+    calendar.proto_remove('2')
+    assert poll()
+    assert calendar.sync_token == 4
+    assert [local['summary'] for local in calendar.events.values()] == ['New Alpha']
+    assert calendar.changes == {'c2cf0008:356a192b', 'c2cf0008:da4b9237'}
+    calendar.changes.clear()
+
+    # An expired token falls back to a full resync, which drops events the provider didn't list.
+    calendar.min_sync_token = 5
+    calendar.events['c2cf0008:bogus'] = {'id': 'bogus', 'summary': 'Bogus'}
+    assert poll()
+    assert calendar.sync_token == 4
+    assert [local['summary'] for local in calendar.events.values()] == ['New Alpha']
+    assert calendar.changes == {'c2cf0008:bogus'}
+
+
+def test_event():
+    """Verify base.Event behaves like a read-only dict."""
+
+    local = {
+        'description': 'Alpha Description',
+        'end': 3000,
+        'id': 'alpha',
+        'local_id': 'c2cf0008:be76331b',
+        'location': 'Alpha Venue',
+        'start': 2000,
+        'summary': 'Alpha Summary',
+        'updated': 4000,
+    }
+    event = base.Event(local)
+    assert event == local
+    assert local == event
+    assert event == base.Event(local)
+    assert event != base.Event(dict(local, summary='Bravo Summary'))
+    assert event != dict(local, summary='Bravo Summary')
+    assert event['start'] == 2000. and isinstance(event['start'], float)
+    assert event['summary'] == event.get('summary') == 'Alpha Summary'
+    assert event.get('unset', 'default') == 'default'
+    assert 'summary' in event and 'unset' not in event
+    assert dict(event) == dict(event.items()) == dict(zip(event.keys(), event.values())) == local
+    assert len(event) == len(local)
+    assert event.copy() is event
+    assert base.sort_key(event) == base.sort_key(local) == (2000., 3000., 'Alpha Summary',
+                                                            'c2cf0008:be76331b')
+    assert repr(event).startswith("Event({'description': 'Alpha Description', ")
+
+    with pytest.raises(KeyError):
+        assert event['unset']
+    with pytest.raises(AttributeError):
+        event.summary = 'Bravo Summary'
+
+    copy = pickle.loads(pickle.dumps(event, -1))
+    assert copy == event
+    assert base.sort_key(copy) == base.sort_key(event)
@@ -2,8 +2,11 @@
 
 import os
 import pickle
+import threading
+import time
 
 from metabot.calendars import loader
+from metabot.util import pickleutil
 
 
 def test_loader(monkeypatch, tmpdir):
@@ -12,6 +15,7 @@ def test_loader(monkeypatch, tmpdir):
     # pylint: disable=protected-access
     monkeypatch.setattr(loader._CachingCalendarMixin, '_cache_dir', tmpdir.strpath)
     fname = tmpdir.strpath + '/3ccaceeb.pickle'
+    journal = tmpdir.strpath + '/3ccaceeb.journal'
     with open(fname, 'wb') as cachefile:
         cachefile.write(pickle.dumps({'test_value': 1}))
     cal = loader.get('static:alpha@example.com')
@@ -21,10 +25,14 @@ def test_loader(monkeypatch, tmpdir):
 
     assert not cal.poll()
     assert not os.path.exists(fname)
+    assert not os.path.exists(journal)
 
+    # A poll that doesn't itemize its changes rewrites the whole snapshot.
     cal.poll_result = True
     assert cal.poll()
+    cal._CachingCalendarMixin__compactor.join()
     assert os.path.exists(fname)
+    assert not os.path.exists(journal)
     os.remove(fname)
 
     local = cal.add({
@@ -32,13 +40,117 @@ def test_loader(monkeypatch, tmpdir):
         'end': 2000,
     })
     assert local
-    assert os.path.exists(fname)
-    os.remove(fname)
+    assert not os.path.exists(fname)
+    size = os.path.getsize(journal)
 
     assert cal.update(local['local_id'], {'summary': 'new summary'})
-    assert os.path.exists(fname)
-    os.remove(fname)
+    assert os.path.getsize(journal) > size
+    size = os.path.getsize(journal)
 
     cal.remove(local['local_id'])
+    assert os.path.getsize(journal) > size
+    assert not os.path.exists(fname)
+
+
+def test_journal(monkeypatch, tmpdir):
+    """Verify the journal is replayed on load and compacted once it outgrows the snapshot."""
+
+    # pylint: disable=protected-access
+    monkeypatch.setattr(loader._CachingCalendarMixin, '_cache_dir', tmpdir.strpath)
+    monkeypatch.setattr(loader, 'CALENDARS', {})
+    fname = tmpdir.strpath + '/b80feb15.pickle'
+    journal = tmpdir.strpath + '/b80feb15.journal'
+
+    cal = loader.get('static:journal@example.com')
+    alpha = cal.add({'start': 1000, 'end': 2000, 'summary': 'Alpha'})
+    bravo = cal.add({'start': 3000, 'end': 4000, 'summary': 'Bravo'})
+    bravo = cal.update(bravo['local_id'], {'summary': 'New Bravo'})
+    cal.remove(alpha['local_id'])
+    assert not os.path.exists(fname)
+
+    monkeypatch.setattr(loader, 'CALENDARS', {})
+    newcal = loader.get('static:journal@example.com')
+    assert newcal is not cal
+    assert newcal.events == {bravo['local_id']: bravo}
+    assert newcal.last_update == cal.last_update
+
+    monkeypatch.setattr(loader._CachingCalendarMixin, '_compact_min', 0)
+    charlie = newcal.add({'start': 5000, 'end': 6000, 'summary': 'Charlie'})
+    newcal._CachingCalendarMixin__compactor.join()
     assert os.path.exists(fname)
-    os.remove(fname)
+    assert not os.path.exists(journal)
+    assert not os.path.exists(journal + '.compacting')
+
+    # Simulate a crash partway through a compaction.
+    delta = dict(bravo, local_id='b80feb15:delta', summary='Delta')
+    with open(journal + '.compacting', 'wb') as fobj:
+        fobj.write(pickle.dumps(({delta['local_id']: delta}, {})))
+    with open(journal, 'wb') as fobj:
+        fobj.write(pickle.dumps(({charlie['local_id']: None}, {})))
+
+    monkeypatch.setattr(loader, 'CALENDARS', {})
+    newcal = loader.get('static:journal@example.com')
+    assert newcal.events == {bravo['local_id']: bravo, delta['local_id']: delta}
+    assert not os.path.exists(journal)
+    assert not os.path.exists(journal + '.compacting')
+    assert pickle.loads(open(fname, 'rb').read())['events'] == newcal.events
+
+
+def test_torn_journal(monkeypatch, tmpdir):
+    """Verify changes journaled after a crash partway through an append survive a reload."""
+
+    # pylint: disable=protected-access
+    monkeypatch.setattr(loader._CachingCalendarMixin, '_cache_dir', tmpdir.strpath)
+    monkeypatch.setattr(loader, 'CALENDARS', {})
+    journal = tmpdir.strpath + '/cf425414.journal'
+
+    cal = loader.get('static:torn@example.com')
+    assert cal._CachingCalendarMixin__journal == journal
+    alpha = cal.add({'start': 1000, 'end': 2000, 'summary': 'Alpha'})
+    records = pickleutil.load_all(journal)
+    assert records == [({
+        alpha['local_id']: alpha
+    }, {
+        'last_update': alpha['updated'],
+        'sync_token': None
+    })]
+    with open(journal, 'ab') as fobj:
+        fobj.write(pickle.dumps(({'torn': None}, {}), -1)[:-3])
+
+    monkeypatch.setattr(loader, 'CALENDARS', {})
+    cal = loader.get('static:torn@example.com')
+    bravo = cal.add({'start': 3000, 'end': 4000, 'summary': 'Bravo'})
+
+    monkeypatch.setattr(loader, 'CALENDARS', {})
+    cal = loader.get('static:torn@example.com')
+    assert cal.events == {alpha['local_id']: alpha, bravo['local_id']: bravo}
+
+
+def test_concurrent_compact(monkeypatch, tmpdir):
+    """Verify concurrent saves never start overlapping compactions."""
+
+    # pylint: disable=protected-access
+    monkeypatch.setattr(loader._CachingCalendarMixin, '_cache_dir', tmpdir.strpath)
+    monkeypatch.setattr(loader, 'CALENDARS', {})
+    cal = loader.get('static:compact@example.com')
+    cal.add({'start': 1000, 'end': 2000, 'summary': 'Alpha'})
+
+    active = []
+    overlapped = []
+    start_compaction = cal._CachingCalendarMixin__start_compaction
+
+    def _start_compaction():
+        active.append(None)
+        time.sleep(.05)
+        overlapped.append(len(active) > 1)
+        start_compaction()
+        active.pop()
+
+    monkeypatch.setattr(cal, '_CachingCalendarMixin__start_compaction', _start_compaction)
+    threads = [threading.Thread(target=cal._CachingCalendarMixin__compact) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cal._CachingCalendarMixin__compactor.join()
+    assert overlapped and not any(overlapped)
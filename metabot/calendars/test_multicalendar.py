@@ -1,8 +1,13 @@
 """Tests for metabot.calendars.multicalendar."""
 
 import collections
+import random
+import threading
+
+import pytest
 
 from metabot.calendars import multicalendar
+from metabot.calendars import static
 
 
 def test_multicalendar(monkeypatch):
@@ -251,3 +256,243 @@ def test_view(monkeypatch):
         assert multical.current_index is None
         assert view.current_index is None
         assert view.get_event() == (None, None, None)
+
+
+def test_incremental_poll(monkeypatch):
+    """Verify MultiCalendar.poll patches ordered/by_local_id in place using Calendar.changes."""
+
+    # pylint: disable=protected-access
+
+    cal = static.Calendar('static:incremental')
+    for proto_id, start in (('alpha', 2000), ('bravo', 5000), ('charlie', 6000)):
+        cal._updated({'id': proto_id, 'start': start, 'end': start + 1000, 'updated': 1})
+    alpha, bravo, charlie = (cal.events['%s:%s' % (cal.calcode, cal._hashid(proto_id))]
+                             for proto_id in ('alpha', 'bravo', 'charlie'))
+
+    multical = multicalendar.MultiCalendar()
+    with monkeypatch.context() as monkey:
+        monkey.setattr('metabot.calendars.loader.get', lambda calid: cal)
+        monkey.setattr('time.time', lambda: 1000.)
+        multical.add('static:incremental')
+    assert cal.changes == set()
+    assert multical.ordered == [alpha, bravo, charlie]
+
+    ordered = multical.ordered
+    by_local_id = multical.by_local_id
+    assert not multical.poll()
+    assert multical.ordered is ordered
+
+    # Move bravo to the end, add delta at the beginning, and remove alpha.
+    cal._updated({'id': 'bravo', 'start': 9000, 'end': 9500, 'updated': 2})
+    bravo = cal.events[bravo['local_id']]
+    cal._updated({'id': 'delta', 'start': 1000, 'end': 1500, 'updated': 2})
+    delta = cal.events['%s:%s' % (cal.calcode, cal._hashid('delta'))]
+    cal._removed('alpha')
+    assert len(cal.changes) == 3
+
+    with monkeypatch.context() as monkey:
+        monkey.setattr('time.time', lambda: 1600.)
+        assert multical.poll()
+    assert cal.changes == set()
+    assert multical.ordered is ordered
+    assert multical.by_local_id is by_local_id
+    assert multical.ordered == [delta, charlie, bravo]
+    assert multical.by_local_id == {
+        delta['local_id']: 0,
+        charlie['local_id']: 1,
+        bravo['local_id']: 2
+    }
+    assert multical._current_index == 1
+    assert list(multical.get_overlap(6500, 9000)) == [charlie, bravo]
+    assert multical.get_event(charlie['local_id']) == (delta, charlie, bravo)
+
+
+def test_apply(monkeypatch):
+    """Verify a remote MultiCalendar never polls, but merges changes passed to apply()."""
+
+    # pylint: disable=protected-access
+
+    cal = static.Calendar('static:apply')
+    for proto_id, start in (('alpha', 2000), ('bravo', 5000)):
+        cal._updated({'id': proto_id, 'start': start, 'end': start + 1000, 'updated': 1})
+    alpha, bravo = sorted(cal.events.values(), key=lambda event: event.start)
+    cal.poll = lambda: 1 / 0
+
+    multical = multicalendar.MultiCalendar()
+    multical.remote = True
+    with monkeypatch.context() as monkey:
+        monkey.setattr('metabot.calendars.loader.get', lambda calid: cal)
+        monkey.setattr('time.time', lambda: 1000.)
+        multical.add('static:apply')
+        assert not multical.poll()
+        assert multical.ordered == [alpha, bravo]
+
+        source = static.Calendar('static:apply')
+        source._updated({'id': 'charlie', 'start': 1000, 'end': 1500, 'updated': 2})
+        charlie = source.events[next(iter(source.changes))]
+        generation = multical.generation
+        multical.apply('static:apply', {alpha['local_id']: None, charlie['local_id']: charlie})
+    assert multical.generation == generation + 1
+    assert cal.changes == set()
+    assert multical.ordered == [charlie, bravo]
+    assert multical.get_event(bravo['local_id']) == (charlie, bravo, None)
+
+
+def test_view_cache(monkeypatch):
+    """Verify MultiCalendar.view caches View objects, and Views rebuild after polls."""
+
+    # pylint: disable=protected-access
+
+    cal = static.Calendar('static:viewcache')
+    cal._updated({'id': 'alpha', 'start': 2000, 'end': 3000, 'updated': 1})
+    alpha = cal.events['%s:%s' % (cal.calcode, cal._hashid('alpha'))]
+
+    multical = multicalendar.MultiCalendar()
+    with monkeypatch.context() as monkey:
+        monkey.setattr('metabot.calendars.loader.get', lambda calid: cal)
+        monkey.setattr('time.time', lambda: 1000.)
+        multical.add('static:viewcache')
+
+    view = multical.view([cal.calcode])
+    assert multical.view({cal.calcode}) is view
+    assert multical.view(['other']) is not view
+    assert view.get_event(alpha['local_id']) == (None, alpha, None)
+    assert view.ordered == [alpha]
+
+    cal._updated({'id': 'bravo', 'start': 4000, 'end': 5000, 'updated': 1})
+    bravo = cal.events['%s:%s' % (cal.calcode, cal._hashid('bravo'))]
+    with monkeypatch.context() as monkey:
+        monkey.setattr('time.time', lambda: 1000.)
+        assert multical.poll()
+    assert multical.view([cal.calcode]) is not view
+    assert view.get_event(alpha['local_id']) == (None, alpha, bravo)
+    assert view.ordered == [alpha, bravo]
+
+    # Events outside the view are still returned, with neighbors taken from the view.
+    other = multical.view(['other'])
+    assert other.get_event(bravo['local_id']) == (None, bravo, None)
+    assert other.ordered == []
+
+
+def test_concurrent_poll(monkeypatch):
+    """Verify calendars are polled concurrently, and stragglers are merged by a later poll."""
+
+    # pylint: disable=protected-access
+
+    fast = static.Calendar('static:fast')
+    slow = static.Calendar('static:slow')
+    broken = static.Calendar('static:broken')
+    release = threading.Event()
+
+    def _slow_poll():
+        release.wait()
+        return slow._updated({'id': 'slow', 'start': 2000, 'end': 3000, 'updated': 1})
+
+    def _broken_poll():
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(slow, 'poll', _slow_poll)
+    monkeypatch.setattr(broken, 'poll', _broken_poll)
+    calendars = {'static:fast': fast, 'static:slow': slow, 'static:broken': broken}
+
+    multical = multicalendar.MultiCalendar(poll_timeout=.1)
+    with monkeypatch.context() as monkey:
+        monkey.setattr('metabot.calendars.loader.get', calendars.get)
+        for calid in calendars:
+            multical.add(calid)
+
+    fast._updated({'id': 'fast', 'start': 4000, 'end': 5000, 'updated': 1})
+    assert multical.poll()
+    assert [event['local_id'].split(':', 1)[0] for event in multical.ordered] == [fast.calcode]
+    assert set(multical.poll_times) == {'static:fast', 'static:broken'}
+    assert set(multical._polling) == {'static:slow'}
+
+    release.set()
+    multical._polling['static:slow'].result()
+    assert multical.poll()
+    assert [event['local_id'].split(':', 1)[0] for event in multical.ordered
+           ] == [slow.calcode, fast.calcode]
+    assert set(multical.poll_times) == set(calendars)
+
+    serial = multicalendar.MultiCalendar(poll_workers=1)
+    with monkeypatch.context() as monkey:
+        monkey.setattr('metabot.calendars.loader.get', calendars.get)
+        for calid in calendars:
+            serial.add(calid)
+    assert not serial.poll()
+    assert len(serial.ordered) == 2
+
+
+def test_removed_while_polling(monkeypatch):
+    """Verify a calendar removed while being polled is skipped, and polls can't block exit."""
+
+    # pylint: disable=protected-access
+
+    slow = static.Calendar('static:slow')
+    release = threading.Event()
+    daemon = []
+
+    def _slow_poll():
+        daemon.append(threading.current_thread().daemon)
+        release.wait()
+        return slow._updated({'id': 'slow', 'start': 2000, 'end': 3000, 'updated': 1})
+
+    monkeypatch.setattr(slow, 'poll', _slow_poll)
+    multical = multicalendar.MultiCalendar(poll_timeout=.1)
+    with monkeypatch.context() as monkey:
+        monkey.setattr('metabot.calendars.loader.get', lambda calid: slow)
+        multical.add('static:slow')
+    assert not multical.poll()
+    assert daemon == [True]
+
+    multical.calendars.pop('static:slow')
+    release.set()
+    multical._polling['static:slow'].result()
+    assert not multical.poll()
+    assert multical._polling == {}
+    assert multical.ordered == []
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_get_overlaps(monkeypatch, use_numpy):  # pylint: disable=too-many-locals
+    """Verify MultiCalendar.get_overlaps agrees with View.get_overlap (with and without NumPy)."""
+
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(multicalendar, 'numpy', None)
+
+    rand = random.Random(1234)
+    calendars = {}
+    for calcode in ('xray', 'yankee', 'zulu'):
+        calendars[calcode] = events = {}
+        for i in range(50):
+            start = rand.randrange(10000)
+            local_id = f'{calcode}:{i}'
+            events[local_id] = {
+                'end': start + rand.choice((0, 10, 100, 5000)),
+                'local_id': local_id,
+                'start': start,
+                'summary': '',
+            }
+    dummycal = collections.namedtuple('_', 'events')
+
+    multical = multicalendar.MultiCalendar()
+    with monkeypatch.context() as monkey:
+        monkey.setattr('metabot.calendars.loader.get', lambda calid: dummycal(calendars[calid]))
+        for calcode in calendars:
+            multical.add(calcode)
+
+    queries = []
+    for _ in range(100):
+        calcodes = rand.sample(sorted(calendars) + ['unknown'], rand.randrange(1, 4))
+        start = rand.randrange(-100, 11000)
+        queries.append((calcodes, start, start + rand.randrange(1000)))
+    results = multical.get_overlaps(queries)
+    assert len(results) == len(queries)
+    for (calcodes, start, end), indexes in zip(queries, results):
+        assert [multical.ordered[i] for i in indexes
+               ] == list(multical.view(calcodes).get_overlap(start, end))
+    assert any(results)
+
+    assert multical.get_overlaps([]) == []
@@ -1,23 +1,35 @@
 """Simple context manager."""
 
+import threading
+
 import ntelebot
 
 from metabot.util import dicttools
 from metabot.util import mandb
+from metabot.util import metrics
 
 F = mandb.Field
 
+# The most scoped Managers each thread keeps between clear_scopes() calls.
+_MAX_SCOPES = 256
+
 
-class Manager:  # pylint: disable=missing-function-docstring
+class Manager:  # pylint: disable=missing-function-docstring,too-many-instance-attributes
     """Simple context manager."""
 
+    _fieldcache = None
+
     def __init__(self, root, *, bot_id=None, bot_username=None, chat_id=None, user_id=None):  # pylint: disable=too-many-arguments
         if isinstance(root, Manager):
             self.__dict__.update(root.__dict__)
+            self.__dict__.pop('_fieldcache', None)
         else:
             assert isinstance(root.conf, dicttools.ImplicitTrackingDict)
             self.multibot = root
             self._bot_instances = {}
+            self._bot_usernames = {}
+            self._scopes = threading.local()
+            self._index_bots()
 
         if bot_id:
             self.bot_id = bot_id
@@ -28,24 +40,57 @@ class Manager:  # pylint: disable=missing-function-docstring
         if user_id:
             self.user_id = user_id
 
+    def _scope(self, **kwargs):
+        """Return the (shared) Manager for self's scope narrowed by kwargs."""
+
+        key = tuple(
+            kwargs.get(attr, getattr(self, attr, None))
+            for attr in ('bot_id', 'chat_id', 'user_id'))
+        # Each thread (like each dispatch worker) keeps its own Managers, so one thread's
+        # clear_scopes() never pulls Managers out from under another.
+        if (scopes := getattr(self._scopes, 'managers', None)) is None:
+            scopes = self._scopes.managers = {}
+        if (mgr := scopes.get(key)) is None:
+            if len(scopes) >= _MAX_SCOPES:  # Like in a long-running periodic job.
+                scopes.clear()
+            scopes[key] = mgr = Manager(self, **kwargs)
+        return mgr
+
+    def clear_scopes(self):
+        """Forget all Managers returned by bot(), chat(), and user() so far in this thread."""
+
+        self._scopes.managers = {}
+
+    def _get_token_id(self, bot_username):
+        if (token := self.multibot.conf.peek('bots', bot_username, 'issue37', 'telegram', 'token')):
+            return int(token.split(':', 1)[0])
+
+    def _index_bots(self):
+        self._bot_usernames.clear()
+        for bot_username in self.multibot.conf.get('bots', ()):
+            self.index_bot(bot_username)
+
+    def index_bot(self, bot_username):
+        """Record bot_username's bot_id (from its token) for _normalize_bot_id."""
+
+        if (bot_id := self._get_token_id(bot_username)):
+            self._bot_usernames[bot_id] = bot_username
+
     def _normalize_bot_id(self, bot_id):
         try:
             bot_id = int(bot_id)
         except ValueError:
             pass
         if isinstance(bot_id, int):
-            if (bot := self._bot_instances.get(bot_id)):
-                bot_username = bot.username
-            else:
-                for bot_username, conf in self.multibot.conf['bots'].items():
-                    if int(conf['issue37']['telegram']['token'].split(':', 1)[0]) == bot_id:
-                        break
-                else:
+            bot_username = self._bot_usernames.get(bot_id)
+            # The config may have been changed directly since the index was built.
+            if not bot_username or self._get_token_id(bot_username) != bot_id:
+                self._index_bots()
+                if not (bot_username := self._bot_usernames.get(bot_id)):
                     raise KeyError(bot_id)
-        elif bot_id in self.multibot.conf['bots']:
+        elif (token_id := self._get_token_id(bot_id)):
             bot_username = bot_id
-            token = self.multibot.conf['bots'][bot_username]['issue37']['telegram']['token']
-            bot_id = int(token.split(':', 1)[0])
+            bot_id = token_id
         else:
             raise KeyError(bot_id)
 
@@ -59,12 +104,12 @@ class Manager:  # pylint: disable=missing-function-docstring
     @property
     def running_bots(self):
         for mgr in self.all_bots:
-            if mgr.bot_running:
+            if mgr.bot_running and self.multibot.owns(mgr.bot_username):
                 yield mgr
 
     def bot(self, bot_id):
         bot_id, bot_username = self._normalize_bot_id(bot_id)
-        return Manager(self, bot_id=bot_id, bot_username=bot_username)
+        return self._scope(bot_id=bot_id, bot_username=bot_username)
 
     @property
     def bot_active_groups(self):
@@ -78,33 +123,69 @@ class Manager:  # pylint: disable=missing-function-docstring
         if (bot := self._bot_instances.get(self.bot_id)):
             return bot
 
-        self._bot_instances[self.bot_id] = bot = ntelebot.bot.Bot(self.bot_token)
+        self._bot_instances[self.bot_id] = bot = _MeteredBot(self.bot_token)
         bot._username = self.bot_username  # pylint: disable=protected-access
-        bot.config = self.multibot.conf['bots'][bot.username]
+        bot.config = self.multibot.conf['bots'][bot.username]  # pylint: disable=attribute-defined-outside-init
         return bot
 
-    bot_admins = F(lambda self: self.bot_conf['admin'], 'admins', list)
-    bot_conf = F(lambda self: self.multibot.conf['bots'][self.bot_username], 'issue37', dict)
-    bot_running = F(lambda self: self.bot_conf['telegram'], 'running', bool)
-    bot_token = F(lambda self: self.bot_conf['telegram'], 'token', str)
+    bot_admins = F(lambda self: self.bot_conf.view('admin'), 'admins', list)
+    bot_conf = F(lambda self: self.multibot.conf.view('bots').view(self.bot_username), 'issue37',
+                 dict)
+    bot_running = F(lambda self: self.bot_conf.view('telegram'), 'running', bool)
+    bot_token = F(lambda self: self.bot_conf.view('telegram'), 'token', str)
 
     def chat(self, chat_id):
-        return Manager(self, chat_id=int(chat_id))
+        return self._scope(chat_id=int(chat_id))
 
     chat_admins = F(lambda self: self.chat_info, 'admins', list)
-    chat_conf = F(lambda self: self.bot_conf['moderator'], lambda self: f'{self.chat_id}', dict)
-    chat_info = F(lambda self: self.multibot.conf['groups'], lambda self: self.chat_id, dict)
+    chat_conf = F(lambda self: self.bot_conf.view('moderator'), lambda self: f'{self.chat_id}',
+                  dict)
+    chat_info = F(lambda self: self.multibot.conf.view('groups'), lambda self: self.chat_id, dict)
     chat_pinned_message_id = F(lambda self: self.chat_info, 'pinned_message_id', int)
     chat_title = F(lambda self: self.chat_info, 'title', str)
     chat_username = F(lambda self: self.chat_info, 'username', str)
 
     def user(self, user_id):
-        return Manager(self, user_id=int(user_id))
+        return self._scope(user_id=int(user_id))
 
-    user_conf = F(lambda self: self.bot_conf['events']['users'], lambda self: f'{self.user_id}',
-                  dict)
-    user_info = F(lambda self: self.multibot.conf['users'], lambda self: self.user_id, dict)
+    user_conf = F(lambda self: self.bot_conf.view('events').view('users'),
+                  lambda self: f'{self.user_id}', dict)
+    user_info = F(lambda self: self.multibot.conf.view('users'), lambda self: self.user_id, dict)
     user_name = F(lambda self: self.user_info, 'name', str)
     user_username = F(lambda self: self.user_info, 'username', str)
-    is_bot_admin = F(lambda self: self.bot_admins, lambda self: self.user_id, bool)
-    is_chat_admin = F(lambda self: self.chat_admins, lambda self: self.user_id, bool)
+    is_bot_admin = F(bot_admins, lambda self: self.user_id, bool)
+    is_chat_admin = F(chat_admins, lambda self: self.user_id, bool)
+
+
+class _MeteredBot(ntelebot.bot.Bot):  # pylint: disable=too-few-public-methods
+    """An ntelebot.bot.Bot that counts (and times) every API call it makes."""
+
+    def __getattr__(self, k):
+        request = super().__getattr__(k)
+        if not isinstance(request, _MeteredRequest):
+            request = _MeteredRequest(self, k.lower().replace('_', ''), request)
+            setattr(self, k, request)
+        return request
+
+
+class _MeteredRequest:  # pylint: disable=too-few-public-methods
+
+    def __init__(self, bot, method, request):
+        self.bot = bot
+        self.method = method
+        self.request = request
+
+    def __call__(self, **params):
+        if not metrics.REGISTRY.enabled:
+            return self.request(**params)
+        labels = {'bot': self.bot.username, 'method': self.method}
+        metrics.increment('api_calls', **labels)
+        try:
+            with metrics.timer('api_seconds', **labels):
+                return self.request(**params)
+        except Exception:
+            metrics.increment('api_errors', **labels)
+            raise
+
+    def __getattr__(self, k):
+        return getattr(self.request, k)
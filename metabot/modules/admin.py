@@ -5,6 +5,7 @@ import uuid
 from metabot.util import adminui
 
 BOOTSTRAP_TOKEN = uuid.uuid4().hex
+COMMANDS = ('_bootstrap', 'admin', 'whoami')
 
 
 def modhelp(*, ctx, sections):  # pylint: disable=missing-docstring
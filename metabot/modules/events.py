@@ -1,5 +1,9 @@
 """Display recent and upcoming events."""
 
+import logging
+import random
+import time
+
 import ntelebot
 import pytz
 
@@ -9,6 +13,44 @@ from metabot.util import html
 from metabot.util import humanize
 
 ALIASES = ('calendar', 'event', 'events')
+COMMANDS = INLINE_PREFIXES = ALIASES
+
+
+def modinit(multibot):  # pylint: disable=missing-docstring
+    # With --shards, the coordinator moves and prunes RSVPs on behalf of all worker processes
+    # (which share the RSVP store).
+    if multibot.shard:
+        return
+
+    def _queue():
+        multibot.loop.queue.puthourly(45 * 60, _prune, jitter=random.random() * 5)
+
+    def _prune():
+        try:
+            multibot.rsvps.prune(time.time(),
+                                 lambda local_id: multibot.multical.get_event(local_id)[1])
+        finally:
+            _queue()
+
+    migrate_rsvps(multibot.conf, multibot.multical, multibot.rsvps)
+    _queue()
+
+
+def migrate_rsvps(conf, multical, rsvps):
+    """Move any RSVPs still stored in the bot config into the RSVP store."""
+
+    # Schema update: Remove after 2027-04-18. RSVPs used to be stored in the bot config, as
+    # bot_conf['events']['rsvp'][local_id][user_id] = {'going': ..., 'note': ...}.
+    for username, botconf in conf['bots'].items():
+        eventsconf = botconf['issue37']['events']
+        for local_id, rsvpconf in eventsconf['rsvp'].items():
+            event = multical.get_event(local_id)[1] or {'local_id': local_id, 'end': 0}
+            for user_id, userrsvpconf in rsvpconf.items():
+                rsvps.update(username, event, user_id, **userrsvpconf)
+        eventsconf.pop('rsvp')
+    if conf.finalize():
+        logging.info('Moved RSVPs from the bot config into the RSVP store.')
+        conf.save()
 
 
 def modhelp(*, sections, **_):  # pylint: disable=missing-docstring
@@ -17,7 +59,7 @@ def modhelp(*, sections, **_):  # pylint: disable=missing-docstring
 
 def moddispatch(*, ctx, msg):  # pylint: disable=missing-docstring
     mgr = ctx.mgr
-    modconf = mgr.bot_conf['events']
+    modconf = mgr.bot_conf.view('events')
 
     if ctx.type in ('message', 'callback_query') and ctx.command in ALIASES:
         if ctx.chat['type'] != 'private':
@@ -93,19 +135,20 @@ def private(ctx, msg, modconf):  # pylint: disable=too-many-branches,too-many-lo
         msg.add('No upcoming events!')
     else:
         eventid = event['local_id']
-        rsvpconf = modconf['rsvp'][eventid][mgr.user_id]
+        rsvps = ctx.multibot.rsvps
+        rsvp = rsvps.get(mgr.bot_username, eventid, mgr.user_id)
 
         if action == 'going':
-            rsvpconf['going'] = '+'
+            rsvp = rsvps.update(mgr.bot_username, event, mgr.user_id, going='+')
         elif action == 'maybe':
-            rsvpconf['going'] = '?'
+            rsvp = rsvps.update(mgr.bot_username, event, mgr.user_id, going='?')
         elif action == 'notgoing':
-            rsvpconf['going'] = None
+            rsvp = rsvps.update(mgr.bot_username, event, mgr.user_id, going=None)
         elif action == 'note':
             if text:
                 if text.lower() in ('-', 'none', 'off'):
                     text = None
-                rsvpconf['note'] = text
+                rsvp = rsvps.update(mgr.bot_username, event, mgr.user_id, note=text)
             else:
                 msg.path('/events', 'Events')
                 msg.path(eventid)
@@ -113,7 +156,7 @@ def private(ctx, msg, modconf):  # pylint: disable=too-many-branches,too-many-lo
                 msg.path('note', 'Note')
 
                 msg.action = 'Type your note'
-                if (note := rsvpconf.get('note')):
+                if (note := rsvp.get('note')):
                     msg.add('Your note is currently <code>%s</code>.', note)
                 msg.add('Type your note, or type "off" to clear your existing note.')
                 return
@@ -122,34 +165,34 @@ def private(ctx, msg, modconf):  # pylint: disable=too-many-branches,too-many-lo
 
         attending = []
         othernotes = []
-        for otheruser, otherrsvpconf in modconf['rsvp'][eventid].items():
+        for otheruser, otherrsvp in rsvps.event(mgr.bot_username, eventid):
             userstr = mgr.user(otheruser).user_name or f'user{otheruser}'
             userstr = f'<a href="tg://user?id={otheruser}">{html.escape(userstr)}</a>'
 
-            if (note := otherrsvpconf.get('note')):
+            if (note := otherrsvp.get('note')):
                 note = html.escape(note).replace('\n', ' ')
                 userstr = f'{userstr} \u2014 {note}'
-            if otherrsvpconf.get('going') == '+':
+            if otherrsvp.get('going') == '+':
                 attending.append(userstr)
             elif note:
                 othernotes.append(userstr)
         if attending:
             msg.add('<b>Attending:</b>\n\u2022 ' + '\n\u2022 '.join(attending))
-        if rsvpconf.get('going') == '?':
+        if rsvp.get('going') == '?':
             msg.add('(I have you down as a maybe \U0001f914.)')
         if othernotes:
             msg.add('<b>Notes:</b>\n\u2022 ' + '\n\u2022 '.join(othernotes))
 
         base = f'/events {eventid} {suffix} '
         buttons = [None, ('Maybe \U0001f914', base + 'maybe'), None]
-        if not (going := rsvpconf.get('going')):
+        if not (going := rsvp.get('going')):
             buttons[0] = ("I'm going \U0001f44d", base + 'going')
         elif going == '?':
             buttons[0] = ('Definitely going \U0001f44d', base + 'going')
             buttons[1] = ('Definitely not \U0001f641', base + 'notgoing')
         else:
             buttons[0] = ("I'm not going \U0001f641", base + 'notgoing')
-        if not rsvpconf.get('note'):
+        if not rsvp.get('note'):
             buttons[2] = ('Add note \U0001f4dd', base + 'note')
         else:
             buttons[2] = ('Edit note \U0001f4dd', base + 'note')
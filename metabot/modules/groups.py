@@ -8,6 +8,7 @@ import re
 import ntelebot
 
 ALIASES = ('channel', 'channels', 'group', 'groups', 'room', 'rooms')
+COMMANDS = INLINE_PREFIXES = ALIASES
 
 
 def modhelp(*, sections, **_):  # pylint: disable=missing-docstring
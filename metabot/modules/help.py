@@ -3,6 +3,7 @@
 import collections
 
 ALIASES = ('command', 'commands', 'help', 'start')
+COMMANDS = ALIASES
 
 
 def moddispatch(*, ctx, msg):  # pylint: disable=missing-docstring
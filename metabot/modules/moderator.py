@@ -1,12 +1,16 @@
 """Simple group/supergroup moderator tools."""
 
-import logging
 import random
 
 import ntelebot
 
 from metabot.util import adminui
 from metabot.util import humanize
+from metabot.util import logutil
+from metabot.util import metrics
+
+COMMANDS = ('mod',)
+UPDATE_TYPES = ('join',)
 
 
 def modinit(multibot):  # pylint: disable=missing-docstring
@@ -16,23 +20,26 @@ def modinit(multibot):  # pylint: disable=missing-docstring
 
     def _hourly():
         try:
-            checked = set()
-            for mgr in multibot.mgr.running_bots:
-                for mgr in mgr.bot_active_groups:
-                    if mgr.chat_id in checked:
-                        continue
-                    try:
-                        data = mgr.bot_api.get_chat_administrators(chat_id=mgr.chat_id)
-                    except ntelebot.errors.Error:
-                        continue
-                    checked.add(mgr.chat_id)
-                    mgr.chat_admins = sorted(member['user']['id'] for member in data)
-            log = multibot.conf.finalize()
-            if log:
-                for path, (value, orig) in sorted(log.items()):
-                    pathstr = '.'.join('%s' % part for part in path)
-                    logging.info('[moderator] %s: %r -> %r', pathstr, orig, value)
-                multibot.conf.save()
+            with metrics.timer('job_seconds', job='moderator._hourly'):
+                # Ask Telegram for every group's admins before taking the lock, so updates being
+                # processed in the meantime don't have to wait for all of these calls.
+                admins = {}
+                for mgr in multibot.mgr.running_bots:
+                    for mgr in mgr.bot_active_groups:
+                        if mgr.chat_id in admins:
+                            continue
+                        try:
+                            data = mgr.bot_api.get_chat_administrators(chat_id=mgr.chat_id)
+                        except ntelebot.errors.Error:
+                            continue
+                        admins[mgr.chat_id] = mgr, sorted(member['user']['id'] for member in data)
+                with multibot.conf.lock:
+                    for mgr, chat_admins in admins.values():
+                        mgr.chat_admins = chat_admins
+                    log = multibot.conf.finalize()
+                    if log:
+                        logutil.log_changes('moderator', log)
+                        multibot.conf.save()
         finally:
             _queue()
 
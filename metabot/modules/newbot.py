@@ -4,6 +4,8 @@ import logging
 
 import ntelebot
 
+COMMANDS = ('newbot',)
+
 
 def modhelp(*, sections, **_):  # pylint: disable=missing-docstring
     sections['commands'].add('/newbot \u2013 Set up a new bot')
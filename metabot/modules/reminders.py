@@ -2,17 +2,19 @@
 
 import collections
 import datetime
+import glob
 import logging
-import operator
 import random
 import re
 import time
 
 import ntelebot
 
+from metabot.calendars import base as calendarbase
 from metabot.util import eventutil
 from metabot.util import html
 from metabot.util import humanize
+from metabot.util import metrics
 from metabot.util import pickleutil
 
 PERIOD = 60 * 10  # Run modinit.periodic every 10 minutes.
@@ -28,7 +30,12 @@ def modinit(multibot):  # pylint: disable=missing-docstring
 
     if multibot.conf.confdir:
         recordsfname = multibot.conf.confdir + '/daily.pickle'
-        records = pickleutil.load(recordsfname) or {}
+        if multibot.shard:
+            # Each shard only announces events for its own bots.
+            recordsfname = '%s/daily.%s.pickle' % (multibot.conf.confdir, multibot.shard.index)
+            records = _load_shard_records(multibot)
+        else:
+            records = pickleutil.load(recordsfname) or {}
 
         for key, record in records.items():
             if len(record) == 3:
@@ -40,14 +47,37 @@ def modinit(multibot):  # pylint: disable=missing-docstring
     def periodic():
         logging.info('Running periodic.')
         try:
-            multibot.multical.poll()
-            _daily_messages(multibot, records)
-            if recordsfname:
-                pickleutil.dump(recordsfname, records)
+            with metrics.timer('job_seconds', job='reminders.periodic'):
+                multibot.multical.poll()
+                _daily_messages(multibot, records)
+                if recordsfname:
+                    pickleutil.dump(recordsfname, records)
         finally:
-            queue()
+            if not multibot.shard:
+                queue()
+
+    if multibot.shard:
+        # The coordinator polls calendars, then tells each worker to run periodic, so
+        # announcements are built from this period's data rather than the last one's.
+        multibot.shard.periodic.append(periodic)
+    else:
+        queue()
+
+
+def _load_shard_records(multibot):
+    """Gather the latest record for each of this shard's chats from every daily*.pickle.
+
+    This picks up daily.pickle (written before sharding was turned on) as well as other shards'
+    files (in case the number of shards changed), so existing announcements keep being edited
+    rather than re-sent.
+    """
 
-    queue()
+    records = {}
+    for fname in sorted(glob.glob(multibot.conf.confdir + '/daily*.pickle')):
+        for key, record in (pickleutil.load(fname) or {}).items():
+            if multibot.owns(key[0]) and (key not in records or record[0] > records[key][0]):
+                records[key] = record
+    return records
 
 
 class AnnouncementConf:  # pylint: disable=too-few-public-methods
@@ -107,7 +137,7 @@ def _daily_messages(multibot, records):  # pylint: disable=too-many-branches,too
     for mgr in multibot.mgr.running_bots:  # pylint: disable=too-many-nested-blocks
         for mgr in mgr.bot_active_groups:
             calconf = eventutil.CalendarConf(mgr.chat_conf)
-            annconf = AnnouncementConf(calconf, mgr.chat_conf['daily'])
+            annconf = AnnouncementConf(calconf, mgr.chat_conf.peek('daily', default={}))
             if not calconf.tzinfo or not isinstance(annconf.hour, int):
                 continue
 
@@ -265,7 +295,7 @@ def diff_events(multibot, tzinfo, base, lastevents, events):  # pylint: disable=
     curmap = {event['local_id']: event for event in events}
     bothevents = events.copy()
     bothevents.extend(event for event in lastevents if event['local_id'] not in curmap)
-    bothevents.sort(key=operator.itemgetter('start', 'end', 'summary', 'local_id'))
+    bothevents.sort(key=calendarbase.sort_key)
     edits = []
     for event in bothevents:
         title = html.escape(event['summary'])
@@ -0,0 +1,99 @@
+"""View how long each module takes to handle updates."""
+
+import json
+import math
+
+from metabot.util import metrics
+
+# Telegram rejects messages longer than 4096 characters, so raw data is split into pages of this
+# many characters (leaving room for the title and markup).
+PAGE_SIZE = 3500
+
+
+def admin(frame):
+    """Handle /admin BOTNAME stats."""
+
+    ctx, msg = frame.ctx, frame.msg
+    if frame.text == 'record':
+        metrics.enable()
+    elif not metrics.REGISTRY.enabled:
+        msg.action = 'Response times'
+        msg.add("Response times aren't being recorded. (Run metabot with --metrics-port to record "
+                'them from startup.)')
+        return msg.button('Start recording', 'record')
+    data = _filter(metrics.dump(), ctx.targetbotuser)
+
+    command, _, page = frame.text.partition(' ')
+    if command == 'json':
+        return _raw(msg, data, page.isdigit() and int(page) or 0)
+
+    msg.action = 'Response times'
+    errors = {
+        _key(counter['labels']): counter['value']
+        for counter in data['counters']
+        if counter['name'] == 'dispatch_errors'
+    }
+    for hist in data['histograms']:
+        labels = hist['labels']
+        if hist['name'] == 'dispatch_seconds':
+            name = '<code>%s</code> %s' % (labels['module'], labels['type'])
+            if labels['stage'] == 'modpredispatch':
+                name += ' (pre)'
+            _describe(msg, name, hist, errors.get(_key(labels)))
+        elif hist['name'] == 'reply_seconds':
+            _describe(msg, 'Replies', hist)
+        elif hist['name'] == 'conf_flush_seconds':
+            _describe(msg, 'Config saves', hist)
+
+    if not data['histograms']:
+        msg.add("Nothing's been recorded yet!")
+    msg.button('Raw data', 'json')
+
+
+def _raw(msg, data, page):
+    text = json.dumps(data, separators=(',', ':'), sort_keys=True)
+    pages = math.ceil(len(text) / PAGE_SIZE)
+    page = min(page, pages - 1)
+    msg.action = 'Raw data'
+    msg.add('<pre>%s</pre>', text[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+    if pages > 1:
+        msg.add('Page %s of %s. (To fetch everything at once, run metabot with --metrics-port.)',
+                page + 1, pages)
+    buttons = [None, None]
+    if page:
+        buttons[0] = ('Prev', 'json %i' % (page - 1))
+    if page < pages - 1:
+        buttons[1] = ('Next', 'json %i' % (page + 1))
+    if buttons[0] or buttons[1]:
+        msg.buttons(buttons)
+
+
+def _filter(data, username):
+    # Drop everything recorded for other bots.
+    for kind in ('counters', 'gauges', 'histograms'):
+        data[kind] = [
+            entry for entry in data[kind] if entry['labels'].get('bot', username) == username
+        ]
+    return data
+
+
+def _key(labels):
+    return labels['stage'], labels['module'], labels['type']
+
+
+def _describe(msg, name, hist, errors=None):
+    counts = hist['counts']
+    text = '%s: %s \xd7 %.1fms avg, p50 %s, p95 %s' % (
+        name, hist['count'], hist['sum'] / hist['count'] * 1000,
+        _format(metrics.quantile(counts, .5)), _format(metrics.quantile(counts, .95)))
+    if errors:
+        text += ', <b>%s errors</b>' % errors
+    msg.add(text)
+
+
+def _format(bound):
+    if bound == float('inf'):
+        return '&gt;%ss' % metrics.BUCKETS[-1]
+    if bound < 1:
+        return '≤%gms' % (bound * 1000)
+    return '≤%gs' % bound
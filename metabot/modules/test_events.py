@@ -508,3 +508,37 @@ def test_help(conversation):  # pylint: disable=redefined-outer-name
 
 /events – Display recent and upcoming events
 """
+
+
+def test_rsvp(conversation):  # pylint: disable=redefined-outer-name
+    """Test RSVPing to an event, and moving RSVPs out of the bot config."""
+
+    conversation.mgr.bot_conf['events']['rsvp']['6fc2c510:bravo'][3000] = {'note': 'Old note'}
+    events.modinit(conversation.multibot)
+    assert 'rsvp' not in conversation.mgr.bot_conf['events']
+
+    assert conversation.message('/events 6fc2c510:bravo UTC going', user_id=2000) == """\
+[send_photo chat_id=2000 photo=https://ssl.gstatic.com/calendar/images/eventillustrations/v1/img_planmyday_2x.jpg]
+(EMPTY MESSAGE)
+
+
+[chat_id=2000 disable_web_page_preview=True parse_mode=HTML]
+[meta image_message_id=12345 image_url='https://ssl.gstatic.com/calendar/images/eventillustrations/v1/img_planmyday_2x.jpg']
+<b>Bravo Summary</b>  👍 1
+<a href="https://t.me/modulestestbot?start=L2V2ZW50cyA2ZmMyYzUxMDpicmF2byBVVEM">📝  ¹ʷ Thu 8ᵗʰ, 12–1ᵃᵐ</a> @ <a href="https://maps.google.com/maps?q=Bravo+Venue%2C+Rest+of+Bravo+Location">Bravo Venue</a>
+
+Bravo Description
+
+<b>Attending:</b>
+• <a href="tg://user?id=2000">User2000</a>
+
+<b>Notes:</b>
+• <a href="tg://user?id=3000">user3000</a> — Old note
+[I'm not going 🙁 | /events 6fc2c510:bravo UTC notgoing] [Maybe 🤔 | /events 6fc2c510:bravo UTC maybe] [Add note 📝 | /events 6fc2c510:bravo UTC note]
+[Prev | /events 6fc2c510:alpha UTC] [My Events | /events] [Next | /events 6fc2c510:charlie UTC]
+"""
+    assert conversation.multibot.rsvps.counts('modulestestbot', '6fc2c510:bravo') == (1, 0, 1)
+
+    conversation.message('/events 6fc2c510:bravo UTC notgoing', user_id=2000)
+    conversation.message('/events 6fc2c510:bravo UTC note off', user_id=3000)
+    assert conversation.multibot.rsvps.counts('modulestestbot', '6fc2c510:bravo') == (0, 0, 0)
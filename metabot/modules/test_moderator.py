@@ -303,3 +303,28 @@ Bot Admin › modulestestbot › moderator › -1001000001000: <b>Choose a field
 [timezone • What time zone should be used in /events? | /admin modulestestbot moderator -1001000001000 timezone]
 [Back | /admin modulestestbot moderator]
 """
+
+
+def test_hourly(build_conversation, monkeypatch):
+    """Verify the hourly job refreshes group admin lists without holding the config lock."""
+
+    jobs = []
+    monkeypatch.setattr('ntelebot.delayqueue.DelayQueue.puthourly',
+                        lambda unused_self, unused_offset, func, jitter=0: jobs.append(func))
+    conv = build_conversation(moderator)
+    conv.mgr.bot_conf['telegram']['running'] = True
+    conv.mgr.bot_conf['moderator']['-1001000001000']['title'] = 'Mod Test'
+    conv.multibot.conf.finalize()
+    hourly = jobs[0]
+
+    held = []
+
+    def _handler(unused_request, unused_context):
+        held.append(conv.multibot.conf.lock._is_owned())  # pylint: disable=protected-access
+        return {'ok': True, 'result': [{'user': {'id': 2000}}, {'user': {'id': 1000}}]}
+
+    conv.bot.get_chat_administrators.respond(json=_handler)
+    hourly()
+    assert held == [False]
+    assert conv.multibot.conf.peek('groups', -1001000001000, 'admins') == [1000, 2000]
+    assert len(jobs) == 2
@@ -0,0 +1,135 @@
+"""Tests for metabot.modules.stats."""
+
+import html
+import itertools
+import json
+
+import pytest
+
+from metabot.modules import help  # pylint: disable=redefined-builtin
+from metabot.modules import stats
+from metabot.util import metrics
+
+
+@pytest.fixture
+def conversation(build_conversation, monkeypatch):  # pylint: disable=missing-docstring
+    metrics.reset()
+    monkeypatch.setattr(metrics.REGISTRY, 'enabled', True)
+    # Every timed block appears to take exactly 2ms.
+    monkeypatch.setattr('time.perf_counter', lambda counter=itertools.count(): next(counter) * .002)
+    return build_conversation(stats)
+
+
+# pylint: disable=line-too-long
+
+
+def test_stats(conversation, monkeypatch):  # pylint: disable=redefined-outer-name
+    """Verify the stats module."""
+
+    assert conversation.message('/admin modulestestbot stats') == """\
+[chat_id=1000 disable_web_page_preview=True parse_mode=HTML]
+Bot Admin › modulestestbot › stats: <b>Response times</b>
+
+Nothing's been recorded yet!
+[Raw data | /admin modulestestbot stats json]
+[Back | /admin modulestestbot]
+"""
+
+    conversation.message('/help')
+
+    def _broken(unused_ctx, unused_msg):
+        raise ValueError
+
+    monkeypatch.setattr(help, 'default', _broken)
+    with pytest.raises(ValueError):
+        conversation.message('/help')
+
+    assert conversation.message('/admin modulestestbot stats') == """\
+[chat_id=1000 disable_web_page_preview=True parse_mode=HTML]
+Bot Admin › modulestestbot › stats: <b>Response times</b>
+
+<code>admin</code> message: 1 × 2.0ms avg, p50 ≤2.5ms, p95 ≤2.5ms
+
+<code>help</code> message: 2 × 2.0ms avg, p50 ≤2.5ms, p95 ≤2.5ms, <b>1 errors</b>
+
+Replies: 2 × 6.0ms avg, p50 ≤10ms, p95 ≤10ms
+[Raw data | /admin modulestestbot stats json]
+[Back | /admin modulestestbot]
+"""
+
+    text = conversation.raw_message('/admin modulestestbot stats json')[0]['text']
+    data = json.loads(html.unescape(text.split('<pre>', 1)[1].rsplit('</pre>', 1)[0]))
+    assert [(counter['name'], counter['labels'].get('method'), counter['value'])
+            for counter in data['counters']] == [
+                ('api_calls', 'sendmessage', 3),
+                ('dispatch_errors', None, 1),
+                ('updates', None, 5),
+            ]
+    assert data['counters'][1] == {
+        'name': 'dispatch_errors',
+        'labels': {
+            'bot': 'modulestestbot',
+            'module': 'help',
+            'stage': 'moddispatch',
+            'type': 'message',
+        },
+        'value': 1,
+    }
+    assert [(hist['name'], hist['count']) for hist in data['histograms']] == [
+        ('api_seconds', 3),
+        ('dispatch_seconds', 2),
+        ('dispatch_seconds', 2),
+        ('reply_seconds', 3),
+    ]
+
+
+def test_json_pages(conversation, monkeypatch):  # pylint: disable=redefined-outer-name
+    """Verify raw data too long for one message is split across pages."""
+
+    conversation.message('/help')
+    # Freeze the data, so viewing each page doesn't change what the next one shows.
+    data = json.dumps(metrics.dump())
+    monkeypatch.setattr(metrics, 'dump', lambda: json.loads(data))
+    monkeypatch.setattr(stats, 'PAGE_SIZE', 200)
+
+    chunks = []
+    while True:
+        reply = conversation.raw_message('/admin modulestestbot stats json %s' % len(chunks))[0]
+        text = reply['text']
+        chunks.append(html.unescape(text.split('<pre>', 1)[1].rsplit('</pre>', 1)[0]))
+        buttons = [button['text'] for button in reply['reply_markup']['inline_keyboard'][0]]
+        if 'Next' not in buttons:
+            break
+    assert len(chunks) > 2
+    assert 'Page %s of %s.' % (len(chunks), len(chunks)) in text
+    assert buttons == ['Prev', '\xa0']
+    assert json.loads(''.join(chunks)) == stats._filter(json.loads(data), 'modulestestbot')  # pylint: disable=protected-access
+
+
+def test_disabled(conversation, monkeypatch):  # pylint: disable=redefined-outer-name
+    """Verify nothing is recorded until recording is turned on."""
+
+    monkeypatch.setattr(metrics.REGISTRY, 'enabled', False)
+    conversation.message('/help')
+    assert conversation.message('/admin modulestestbot stats') == """\
+[chat_id=1000 disable_web_page_preview=True parse_mode=HTML]
+Bot Admin › modulestestbot › stats: <b>Response times</b>
+
+Response times aren't being recorded. (Run metabot with --metrics-port to record them from startup.)
+[Start recording | /admin modulestestbot stats record]
+[Back | /admin modulestestbot]
+"""
+    assert metrics.dump()['histograms'] == []
+
+    assert conversation.message('/admin modulestestbot stats record') == """\
+[chat_id=1000 disable_web_page_preview=True parse_mode=HTML]
+Bot Admin › modulestestbot › stats: <b>Response times</b>
+
+Nothing's been recorded yet!
+[Raw data | /admin modulestestbot stats json]
+[Back | /admin modulestestbot]
+"""
+    assert metrics.REGISTRY.enabled
+    conversation.message('/help')
+    assert [hist['name'] for hist in metrics.dump()['histograms']
+           ] == ['api_seconds', 'dispatch_seconds', 'reply_seconds']
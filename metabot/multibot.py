@@ -1,27 +1,61 @@
 """An ntelebot.loop.Loop that manages multiple bots."""
 
-import logging
+import collections
 
 import ntelebot
 
 from metabot import botconf
 from metabot import manager
 from metabot.calendars import multicalendar
+from metabot.util import asyncloop
 from metabot.util import jsonutil
+from metabot.util import keyedpool
+from metabot.util import logutil
+from metabot.util import metrics
 from metabot.util import msgbuilder
+from metabot.util import rsvpdb
 
 
-class MultiBot:
+class MultiBot:  # pylint: disable=too-many-instance-attributes
     """An ntelebot.loop.Loop that manages multiple bots."""
 
-    def __init__(self, modules, confdir=None):
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 modules,
+                 confdir=None,
+                 *,
+                 save_interval=None,
+                 storage='yaml',
+                 workers=None,
+                 poller='threads',
+                 shard=None):
         self.dispatcher = _MultiBotLoopDispatcher(self)
-        self.loop = ntelebot.loop.Loop()
-        self.conf = botconf.BotConf(confdir)
+        if poller == 'asyncio':
+            # All bots are long-polled from a single event loop thread, so updates need to be
+            # processed by a worker pool.
+            self.loop = asyncloop.AsyncLoop()
+            workers = workers or 8
+        else:
+            self.loop = ntelebot.loop.Loop()
+        # If workers is provided, updates are dispatched by a pool of that many threads, where
+        # updates for different chats are processed concurrently, but updates for the same chat
+        # (and bot) are still processed one at a time, in order.
+        self.pool = workers and keyedpool.KeyedPool(workers) or None
+        # If shard is provided (see metabot.shard), this is one of several processes, which only
+        # polls the bots shard.owns, and leaves saving the config and polling calendars to the
+        # coordinator.
+        self.shard = shard
+        self.conf = botconf.BotConf(confdir,
+                                    save_interval=save_interval,
+                                    storage=storage,
+                                    concurrent=bool(self.pool),
+                                    publish=shard and shard.publish)
         self.conf.finalize()
         self.mgr = manager.Manager(self)
         self.multical = multicalendar.MultiCalendar()
+        self.multical.remote = bool(shard)
         self.calendars = {}
+        self.rsvps = rsvpdb.RSVPStore(confdir and confdir + '/rsvps.sqlite3' or ':memory:')
         if confdir:
             for calendar_info in jsonutil.load(confdir + '/calendars.json') or ():
                 cal = self.multical.add(calendar_info['calid'])
@@ -33,6 +67,7 @@ class MultiBot:
             modinit = getattr(module, 'modinit', None)
             if modinit:
                 modinit(self)
+        self.dispatcher.build_routes()
 
         for mgr in self.mgr.running_bots:
             self.run_bot(mgr.bot_username)
@@ -49,14 +84,21 @@ class MultiBot:
                 },
             },
         }
+        self.mgr.index_bot(username)
         self.conf.save()
         return username
 
+    def owns(self, username):
+        """Return whether this process is responsible for polling the given bot."""
+
+        return not self.shard or self.shard.owns(username)
+
     def run_bot(self, username):
         """Begin polling for updates for the previously configured bot."""
 
         mgr = self.mgr.bot(username)
-        self.loop.add(mgr.bot_api, self.dispatcher)
+        if self.owns(username):
+            self.loop.add(mgr.bot_api, self.pool and self._submit or self.dispatcher)
         mgr.bot_conf['telegram']['running'] = True
         self.conf.save()
 
@@ -64,19 +106,30 @@ class MultiBot:
         """Stop polling for updates for the referenced bot."""
 
         mgr = self.mgr.bot(username)
-        self.loop.remove(mgr.bot_token)
+        if mgr.bot_token in self.loop.active:
+            self.loop.remove(mgr.bot_token)
         mgr.bot_conf['telegram']['running'] = False
         self.conf.save()
 
     def run(self):
         """Begin waiting for and dispatching updates sent to any bot currently running."""
 
-        return self.loop.run()
+        try:
+            return self.loop.run()
+        finally:
+            if self.pool:
+                self.pool.shutdown()
+
+    def _submit(self, bot, update):
+        self.pool.submit(_get_key(bot, update), self.dispatcher, bot, update)
 
     def stop(self):
         """Stop waiting for and dispatching updates sent to any bot currently running."""
 
-        return self.loop.stop()
+        try:
+            return self.loop.stop()
+        finally:
+            self.conf.flush()
 
 
 class _MultiBotLoopDispatcher(ntelebot.dispatch.LoopDispatcher):
@@ -84,9 +137,57 @@ class _MultiBotLoopDispatcher(ntelebot.dispatch.LoopDispatcher):
     def __init__(self, multibot):
         super().__init__()
         self.multibot = multibot
+        self.predispatchers = []
+        self.routes = {}
+        self.catchall = []
+        self.modnames = {}
+
+    def build_routes(self):
+        """Precompute which modules' moddispatch to call for each kind of update.
+
+        A module that declares COMMANDS, UPDATE_TYPES, and/or INLINE_PREFIXES is only called for
+        messages/callback queries with one of those commands, updates of one of those types, and/or
+        inline queries starting with one of those prefixes. A module that declares none (like
+        natlang) is called for every update. Either way, modules are called in their original order.
+        """
+
+        modules = self.multibot.modules.values()
+        self.modnames = {}
+        for modname, module in self.multibot.modules.items():
+            for name in ('modpredispatch', 'moddispatch'):
+                if (func := getattr(module, name, None)):
+                    self.modnames[func] = modname
+        self.predispatchers = [
+            module.modpredispatch for module in modules if hasattr(module, 'modpredispatch')
+        ]
+        catchall = []
+        routes = collections.defaultdict(lambda: list(catchall))
+        for module in modules:
+            if not (moddispatch := getattr(module, 'moddispatch', None)):
+                continue
+            keys = {('command', command) for command in getattr(module, 'COMMANDS', ())}
+            keys.update(('type', _type) for _type in getattr(module, 'UPDATE_TYPES', ()))
+            keys.update(('inline', prefix) for prefix in getattr(module, 'INLINE_PREFIXES', ()))
+            if not keys:
+                catchall.append(moddispatch)
+                keys = routes
+            for key in list(keys):
+                routes[key].append(moddispatch)
+        self.routes = dict(routes)
+        self.catchall = catchall
+
+    def _get_handlers(self, ctx):
+        if ctx.type in ('message', 'callback_query'):
+            key = ('command', ctx.command)
+        elif ctx.type == 'inline_query':
+            key = ('inline', ctx.prefix.lstrip('/'))
+        else:
+            key = ('type', ctx.type)
+        return self.routes.get(key, self.catchall)
 
     def __call__(self, bot, update):  # pylint: disable=too-many-branches,too-many-locals
-        logging.info('%s', _pretty_repr(update))
+        logutil.log_update(update)
+        metrics.increment('updates', bot=bot.username)
 
         ctx = self.preprocessor(bot, update)
         if not ctx:
@@ -96,6 +197,9 @@ class _MultiBotLoopDispatcher(ntelebot.dispatch.LoopDispatcher):
         with multibot.conf.record_mutations(ctx):
             msg = msgbuilder.MessageBuilder()
 
+            # Scoped Managers are shared for the lifetime of an update (and any periodic jobs run
+            # before the next one).
+            multibot.mgr.clear_scopes()
             mgr = multibot.mgr.bot(bot.username)
 
             if ctx.user:
@@ -118,27 +222,43 @@ class _MultiBotLoopDispatcher(ntelebot.dispatch.LoopDispatcher):
 
             ctx.mgr = mgr
 
-            for module in multibot.modules.values():
-                if (modpredispatch := getattr(module, 'modpredispatch', None)):
-                    modpredispatch(ctx=ctx, msg=msg)
+            for modpredispatch in self.predispatchers:
+                self._call('modpredispatch', modpredispatch, ctx, msg)
 
             ret = False
-            for module in multibot.modules.values():
-                if (moddispatch := getattr(module, 'moddispatch', None)):
-                    ret = moddispatch(ctx=ctx, msg=msg)
-                    if ret is not False:
-                        break
+            for moddispatch in self._get_handlers(ctx):
+                ret = self._call('moddispatch', moddispatch, ctx, msg)
+                if ret is not False:
+                    break
 
             if msg:
-                msg.reply(ctx)
+                with metrics.timer('reply_seconds', bot=bot.username):
+                    msg.reply(ctx)
 
             return ret
 
-
-def _pretty_repr(obj):
-    if isinstance(obj, dict):
-        return '{%s}' % ', '.join(
-            '\033[31m%s\033[0m=%s' % (k, _pretty_repr(v)) for k, v in sorted(obj.items()))
-    if isinstance(obj, (list, tuple)):
-        return '[%s]' % ', '.join(map(_pretty_repr, obj))
-    return '\033[32;1m%s\033[0m' % repr(obj)
+    def _call(self, stage, func, ctx, msg):
+        if not metrics.REGISTRY.enabled:
+            return func(ctx=ctx, msg=msg)
+        labels = {
+            'bot': ctx.bot.username,
+            'stage': stage,
+            'module': self.modnames.get(func),
+            'type': ctx.type,
+        }
+        try:
+            with metrics.timer('dispatch_seconds', **labels):
+                return func(ctx=ctx, msg=msg)
+        except Exception:
+            metrics.increment('dispatch_errors', **labels)
+            raise
+
+
+def _get_key(bot, update):
+    """Return (bot username, chat id) for updates tied to a chat, or (username, user id) if not."""
+
+    for value in update.values():
+        if isinstance(value, dict):
+            chat = value.get('chat') or value.get('message', {}).get('chat') or value.get('from')
+            return bot.username, chat and chat.get('id')
+    return bot.username, None
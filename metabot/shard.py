@@ -0,0 +1,214 @@
+"""Run bots across several worker processes, coordinated by the launching process.
+
+Each running bot is polled by exactly one worker, chosen by a stable hash of its username. The
+coordinator owns the config on disk, polls all calendars, and moves/prunes RSVPs. Whenever a
+worker finalizes changes to its copy of the config, it sends them to the coordinator, which saves
+them and forwards them to every worker (including the sender, so all copies end up agreeing on the
+order of conflicting changes). Calendar changes found by the coordinator are forwarded the same
+way, followed by a signal for workers to run their periodic jobs (like daily announcements).
+"""
+
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+import zlib
+
+from metabot import botconf
+from metabot import multibot
+from metabot.calendars import multicalendar
+from metabot.modules import events
+from metabot.modules import reminders
+from metabot.util import jsonutil
+from metabot.util import logutil
+from metabot.util import metrics
+from metabot.util import modutil
+from metabot.util import rsvpdb
+
+
+def shard_of(username, count):
+    """Return which of count shards the given bot belongs to."""
+
+    return zlib.crc32(username.encode('ascii')) % count
+
+
+class Shard:
+    """A worker process's view of its shard (and its connection to the coordinator)."""
+
+    def __init__(self, index, count, conn):
+        self.index = index
+        self.count = count
+        self.conn = conn
+        self.lock = threading.Lock()
+        # Jobs (like reminders' periodic) to run each time the coordinator finishes polling
+        # calendars.
+        self.periodic = []
+
+    def owns(self, username):
+        """Return whether the given bot belongs to this shard."""
+
+        return shard_of(username, self.count) == self.index
+
+    def publish(self, changes):
+        """Send {path: value} config changes to the coordinator."""
+
+        with self.lock:
+            self.conn.send(('conf', changes))
+
+
+def _worker(index, count, conn, package, confdir, kwargs):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    logutil.configure(fmt=logutil.FORMAT.replace('%(threadName)s',
+                                                 '%(processName)s %(threadName)s'),
+                      **kwargs.pop('logconfig'))
+    if (metrics_port := kwargs.pop('metrics_port', 0)):
+        metrics.serve(metrics_port + 1 + index)
+    shard = Shard(index, count, conn)
+    mybot = multibot.MultiBot(modutil.load_modules(package), confdir, shard=shard, **kwargs)
+    threading.Thread(target=_receive, args=(mybot, conn), name='shard', daemon=True).start()
+    mybot.run()
+
+
+def _receive(mybot, conn):
+    # Everything received is applied from the loop's queue, so it doesn't race with updates (or
+    # periodic jobs) in the default, single-threaded mode.
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            message = ('stop',)
+        if message[0] == 'conf':
+            mybot.loop.queue.put(functools.partial(_apply_conf, mybot, message[1]))
+        elif message[0] == 'calendar':
+            mybot.loop.queue.put(functools.partial(mybot.multical.apply, *message[1:]))
+        elif message[0] == 'rsvps':
+            mybot.loop.queue.put(mybot.rsvps.reload)
+        elif message[0] == 'periodic':
+            for job in mybot.shard.periodic:
+                mybot.loop.queue.put(job)
+        else:
+            mybot.loop.queue.put(mybot.stop)
+            return
+
+
+def _apply_conf(mybot, changes):
+    mybot.conf.apply(changes)
+    for path, running in changes.items():
+        if path[0] == 'bots' and path[2:] == ('issue37', 'telegram', 'running'):
+            username = path[1]
+            if running and mybot.owns(username):
+                mybot.run_bot(username)
+            elif not running:
+                mybot.stop_bot(username)
+
+
+class Coordinator:  # pylint: disable=too-many-instance-attributes
+    """Start count worker processes, saving their config changes and feeding them calendar data."""
+
+    def __init__(self, count, confdir, *, save_interval=None, storage='yaml'):
+        self.count = count
+        self.conf = botconf.BotConf(confdir, save_interval=save_interval, storage=storage)
+        self.conf.finalize()
+        self.conf.flush()
+        self.multical = multicalendar.MultiCalendar()
+        for calendar_info in jsonutil.load(confdir + '/calendars.json') or ():
+            self.multical.add(calendar_info['calid'])
+        self.sent = {calid: dict(cal.events) for calid, cal in self.multical.calendars.items()}
+        self.rsvps = rsvpdb.RSVPStore(confdir + '/rsvps.sqlite3')
+        events.migrate_rsvps(self.conf, self.multical, self.rsvps)
+        self.conns = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def run(self, package, confdir, **kwargs):
+        """Start the workers, then relay changes until interrupted."""
+
+        context = multiprocessing.get_context('spawn')
+        kwargs['logconfig'] = dict(logutil.CONFIG)
+        procs = []
+        for index in range(self.count):
+            conn, child = context.Pipe()
+            proc = context.Process(target=_worker,
+                                   args=(index, self.count, child, package, confdir, kwargs),
+                                   name=f'shard{index}')
+            proc.start()
+            procs.append(proc)
+            self.conns.append(conn)
+            threading.Thread(target=self._relay, args=(conn,), daemon=True).start()
+        poller = threading.Thread(target=self._poll_calendars, name='calendars', daemon=True)
+        poller.start()
+        try:
+            for proc in procs:
+                proc.join()
+        finally:
+            self.stopped.set()
+            self._broadcast(('stop',))
+            for proc in procs:
+                proc.join()
+            self.conf.flush()
+
+    def _broadcast(self, message):
+        with self.lock:
+            self._send_all(message)
+
+    def _send_all(self, message):
+        for conn in self.conns:
+            try:
+                conn.send(message)
+            except OSError:  # pragma: no cover
+                pass
+
+    def _relay(self, conn):
+        while True:
+            try:
+                _, changes = conn.recv()
+            except EOFError:
+                return
+            # Apply and forward in one critical section, so every worker receives changes in the
+            # same order the coordinator applied them.
+            with self.lock:
+                self.conf.apply(changes)
+                self.conf.finalize()
+                self.conf.save()
+                self._send_all(('conf', changes))
+
+    def _poll_calendars(self):
+        while not self.stopped.wait((time.time() // reminders.PERIOD + 1) * reminders.PERIOD -
+                                    time.time()):
+            self.multical.poll()
+            for calid, calevents in self.diff_calendars().items():
+                self._broadcast(('calendar', calid, calevents))
+            # Workers apply messages in order, so their periodic jobs see this period's calendars.
+            self._broadcast(('periodic',))
+            if self.rsvps.prune(time.time(), lambda local_id: self.multical.get_event(local_id)[1]):
+                # Workers keep their own in-memory copies of RSVP counts.
+                self._broadcast(('rsvps',))
+
+    def diff_calendars(self):
+        """Return {calid: {local_id: event or None}} for all changes since the last call."""
+
+        diffs = {}
+        for calid, calendar in self.multical.calendars.items():
+            sent = self.sent.setdefault(calid, {})
+            with calendar.lock:
+                current = dict(calendar.events)
+            diff = {
+                local_id: event
+                for local_id, event in current.items()
+                if sent.get(local_id) is not event
+            }
+            diff.update((local_id, None) for local_id in sent.keys() - current.keys())
+            if diff:
+                diffs[calid] = diff
+                self.sent[calid] = current
+        return diffs
+
+
+def run(count, package, confdir, *, save_interval=None, storage='yaml', **kwargs):
+    """Run all bots configured in confdir across count worker processes."""
+
+    coordinator = Coordinator(count, confdir, save_interval=save_interval, storage=storage)
+    if not coordinator.conf['bots']:
+        logging.error('No bots are configured yet; run once without --shards to add one.')
+        return
+    coordinator.run(package, confdir, storage=storage, **kwargs)
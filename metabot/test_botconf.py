@@ -1,5 +1,9 @@
 """Tests for metabot.botconf."""
 
+import threading
+import time
+import types
+
 import pytest
 import yaml
 
@@ -26,3 +30,151 @@ def test_save_load(tmpdir):
             'echo': [2, 4, 6],
         },
     }
+
+
+def test_save_dirty(monkeypatch, tmpdir):
+    """Verify save only rewrites files whose top-level key was mutated."""
+
+    conf = botconf.BotConf(confdir=tmpdir.strpath)
+    conf['alpha']['key'] = 'value'
+    conf['bravo']['key'] = 'value'
+    conf.save()
+    assert sorted(path.basename for path in tmpdir.listdir()) == ['alpha.yaml', 'bravo.yaml']
+
+    dumped = []
+    monkeypatch.setattr('metabot.util.yamlutil.dump', lambda fname, obj: dumped.append(fname))
+
+    conf = botconf.BotConf(confdir=tmpdir.strpath)
+    assert conf.finalize() == {}
+    conf.save()
+    assert dumped == []
+
+    conf['bravo']['key'] = 'new value'
+    assert conf.finalize() == {('bravo', 'key'): ('new value', 'value')}
+    conf.save()
+    assert dumped == [tmpdir.join('bravo.yaml').strpath]
+    dumped.clear()
+
+    conf.save()
+    assert dumped == []
+
+    conf['alpha']['key'] = 'new value'
+    assert conf.finalize() == {('alpha', 'key'): ('new value', 'value')}
+    conf['charlie']['key'] = 'value'  # Not yet finalized.
+    conf.save()
+    assert dumped == [tmpdir.join('alpha.yaml').strpath, tmpdir.join('charlie.yaml').strpath]
+
+
+def test_write_behind(monkeypatch, tmpdir):
+    """Verify save_interval coalesces saves into background writes."""
+
+    dumped = []
+    monkeypatch.setattr('metabot.util.yamlutil.dump', lambda fname, obj: dumped.append(
+        (fname, obj)))
+
+    conf = botconf.BotConf(confdir=tmpdir.strpath, save_interval=60)
+    conf['alpha']['key'] = 'value'
+    conf.finalize()
+    conf.save()
+    conf['alpha']['key'] = 'new value'
+    conf['bravo']['key'] = 'value'
+    conf.finalize()
+    conf.save()
+    conf.flush()
+    assert dumped == [
+        (tmpdir.join('alpha.yaml').strpath, {
+            'key': 'new value'
+        }),
+        (tmpdir.join('bravo.yaml').strpath, {
+            'key': 'value'
+        }),
+    ]
+    dumped.clear()
+
+    # Changes made after a flush has started don't leak into the data it is writing.
+    conf['alpha']['key'] = 'newer value'
+    conf.finalize()
+    conf.flush()
+    conf['alpha']['key'] = 'newest value'
+    assert dumped == [(tmpdir.join('alpha.yaml').strpath, {'key': 'newer value'})]
+    dumped.clear()
+
+    conf = botconf.BotConf(confdir=tmpdir.strpath, save_interval=.01)
+    conf['charlie']['key'] = 'value'
+    conf.finalize()
+    conf.save()
+    for _ in range(500):
+        if dumped:
+            break
+        time.sleep(.01)
+    assert dumped == [(tmpdir.join('charlie.yaml').strpath, {'key': 'value'})]
+
+
+def test_atomic_dump(tmpdir):
+    """Verify yamlutil.dump doesn't leave a temp file behind."""
+
+    conf = botconf.BotConf(confdir=tmpdir.strpath)
+    conf['alpha']['key'] = 'value'
+    conf.save()
+    assert [path.basename for path in tmpdir.listdir()] == ['alpha.yaml']
+
+
+def test_sqlite(tmpdir):
+    """Verify BotConf can store its data in SQLite, importing existing YAML files."""
+
+    conf = botconf.BotConf(confdir=tmpdir.strpath)
+    conf['alpha']['bravo'] = {'charlie': 'delta'}
+    conf['echo']['foxtrot'] = [1, 2]
+    conf.save()
+
+    conf = botconf.BotConf(confdir=tmpdir.strpath, storage='sqlite')
+    conf.finalize()
+    assert conf == {'alpha': {'bravo': {'charlie': 'delta'}}, 'echo': {'foxtrot': [1, 2]}}
+    conf.save()
+
+    tmpdir.join('alpha.yaml').remove()
+    conf = botconf.BotConf(confdir=tmpdir.strpath, storage='sqlite')
+    conf.finalize()
+    assert not conf['alpha'].loaded
+    assert conf == {'alpha': {'bravo': {'charlie': 'delta'}}, 'echo': {'foxtrot': [1, 2]}}
+
+    conf['alpha']['bravo'] = 'golf'
+    conf['echo']['foxtrot'].append(3)
+    conf['hotel'][1000] = 'india'
+    conf.finalize()
+    conf['echo'].pop('foxtrot')  # Not yet finalized.
+    conf.save()
+
+    conf = botconf.BotConf(confdir=tmpdir.strpath, storage='sqlite')
+    conf.finalize()
+    assert conf == {'alpha': {'bravo': 'golf'}, 'hotel': {1000: 'india'}}
+
+
+def test_concurrent_trim():
+    """Verify dicts aren't trimmed while another thread might be about to write into them."""
+
+    conf = botconf.BotConf(concurrent=True)
+    ctx = types.SimpleNamespace(mgr=types.SimpleNamespace())
+    entered = threading.Event()
+    release = threading.Event()
+
+    def _other():
+        with conf.record_mutations(ctx):
+            user = conf['users'][1000]
+            entered.set()
+            release.wait()
+            user['name'] = 'Other'
+
+    with conf.record_mutations(ctx):
+        assert conf['users'][1000] == {}
+        thread = threading.Thread(target=_other)
+        thread.start()
+        entered.wait()
+    assert conf.peek('users', 1000) == {}
+    release.set()
+    thread.join()
+    assert conf.peek('users', 1000) == {'name': 'Other'}
+
+    with conf.record_mutations(ctx):
+        assert conf['empty'] == {}
+    assert 'empty' not in conf
@@ -0,0 +1,29 @@
+"""Tests for metabot.__main__."""
+
+import logging
+
+import pytest
+
+from metabot import __main__
+
+
+def test_log_update():
+    """Verify --log-update specs are parsed, and bad ones are rejected by argparse."""
+
+    parser = __main__._build_parser()  # pylint: disable=protected-access
+    args = parser.parse_args(['--log-update', 'message=debug', '--log-update', 'inline_query=off'])
+    assert dict(args.log_update) == {'message': logging.DEBUG, 'inline_query': None}
+
+    for spec in ('message', 'message=loud', '=info'):
+        with pytest.raises(SystemExit):
+            parser.parse_args(['--log-update', spec])
+
+
+def test_poller():
+    """Verify --poller only accepts the supported pollers."""
+
+    parser = __main__._build_parser()  # pylint: disable=protected-access
+    assert parser.parse_args([]).poller == 'threads'
+    assert parser.parse_args(['--poller', 'asyncio']).poller == 'asyncio'
+    with pytest.raises(SystemExit):
+        parser.parse_args(['--runtime', 'asyncio'])
@@ -1,8 +1,11 @@
 """Tests for metabot.manager."""
 
+import threading
+
 import ntelebot
 import pytest
 
+from metabot import manager
 from metabot import multibot
 
 
@@ -97,17 +100,12 @@ def test_cross_context():  # pylint: disable=too-many-statements
         'bots': {
             'managertestbot': {
                 'issue37': {
-                    'events': {
-                        'users': {},
-                    },
-                    'moderator': {},
                     'telegram': {
                         'token': '1111111111:BBBBBBBBBB',
                     },
                 },
             },
         },
-        'groups': {},
     }
 
     mgr = mgr.user(1000)
@@ -126,19 +124,12 @@ def test_cross_context():  # pylint: disable=too-many-statements
         'bots': {
             'managertestbot': {
                 'issue37': {
-                    'events': {
-                        'users': {
-                            '1000': {},
-                        },
-                    },
-                    'moderator': {},
                     'telegram': {
                         'token': '1111111111:BBBBBBBBBB',
                     },
                 },
             },
         },
-        'groups': {},
     }
 
     mgr = mgr.chat(90000000000)
@@ -153,25 +144,12 @@ def test_cross_context():  # pylint: disable=too-many-statements
         'bots': {
             'managertestbot': {
                 'issue37': {
-                    'events': {
-                        'users': {
-                            '1000': {},
-                        },
-                    },
-                    'moderator': {
-                        '90000000000': {},
-                    },
                     'telegram': {
                         'token': '1111111111:BBBBBBBBBB',
                     },
                 },
             },
         },
-        'groups': {
-            90000000000: {
-                'admins': [],
-            },
-        },
     }
 
     mgr.is_chat_admin = True
@@ -179,14 +157,6 @@ def test_cross_context():  # pylint: disable=too-many-statements
         'bots': {
             'managertestbot': {
                 'issue37': {
-                    'events': {
-                        'users': {
-                            '1000': {},
-                        },
-                    },
-                    'moderator': {
-                        '90000000000': {},
-                    },
                     'telegram': {
                         'token': '1111111111:BBBBBBBBBB',
                     },
@@ -204,3 +174,72 @@ def test_cross_context():  # pylint: disable=too-many-statements
         mgr.chat_pinned_message_id = 'test'
     mgr.chat_pinned_message_id = 5
     mgr.chat_pinned_message_id = None
+
+
+def test_bot_index():
+    """Verify bots can be found by id, even after their config is changed directly."""
+
+    mybot = multibot.MultiBot(())
+    mybot.conf['bots']['alphabot']['issue37']['telegram']['token'] = '1000:AAAA'
+    assert mybot.mgr._bot_usernames == {}  # pylint: disable=protected-access
+    assert mybot.mgr.bot(1000).bot_username == 'alphabot'  # An unknown id triggers a reindex.
+    assert mybot.mgr.bot('alphabot').bot_id == 1000
+    assert mybot.mgr._bot_usernames == {1000: 'alphabot'}  # pylint: disable=protected-access
+
+    mybot.conf['bots']['alphabot']['issue37']['telegram']['token'] = '2000:BBBB'
+    assert mybot.mgr.bot(2000).bot_username == 'alphabot'
+    with pytest.raises(KeyError):
+        mybot.mgr.bot(1000)
+    assert mybot.mgr._bot_usernames == {2000: 'alphabot'}  # pylint: disable=protected-access
+
+    mybot.conf['bots'].pop('alphabot')
+    with pytest.raises(KeyError):
+        mybot.mgr.bot(2000)
+    with pytest.raises(KeyError):
+        mybot.mgr.bot('alphabot')
+
+
+def test_scopes(monkeypatch):
+    """Verify scoped Managers are shared, and Field values are cached until the config changes."""
+
+    mybot = multibot.MultiBot(())
+    mybot.conf['bots']['alphabot']['issue37']['telegram']['token'] = '1000:AAAA'
+    mgr = mybot.mgr.bot('alphabot')
+    assert mybot.mgr.bot(1000) is mgr
+    assert mgr.chat(-1001).user(1000) is mgr.user(1000).chat('-1001')
+    assert mgr.chat(-1001) is not mgr.chat(-1002)
+
+    chat = mgr.chat(-1001)
+    assert chat.chat_pinned_message_id is None
+    chat_conf = chat.chat_conf
+    assert chat.chat_conf is chat_conf
+    assert chat_conf == {}
+    chat.chat_conf['key'] = 'value'
+    assert chat.chat_conf == {'key': 'value'}
+    mybot.conf['groups'][-1001]['pinned_message_id'] = 5
+    assert chat.chat_pinned_message_id == 5
+    mybot.conf['groups'][-1001]['admins'] = [1000]
+    assert chat.user(1000).is_chat_admin
+    mybot.conf['groups'][-1001]['admins'].remove(1000)
+    assert not chat.user(1000).is_chat_admin
+    mybot.conf['groups'][-1001].pop('pinned_message_id')
+    assert chat.chat_pinned_message_id is None
+
+    mybot.mgr.clear_scopes()
+    assert mybot.mgr.bot('alphabot') is not mgr
+    assert mybot.mgr.bot('alphabot').chat(-1001).chat_conf == {'key': 'value'}
+
+    # Each thread has its own scoped Managers.
+    mgr = mybot.mgr.bot('alphabot')
+    other = []
+    thread = threading.Thread(target=lambda: other.append(mybot.mgr.bot('alphabot')))
+    thread.start()
+    thread.join()
+    assert other[0] is not mgr
+    assert mybot.mgr.bot('alphabot') is mgr
+
+    # And never keep more than _MAX_SCOPES of them.
+    monkeypatch.setattr(manager, '_MAX_SCOPES', 3)
+    for chat_id in range(-1001, -1010, -1):
+        mgr.chat(chat_id)
+    assert len(mybot.mgr._scopes.managers) <= 3  # pylint: disable=protected-access
@@ -91,3 +91,60 @@ def test_module():
     mybot.run()
     event.wait()
     assert results == ['test']
+
+
+def test_routes():
+    """Verify modules are only called for the commands, etc., they declare."""
+
+    def _mod(name, **kwargs):
+        return type(name, (), dict(kwargs, moddispatch=staticmethod(lambda **_: False)))
+
+    first = _mod('first')
+    commands = _mod('commands', COMMANDS=('a', 'b'), UPDATE_TYPES=('join',))
+    catchall = _mod('catchall')
+    inline = _mod('inline', COMMANDS=('b',), INLINE_PREFIXES=('b',))
+    mybot = multibot.MultiBot([first, commands, catchall, inline])
+    dispatcher = mybot.dispatcher
+    assert dispatcher.routes == {
+        ('command', 'a'): [first.moddispatch, commands.moddispatch, catchall.moddispatch],
+        ('command', 'b'): [
+            first.moddispatch, commands.moddispatch, catchall.moddispatch, inline.moddispatch
+        ],
+        ('type', 'join'): [first.moddispatch, commands.moddispatch, catchall.moddispatch],
+        ('inline', 'b'): [first.moddispatch, catchall.moddispatch, inline.moddispatch],
+    }
+    assert dispatcher.catchall == [first.moddispatch, catchall.moddispatch]
+
+
+def test_workers():
+    """Verify updates for the same chat are processed in order when using a worker pool."""
+
+    results = []
+
+    class _DummyMod:  # pylint: disable=too-few-public-methods
+
+        @staticmethod
+        def moddispatch(*, ctx, msg):  # pylint: disable=missing-docstring
+            del msg
+            results.append((ctx.chat['id'], ctx.text))
+            ctx.mgr.chat_conf['last'] = ctx.text
+
+    mybot = multibot.MultiBot({_DummyMod}, workers=4)
+    mockbot = ntelebot.bot.Bot('1234:modbot')
+    mockbot.getme.respond(json={'ok': True, 'result': {'id': 1234, 'username': 'modbot'}})
+    mybot.add_bot('1234:modbot')
+    mybot.conf.finalize()
+    user = {'id': 1000}
+    for i in range(20):
+        chat = {'id': -1000 - i % 2, 'type': 'supergroup'}
+        message = {'message_id': i, 'chat': chat, 'from': user, 'text': f'/dummymod {i}'}
+        mybot._submit(mockbot, {'message': message, 'update_id': i})  # pylint: disable=protected-access
+    mybot.pool.shutdown()
+
+    for chat_id in (-1000, -1001):
+        texts = [text for chat, text in results if chat == chat_id]
+        assert texts == sorted(texts, key=int)
+        assert len(texts) == 10
+    assert mybot.conf['bots']['modbot']['issue37']['moderator']['-1000']['last'] == '18'
+    assert mybot.conf['bots']['modbot']['issue37']['moderator']['-1001']['last'] == '19'
+    assert mybot.conf.finalize() == {}  # Each worker finalized its own changes.
@@ -0,0 +1,157 @@
+"""Tests for metabot.shard."""
+
+import multiprocessing
+
+from metabot import multibot
+from metabot import shard
+from metabot.calendars import static
+from metabot.modules import reminders
+from metabot.util import pickleutil
+
+
+def test_shard_of():
+    """Verify bots are assigned to shards by a stable hash of their username."""
+
+    assert shard.shard_of('alphabot', 4) == 1
+    assert shard.shard_of('bravobot', 4) == 3
+    assert shard.Shard(1, 4, None).owns('alphabot')
+    assert not shard.Shard(1, 4, None).owns('bravobot')
+
+
+def test_worker(monkeypatch):
+    """Verify a worker publishes its own changes, and applies the coordinator's."""
+
+    conn, child = multiprocessing.Pipe()
+    mybot = multibot.MultiBot((), shard=shard.Shard(1, 4, child))
+    assert mybot.multical.remote
+    added = []
+    monkeypatch.setattr(mybot.loop, 'add', lambda bot, dispatcher: added.append(bot.token))
+
+    mybot.conf['users'][1000]['name'] = 'Alpha'
+    mybot.conf.finalize()
+    assert conn.recv() == ('conf', {('users', 1000, 'name'): 'Alpha'})
+
+    changes = {('users', 2000, 'name'): 'Bravo'}
+    for username, bot_id in (('alphabot', 1000), ('bravobot', 2000)):
+        changes['bots', username, 'issue37', 'telegram', 'token'] = f'{bot_id}:token'
+        changes['bots', username, 'issue37', 'telegram', 'running'] = True
+    shard._apply_conf(mybot, changes)  # pylint: disable=protected-access
+    assert mybot.conf['users'][2000]['name'] == 'Bravo'
+    assert added == ['1000:token']  # Only alphabot belongs to shard 1.
+    assert [mgr.bot_username for mgr in mybot.mgr.running_bots] == ['alphabot']
+    assert mybot.conf.finalize() == {}
+    assert not conn.poll()
+
+
+def test_diff_calendars(monkeypatch, tmpdir):
+    """Verify the coordinator sends only calendar changes made since the last diff."""
+
+    # pylint: disable=protected-access
+
+    cal = static.Calendar('static:shard')
+    cal._updated({'id': 'alpha', 'start': 2000, 'end': 3000, 'updated': 1})
+    alpha = cal.events[next(iter(cal.changes))]
+    monkeypatch.setattr('metabot.calendars.loader.get', lambda calid: cal)
+    coordinator = shard.Coordinator(2, tmpdir.strpath)
+    coordinator.multical.add('static:shard')
+    assert coordinator.diff_calendars() == {'static:shard': {alpha['local_id']: alpha}}
+    assert coordinator.diff_calendars() == {}
+
+    cal._updated({'id': 'bravo', 'start': 5000, 'end': 6000, 'updated': 1})
+    bravo = cal.events[next(iter(cal.changes))]
+    cal._removed('alpha')
+    assert coordinator.diff_calendars() == {
+        'static:shard': {
+            alpha['local_id']: None,
+            bravo['local_id']: bravo,
+        },
+    }
+
+
+def test_relay(tmpdir):
+    """Verify the coordinator forwards each worker's changes while still holding its lock."""
+
+    coordinator = shard.Coordinator(2, tmpdir.strpath)
+    sent = []
+
+    class _Conn:
+
+        def __init__(self, *messages):
+            self.messages = list(messages)
+
+        def recv(self):  # pylint: disable=missing-function-docstring
+            if not self.messages:
+                raise EOFError
+            return self.messages.pop(0)
+
+        def send(self, message):  # pylint: disable=missing-function-docstring
+            sent.append((message, coordinator.lock.locked()))
+
+    coordinator.conns = [_Conn(), _Conn()]
+    coordinator._relay(_Conn(('conf', {('users', 1000, 'name'): 'Alpha'})))  # pylint: disable=protected-access
+    assert coordinator.conf['users'][1000]['name'] == 'Alpha'
+    assert sent == [(('conf', {('users', 1000, 'name'): 'Alpha'}), True)] * 2
+
+
+def test_periodic(monkeypatch, tmpdir):
+    """Verify workers run periodic jobs only after applying the coordinator's calendar changes."""
+
+    # pylint: disable=protected-access
+
+    cal = static.Calendar('static:shard')
+    cal._updated({'id': 'alpha', 'start': 2000, 'end': 3000, 'updated': 1})
+    alpha = cal.events[next(iter(cal.changes))]
+    monkeypatch.setattr('metabot.calendars.loader.get', lambda calid: cal)
+    coordinator = shard.Coordinator(2, tmpdir.strpath)
+    coordinator.multical.add('static:shard')
+    sent = []
+    monkeypatch.setattr(coordinator, '_broadcast', sent.append)
+    monkeypatch.setattr(coordinator.stopped, 'wait', lambda timeout: bool(sent))
+    coordinator._poll_calendars()
+    assert sent == [('calendar', 'static:shard', {alpha['local_id']: alpha}), ('periodic',)]
+
+    conn, child = multiprocessing.Pipe()
+    mybot = multibot.MultiBot((), shard=shard.Shard(1, 4, child))
+    seen = []
+    mybot.shard.periodic.append(lambda: seen.append(list(mybot.multical.ordered)))
+    for message in sent:
+        conn.send(message)
+    conn.close()
+    shard._receive(mybot, child)
+    while (job := mybot.loop.queue.get()) != mybot.stop:  # pylint: disable=comparison-with-callable
+        job()
+    assert seen == [[alpha]]
+
+
+def test_daily_records(monkeypatch, tmpdir):
+    """Verify each shard picks up its own bots' announcement records from any daily*.pickle."""
+
+    confdir = tmpdir.strpath
+    pickleutil.dump(
+        confdir + '/daily.pickle', {
+            ('alphabot', '-1001'): (1000, [], {}, 'old', ''),
+            ('bravobot', '-1002'): (1000, [], {}, 'bravo', ''),
+        })
+    pickleutil.dump(confdir + '/daily.3.pickle', {
+        ('alphabot', '-1001'): (2000, [], {}, 'new', ''),
+    })
+    pickleutil.dump(confdir + '/daily.0.pickle', {
+        ('alphabot', '-1003'): (1500, [], {}, 'other', ''),
+    })
+
+    seen = []
+    monkeypatch.setattr(reminders, '_daily_messages',
+                        lambda unused_multibot, records: seen.append(dict(records)))
+    mybot = multibot.MultiBot((reminders,),
+                              confdir,
+                              shard=shard.Shard(1, 4,
+                                                multiprocessing.Pipe()[1]))
+    assert not mybot.loop.queue.qsize()
+    assert len(mybot.shard.periodic) == 1
+    mybot.shard.periodic[0]()
+    records = {
+        ('alphabot', '-1001'): (2000, [], {}, 'new', ''),
+        ('alphabot', '-1003'): (1500, [], {}, 'other', ''),
+    }
+    assert seen == [records]
+    assert pickleutil.load(confdir + '/daily.1.pickle') == records
@@ -0,0 +1,213 @@
+"""A replacement for ntelebot.loop.Loop that long-polls every bot from one asyncio event loop."""
+
+import asyncio
+import json
+import logging
+import random
+import urllib.parse
+
+import ntelebot
+
+from metabot.util import metrics
+
+
+class AsyncLoop:
+    """A replacement for ntelebot.loop.Loop that long-polls every bot from one asyncio event loop.
+
+    Only polling is asynchronous: every bot is long-polled by a coroutine on a single event loop
+    thread, so polling hundreds of bots doesn't take a thread per bot. Everything else stays
+    threaded. Jobs in queue (which has the same interface as Loop.queue) are run one at a time in a
+    worker thread, so they keep using blocking calls. The dispatcher passed to add() is called on
+    the event loop thread, so it needs to hand updates off to something else (like a KeyedPool)
+    rather than processing them.
+    """
+
+    stopped = False
+
+    def __init__(self):
+        self.queue = ntelebot.delayqueue.DelayQueue()
+        self.active = set()
+        self._aloop = None
+        self._pending = []
+        self._tasks = set()
+
+    def add(self, bot, dispatcher):
+        """Begin polling bot for updates to be fed into dispatcher."""
+
+        if bot.token not in self.active:
+            self.active.add(bot.token)
+            if self._aloop:
+                self._aloop.call_soon_threadsafe(self._start, bot, dispatcher)
+            else:
+                self._pending.append((bot, dispatcher))
+
+    def remove(self, token):
+        """Stop polling for updates for the given API Token."""
+
+        self.active.remove(token)
+
+    def _start(self, bot, dispatcher):
+        task = self._aloop.create_task(self._poll_bot(bot, dispatcher))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _poll_bot(self, bot, dispatcher):
+        conn = Connection(bot.url)
+        try:
+            await self._poll_with(conn, bot, dispatcher)
+        finally:
+            conn.close()
+
+    async def _poll_with(self, conn, bot, dispatcher):
+        backoff = 0
+        offset = None
+        while not self.stopped and bot.token in self.active:
+            if backoff:
+                logging.debug('Backing off for %r seconds.', backoff)
+                await asyncio.sleep(backoff)
+            backoff = max(min(backoff * 2, 30), 1) * (random.random() + .5)
+            timeout = max(0, bot.timeout - 2)
+            labels = {'bot': bot.username, 'method': 'getupdates'}
+            metrics.increment('api_calls', **labels)
+            try:
+                params = {'offset': offset, 'timeout': timeout}
+                data = await conn.post('getupdates', params, timeout=bot.timeout)
+            except (OSError, EOFError, asyncio.TimeoutError, ValueError, HTTPError) as e:
+                metrics.increment('api_errors', **labels)
+                logging.info('Transport error while polling: %r', e)
+                continue
+            if not data.get('ok'):
+                metrics.increment('api_errors', **labels)
+                logging.error('Error while polling: %s', data.get('description'))
+                backoff = max(backoff, data.get('parameters', {}).get('retry_after', 0))
+                continue
+            backoff = 0
+            updates = data['result']
+            if not self.stopped and updates and bot.token in self.active:
+                offset = updates[-1]['update_id'] + 1
+                for update in updates:
+                    try:
+                        dispatcher(bot, update)
+                    except Exception:  # pylint: disable=broad-except
+                        logging.exception('Ignoring uncaught error while dispatching:')
+
+    def run(self):
+        """Poll all bots and run queued jobs until stop() is called."""
+
+        asyncio.run(self._run())
+
+    async def _run(self):
+        self._aloop = asyncio.get_running_loop()
+        for bot, dispatcher in self._pending:
+            self._start(bot, dispatcher)
+        self._pending = []
+        try:
+            while not self.stopped:
+                callback = await self._aloop.run_in_executor(None, self.queue.get)
+                if callback:
+                    try:
+                        await self._aloop.run_in_executor(None, callback)
+                    except Exception:  # pylint: disable=broad-except
+                        logging.exception('Ignoring uncaught error while running a job:')
+                self.queue.task_done()
+        finally:
+            self._aloop = None
+
+    def stop(self):
+        """Stop polling for updates and running queued jobs."""
+
+        if not self.stopped:
+            self.stopped = True
+            self.queue.put(None)
+
+
+class HTTPError(Exception):
+    """The server responded with an error status (and no usable JSON body)."""
+
+
+class Connection:
+    """A persistent HTTP/1.1 connection for POSTing JSON to URLs under base_url.
+
+    The connection is opened on first use, and reopened whenever the server closes it (or a
+    request fails partway through).
+    """
+
+    def __init__(self, base_url):
+        parts = urllib.parse.urlsplit(base_url)
+        self.secure = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (self.secure and 443 or 80)
+        self.netloc = parts.netloc
+        self.path = parts.path
+        self._streams = None
+
+    def close(self):
+        """Close the underlying connection (if it's open)."""
+
+        if self._streams:
+            self._streams[1].close()
+            self._streams = None
+
+    async def post(self, method, params, *, timeout):
+        """POST params (as JSON) to base_url + method, and return the parsed JSON response."""
+
+        body = json.dumps({k: v for k, v in params.items() if v is not None}).encode('ascii')
+        request = (f'POST {self.path}{method} HTTP/1.1\r\n'
+                   f'Host: {self.netloc}\r\n'
+                   'Content-Type: application/json\r\n'
+                   f'Content-Length: {len(body)}\r\n'
+                   '\r\n').encode('ascii') + body
+        # A reused connection may have been closed by the server while idle, in which case try
+        # once more with a fresh one.
+        for reused in (bool(self._streams), False):
+            try:
+                status, reason, data = await asyncio.wait_for(self._roundtrip(request), timeout)
+                break
+            except (OSError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused:
+                    raise
+            except BaseException:
+                # The response may be half-read, so the connection can't be reused.
+                self.close()
+                raise
+
+        try:
+            ret = json.loads(data)
+        except ValueError:
+            ret = None
+        # Telegram reports most errors (like 409 Conflict or 429 Too Many Requests) as JSON with
+        # ok=False, which the caller handles; anything else is a transport-level error.
+        if not isinstance(ret, dict) or (status != '200' and 'ok' not in ret):
+            raise HTTPError(f'{status} {reason.strip()}')
+        return ret
+
+    async def _roundtrip(self, request):
+        if not self._streams:
+            self._streams = await asyncio.open_connection(self.host,
+                                                          self.port,
+                                                          ssl=self.secure or None)
+        reader, writer = self._streams
+        writer.write(request)
+        await writer.drain()
+
+        version, status, reason = (await reader.readuntil(b'\r\n')).decode('latin-1').split(' ', 2)
+        headers = {}
+        while (line := await reader.readuntil(b'\r\n')) != b'\r\n':
+            k, _, v = line.decode('latin-1').partition(':')
+            headers[k.strip().lower()] = v.strip()
+        if 'content-length' in headers:
+            data = await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = b''
+            while (size := int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)):
+                data += await reader.readexactly(size)
+                await reader.readexactly(2)
+            await reader.readuntil(b'\r\n')
+        else:
+            data = await reader.read()
+            self.close()
+        if version == 'HTTP/1.0' or headers.get('connection', '').lower() == 'close':
+            self.close()
+
+        return status, reason, data
@@ -1,15 +1,38 @@
 """A mutation-logging, key-implying dict (with accompanying list)."""
 
+import itertools
+import threading
+
+_ATTACH_LOCK = threading.RLock()
+# next() on an itertools.count is atomic, so concurrent changes each get a distinct generation
+# without taking a lock.
+_GENERATIONS = itertools.count(1)
+
+
+def _changed():
+    # Called after (never before) each change, so nothing computed from the old value can be
+    # memoized under the new generation.
+    ImplicitTrackingDict.generation = next(_GENERATIONS)
+
 
 class ImplicitTrackingDict(dict):
     """A mutation-logging, key-implying dict."""
 
-    def __init__(self, value=None, log=None, path=(), **kwargs):
+    # Bumped by every change to any ImplicitTrackingDict or TrackingList, so anything derived from
+    # one can be cached until this changes.
+    generation = 0
+
+    def __init__(self, value=None, log=None, path=(), maybe_empty=None, **kwargs):  # pylint: disable=too-many-arguments
         super().__init__(**kwargs)
         if log is not None:
             self.log = log
         else:
             self.log = {}
+        # The paths of all dicts (in the whole tree) created or shrunk since the last finalize().
+        if maybe_empty is not None:
+            self.maybe_empty = maybe_empty
+        else:
+            self.maybe_empty = set()
         self.path = path
         if value is not None:
             self.update(value)
@@ -18,16 +41,40 @@ class ImplicitTrackingDict(dict):
         """Trim empty hanging dicts, clear the audit log, and return a copy of the log."""
 
         self._trim()
-        log = dict(self.log)
+        log = {}
+        for path, (value, orig) in self.log.items():
+            # TrackingLists log themselves, and are only converted to tuples here.
+            if isinstance(value, TrackingList):
+                value = tuple(value)
+                if value == orig:
+                    continue
+            log[path] = (value, orig)
         self.log.clear()
         return log
 
     def _trim(self):
-        for key, value in list(self.items()):
-            if isinstance(value, ImplicitTrackingDict):
-                value._trim()  # pylint: disable=protected-access
-                if not value:
-                    self.pop(key)
+        """Remove empty dicts (and any dicts left empty by that) below self.
+
+        Only dicts that were created or had a key removed since the last finalize() are checked.
+        """
+
+        depth = len(self.path)
+        while (paths := [path for path in self.maybe_empty if path[:depth] == self.path]):
+            self.maybe_empty.difference_update(paths)
+            # Deepest first, so a parent emptied by trimming its children is trimmed on the next
+            # pass.
+            for path in sorted(paths, key=len, reverse=True):
+                if len(path) == depth:
+                    continue
+                parent = self
+                for key in path[depth:-1]:
+                    parent = dict.get(parent, key)
+                    if not isinstance(parent, ImplicitTrackingDict):
+                        break
+                else:
+                    value = dict.get(parent, path[-1])
+                    if isinstance(value, ImplicitTrackingDict) and not value:
+                        parent.pop(path[-1])
 
     def audit(self, path, value, current):
         """Record a mutation of root-path path from current to value."""
@@ -50,6 +97,8 @@ class ImplicitTrackingDict(dict):
         current = super().pop(key, None)
         if current is None:
             return default
+        _changed()
+        self.maybe_empty.add(self.path)
         if isinstance(current, ImplicitTrackingDict):
             ret = dict(current)
             current.clear()
@@ -58,10 +107,34 @@ class ImplicitTrackingDict(dict):
             self.audit(path, None, current)
         return current
 
+    def peek(self, *keys, default=None):
+        """Return self[keys[0]][keys[1]]..., or default if any key is missing.
+
+        Unlike chained [] lookups, this never creates anything in the tree.
+        """
+
+        value = self
+        for key in keys:
+            if not isinstance(value, dict) or (value := value.get(key)) is None:
+                return default
+        return value
+
     def update(self, values):
         for key, value in values.items():
             self[key] = value
 
+    def view(self, key):
+        """Return self[key] if it's a dict, else an empty dict that becomes self[key] when set.
+
+        Unlike self[key], reading from the returned dict (using get, peek, or view, rather than
+        []) never creates anything in the tree.
+        """
+
+        value = self.get(key)
+        if value is None:
+            return _PendingDict(self, key)
+        return value
+
     def __delitem__(self, key):
         self.pop(key)
 
@@ -82,7 +155,12 @@ class ImplicitTrackingDict(dict):
 
         path = self.path + (key,)
         if isinstance(value, dict):
-            value = ImplicitTrackingDict(value=value, log=self.log, path=path)
+            value = ImplicitTrackingDict(value=value,
+                                         log=self.log,
+                                         path=path,
+                                         maybe_empty=self.maybe_empty)
+            if not value:
+                self.maybe_empty.add(path)
         elif isinstance(value, (list, tuple)):
             value = TrackingList(value=value, log=self.log, path=path)
         elif isinstance(value, bytes):  # PyYAML converts ASCII strings to str in Python 2.7.
@@ -91,11 +169,51 @@ class ImplicitTrackingDict(dict):
             assert isinstance(value, (int, str)), repr(value)
 
         super().__setitem__(key, value)
+        _changed()
 
         if not isinstance(value, (ImplicitTrackingDict, TrackingList)):
             self.audit(path, value, current)
 
 
+class _PendingDict(ImplicitTrackingDict):
+    """A dict that isn't added to its parent until something is set in it."""
+
+    def __init__(self, parent, key):
+        super().__init__(log=parent.log, path=parent.path + (key,), maybe_empty=parent.maybe_empty)
+        self._parent = parent
+        self._target = None
+
+    def _attach(self):
+        """Add self to the tree (if nothing else has been added there in the meantime).
+
+        Return whatever dict is now at self's path.
+        """
+
+        if self._target is None:
+            # Two _PendingDicts for the same path (say, from two chats' updates for the same new
+            # user) may be attached at once, so check and set while holding a lock.
+            with _ATTACH_LOCK:
+                if self._target is None:
+                    parent = self._parent
+                    if isinstance(parent, _PendingDict):
+                        parent = parent._attach()  # pylint: disable=protected-access
+                    key = self.path[-1]
+                    if (target := parent.get(key)) is None:
+                        dict.__setitem__(parent, key, self)
+                        target = self
+                    self._target = target
+        return self._target
+
+    def __setitem__(self, key, value):
+        if value is None and not self:
+            return
+        target = self._attach()
+        if target is not self:
+            target[key] = value
+        else:
+            super().__setitem__(key, value)
+
+
 class TrackingList(list):
     """A mutation-logging list."""
 
@@ -109,64 +227,114 @@ class TrackingList(list):
         if value is not None:
             self.extend(value)
 
-    def audit(self, current):
-        """Record a mutation of root-path self.path from current to self."""
+    def audit(self):
+        """Note that self is about to be changed.
 
-        value = tuple(self)
-        if self.path not in self.log:
-            self.log[self.path] = (value, current)
-        else:
-            orig = self.log[self.path][1]
-            if value == orig:
-                self.log.pop(self.path)
-            else:
-                self.log[self.path] = (value, orig)
+        The first time this is called between finalize()s, self's original value is recorded;
+        after that, this is O(1). Its final value is only computed by finalize().
+        """
+
+        entry = self.log.get(self.path)
+        if entry is None:
+            self.log[self.path] = (self, tuple(self))
+        elif entry[0] is not self:
+            self.log[self.path] = (self, entry[1])
 
     def append(self, value):
         assert isinstance(value, (int, str)), value
-        current = tuple(self)
+        self.audit()
         super().append(value)
-        self.audit(current)
+        _changed()
 
     def clear(self):  # pylint: disable=missing-docstring
-        while self:
-            self.pop()
+        if self:
+            self.audit()
+            super().clear()
+            _changed()
 
     def extend(self, values):
+        values = list(values)
         for value in values:
-            self.append(value)
+            assert isinstance(value, (int, str)), value
+        if values:
+            self.audit()
+            super().extend(values)
+            _changed()
 
     def insert(self, index, value):
         assert isinstance(value, (int, str)), value
-        current = tuple(self)
+        self.audit()
         super().insert(index, value)
-        self.audit(current)
+        _changed()
 
     def pop(self, index=-1):
-        current = tuple(self)
-        ret = super().pop(index)
-        self.audit(current)
-        return ret
+        self.audit()
+        value = super().pop(index)
+        _changed()
+        return value
 
     def remove(self, value):
-        current = tuple(self)
+        self.audit()
         super().remove(value)
-        self.audit(current)
+        _changed()
 
     def reverse(self):
-        current = tuple(self)
+        self.audit()
         super().reverse()
-        self.audit(current)
+        _changed()
 
     def sort(self, **kwargs):
-        current = tuple(self)
+        self.audit()
         super().sort(**kwargs)
-        self.audit(current)
+        _changed()
+
+    def __delitem__(self, index):
+        self.audit()
+        super().__delitem__(index)
+        _changed()
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
 
     def __setitem__(self, index, value):
-        assert isinstance(value, (int, str)), value
+        if isinstance(index, slice):
+            value = list(value)
+            for item in value:
+                assert isinstance(item, (int, str)), item
+        else:
+            assert isinstance(value, (int, str)), value
         if self[index] == value:
             return
-        current = tuple(self)
+        self.audit()
         super().__setitem__(index, value)
-        self.audit(current)
+        _changed()
+
+
+class PerThread(threading.local):
+    """A separate factory() for each thread, for use as an ImplicitTrackingDict's log/maybe_empty.
+
+    This lets each thread finalize() only its own changes.
+    """
+
+    def __init__(self, factory):
+        super().__init__()
+        self.value = factory()
+
+    def __getattr__(self, name):
+        return getattr(self.value, name)
+
+    def __contains__(self, key):
+        return key in self.value
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __setitem__(self, key, value):
+        self.value[key] = value
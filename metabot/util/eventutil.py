@@ -50,15 +50,7 @@ def _get_events(multibot, calcodes, tzinfo, count, days, *, now=None):  # pylint
 def format_event(mgr, event, tzinfo, *, full=True, base=None, countdown=True):  # pylint: disable=too-many-arguments,too-many-locals
     """Given a metabot.calendars.base.Calendar event, build a human-friendly representation."""
 
-    rsvpconf = mgr.bot_conf['events']['rsvp'][event['local_id']]
-    attending = maybes = notes = 0
-    for otherrsvpconf in rsvpconf.values():
-        if (going := otherrsvpconf.get('going')) == '+':
-            attending += 1
-        elif going == '?':
-            maybes += 1
-        if otherrsvpconf.get('note'):
-            notes += 1
+    attending, maybes, notes = mgr.multibot.rsvps.counts(mgr.bot_username, event['local_id'])
     attending = attending and f'  \U0001f44d {attending}' or ''
     maybes = maybes and f'  \U0001f914 {maybes}' or ''
     attending += maybes
@@ -142,11 +134,11 @@ def humanize_range(start, end, tzinfo, *, base=None, countdown=True):
 def get_image(mgr, event, *, strict=False, always=False):
     """Choose the best image for a given event and botconf."""
 
-    eventconf = mgr.bot_conf['events']
-    eventimage = eventconf['events'].get(event['local_id'])
+    eventconf = mgr.bot_conf.view('events')
+    eventimage = eventconf.peek('events', event['local_id'])
     if eventimage:
         return eventimage
-    for pattern, seriesimage in eventconf['series'].items():
+    for pattern, seriesimage in eventconf.peek('series', default={}).items():
         if pattern.lower() in event['summary'].lower():
             return seriesimage
     if strict:
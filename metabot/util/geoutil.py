@@ -9,6 +9,7 @@ import googlemaps
 import ntelebot
 
 from metabot.util import iso8601
+from metabot.util import metrics
 from metabot.util import pickleutil
 
 try:
@@ -32,7 +33,8 @@ def _periodic():
                             if last_request >= request_cutoff)
         delay = 60
         if candidates:
-            _cachedfetch(candidates[0][1], live=False)
+            with metrics.timer('job_seconds', job='geoutil._periodic'):
+                _cachedfetch(candidates[0][1], live=False)
             delay = max(5, _SHORTCACHE_AGE / len(candidates))
         time.sleep(delay)
 
@@ -0,0 +1,53 @@
+"""A static index for finding all [start, end] intervals that overlap a given range."""
+
+
+class IntervalIndex:
+    """A static index for finding all [start, end] intervals that overlap a given range.
+
+    The (start-sorted) intervals are treated as an implicit balanced binary search tree--the root
+    of any [lo, hi) slice being its midpoint--with each node augmented by the latest end of any
+    interval in its subtree, so queries run in O(log n + k) instead of O(n).
+    """
+
+    def __init__(self, starts, ends):
+        assert len(starts) == len(ends)
+        self.starts = starts
+        self.ends = ends
+        self.maxends = list(ends)
+        self._augment(0, len(ends))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _augment(self, lo, hi):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        maxend = self.ends[mid]
+        for childend in (self._augment(lo, mid), self._augment(mid + 1, hi)):
+            if childend is not None and childend > maxend:
+                maxend = childend
+        self.maxends[mid] = maxend
+        return maxend
+
+    def search(self, start, end):
+        """Yield the index of every interval overlapping [start, end], in sorted order."""
+
+        starts, ends, maxends = self.starts, self.ends, self.maxends
+        stack = [(0, len(starts))]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, int):
+                yield item
+                continue
+            lo, hi = item
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if maxends[mid] < start:
+                continue
+            if starts[mid] <= end:
+                stack.append((mid + 1, hi))
+                if ends[mid] >= start:
+                    stack.append(mid)
+            stack.append((lo, mid))
@@ -0,0 +1,56 @@
+"""A thread pool that runs tasks sharing a key one at a time, in the order they were submitted."""
+
+import collections
+import concurrent.futures
+import logging
+import threading
+
+
+class KeyedPool:
+    """A thread pool that runs tasks sharing a key one at a time, in the order they were submitted.
+
+    Tasks with different keys run concurrently (up to the number of workers). A worker runs at most
+    batch tasks for one key before moving that key to the back of the line, so a few busy keys
+    can't starve the rest.
+    """
+
+    def __init__(self, workers, batch=16):
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers,
+                                                              thread_name_prefix='dispatch')
+        self.batch = batch
+        self.lock = threading.Lock()
+        self.queues = {}
+
+    def submit(self, key, func, *args):
+        """Call func(*args) after all previously submitted tasks with the same key have finished."""
+
+        with self.lock:
+            if (queue := self.queues.get(key)) is not None:
+                queue.append((func, args))
+                return
+            self.queues[key] = collections.deque([(func, args)])
+        self.executor.submit(self._drain, key)
+
+    def _drain(self, key):
+        while True:
+            for _ in range(self.batch):
+                with self.lock:
+                    queue = self.queues[key]
+                    if not queue:
+                        self.queues.pop(key)
+                        return
+                    func, args = queue.popleft()
+                try:
+                    func(*args)
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception('Ignoring uncaught error while dispatching:')
+            try:
+                self.executor.submit(self._drain, key)
+            except RuntimeError:  # The pool is shutting down, so just finish up here.
+                continue
+            return
+
+    def shutdown(self):
+        """Wait for all submitted tasks to finish."""
+
+        self.executor.shutdown()
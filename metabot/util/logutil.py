@@ -0,0 +1,125 @@
+"""Logging helpers that only pay for formatting when a record is actually emitted."""
+
+import json
+import logging
+import random
+
+FORMAT = '%(asctime)s %(levelname)s %(threadName)s %(filename)s:%(lineno)s] %(message)s'
+
+# The arguments last passed to configure() (so other processes can be configured the same way).
+CONFIG = {}
+_LEVELS = {}
+_SAMPLE = 1
+
+
+class Lazy:  # pylint: disable=too-few-public-methods
+    """A log argument that's only rendered (as func(*args)) if a record using it is emitted."""
+
+    _value = None
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        if self._value is None:
+            self._value = self.func(*self.args)
+        return self._value
+
+
+class JSONFormatter(logging.Formatter):
+    """Format each record as a single line of JSON.
+
+    Fields passed as extra={'fields': {...}} are included as-is (rather than only as part of the
+    rendered message).
+    """
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'thread': record.threadName,
+            'file': record.filename,
+            'line': record.lineno,
+        }
+        if (fields := getattr(record, 'fields', None)) is not None:
+            entry.update(fields)
+        else:
+            entry['message'] = record.getMessage()
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        # Anything else (like a Lazy) is rendered as a string.
+        return json.dumps(entry, default=str)
+
+
+def configure(*, level=logging.INFO, json_lines=False, update_levels=None, sample=1, fmt=FORMAT):
+    """Set up the root logger, and choose which incoming updates log_update logs.
+
+    update_levels maps update types (like 'message' or 'inline_query') to the level to log them at
+    (or None to never log them); other types are logged at INFO. If sample is less than 1, only
+    that fraction of updates are logged at all.
+    """
+
+    global _LEVELS, _SAMPLE  # pylint: disable=global-statement
+    CONFIG.clear()
+    CONFIG.update(level=level, json_lines=json_lines, update_levels=update_levels, sample=sample)
+    _LEVELS = dict(update_levels or ())
+    _SAMPLE = sample
+    handler = logging.StreamHandler()
+    handler.setFormatter(json_lines and JSONFormatter() or logging.Formatter(fmt))
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+
+
+def log_update(update):
+    """Log a raw update received from Telegram (subject to configure's rules)."""
+
+    update_type = next((k for k in update if k != 'update_id'), None)
+    level = _LEVELS.get(update_type, logging.INFO)
+    if level is None or not logging.getLogger().isEnabledFor(level):
+        return
+    if _SAMPLE < 1 and random.random() >= _SAMPLE:
+        return
+    logging.log(level,
+                '%s',
+                Lazy(pretty_repr, update),
+                stacklevel=2,
+                extra={'fields': {
+                    'type': update_type,
+                    'update': update
+                }})
+
+
+def log_changes(source, log):
+    """Log each {path: (value, orig)} change in a finalized mutation log, attributed to source."""
+
+    if not logging.getLogger().isEnabledFor(logging.INFO):
+        return
+    for path, (value, orig) in sorted(log.items()):
+        logging.info(
+            '[%s] %s: %r -> %r',
+            source,
+            Lazy(_pathstr, path),
+            orig,
+            value,
+            stacklevel=2,
+            extra={'fields': {
+                'source': source,
+                'path': path,
+                'orig': orig,
+                'value': value,
+            }})
+
+
+def _pathstr(path):
+    return '.'.join('%s' % part for part in path)
+
+
+def pretty_repr(obj):
+    """Render obj (a tree of dicts, lists, and scalars) on one line, with ANSI colors."""
+
+    if isinstance(obj, dict):
+        return '{%s}' % ', '.join(
+            '\033[31m%s\033[0m=%s' % (k, pretty_repr(v)) for k, v in sorted(obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return '[%s]' % ', '.join(map(pretty_repr, obj))
+    return '\033[32;1m%s\033[0m' % repr(obj)
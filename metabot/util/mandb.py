@@ -2,12 +2,18 @@
 
 import typing
 
+from metabot.util import dicttools
+
 
 class Field:
     """Helper to map Manager.xxx <-> BotConf[...][xxx]."""
 
     def __init__(self, container, key, _type):
-        if callable(container):
+        self.setcontainer = None
+        if isinstance(container, Field):
+            getcontainer = container.__get__
+            self.setcontainer = container.__set__
+        elif callable(container):
             getcontainer = container
         else:
             getcontainer = lambda self: container
@@ -34,12 +40,30 @@ class Field:
         self.name = f'{owner.__module__}.{owner.__name__}.{name}'
 
     def __get__(self, obj, objtype=None):
+        # Values read from an ImplicitTrackingDict tree are cached in obj._fieldcache until the
+        # next change to any tree.
+        generation = dicttools.ImplicitTrackingDict.generation
+        cache = getattr(obj, '_fieldcache', None)
+        if cache and cache[0] == generation and self in cache[1]:
+            return cache[1][self]
+
         container = self.getcontainer(obj)
         key = self.getkey(obj)
+        value = self._lookup(container, key)
+        if value is Field:
+            self.__set__(obj, self.getdefault())
+            return self.__get__(obj, objtype=objtype)
 
+        if isinstance(container, (dicttools.ImplicitTrackingDict, dicttools.TrackingList)):
+            if not cache or cache[0] != generation:
+                cache = obj._fieldcache = (generation, {})
+            cache[1][self] = value
+        return value
+
+    def _lookup(self, container, key):
         if isinstance(container, dict):
             value = container.get(key, Field)
-        elif isinstance(container, list):
+        elif isinstance(container, (list, tuple)):
             value = key in container
         else:
             value = getattr(container, key, Field)
@@ -47,9 +71,15 @@ class Field:
         if value is not Field:
             return value
 
+        # Don't add missing collections to the tree just to read from them.
+        if isinstance(container, dicttools.ImplicitTrackingDict):
+            if self.type is dict:
+                return container.view(key)
+            if self.type is list:
+                return ()
+
         if self.getdefault:
-            self.__set__(obj, self.getdefault())
-            return self.__get__(obj, objtype=objtype)
+            return Field
 
     def __set__(self, obj, value):
         if value is not None and not isinstance(value, self.type):
@@ -60,10 +90,13 @@ class Field:
 
         if isinstance(container, dict):
             container[key] = value
-        elif isinstance(container, list):
+        elif isinstance(container, (list, tuple)):
             value = bool(value)
             if value != (key in container):
-                if value:
+                if not isinstance(container, list):
+                    # The list was missing (see __get__), so create it.
+                    self.setcontainer(obj, [key])
+                elif value:
                     container.append(key)
                     container.sort()
                 else:
@@ -0,0 +1,222 @@
+"""Cheap in-process counters, gauges, and latency histograms (optionally served over HTTP)."""
+
+import bisect
+import collections
+import contextlib
+import http.server
+import logging
+import threading
+import time
+
+# Upper bounds (in seconds) of each histogram bucket; anything slower lands in a final, unbounded
+# bucket.
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:  # pylint: disable=too-few-public-methods
+    """Counts of observed values falling into each of BUCKETS."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        """Record a single value."""
+
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    """A set of named, labeled counters and histograms, safe to update from multiple threads.
+
+    While not enabled, every update is a no-op.
+    """
+
+    def __init__(self, *, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.histograms = {}
+
+    def enable(self):
+        """Start recording updates."""
+
+        self.enabled = True
+
+    def increment(self, name, amount=1, **labels):
+        """Add amount to the given counter."""
+
+        if not self.enabled:
+            return
+        key = name, tuple(sorted(labels.items()))
+        with self.lock:
+            self.counters[key] += amount
+
+    def gauge(self, name, value, **labels):
+        """Set the given gauge to value."""
+
+        if not self.enabled:
+            return
+        key = name, tuple(sorted(labels.items()))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        """Record value in the given histogram."""
+
+        if not self.enabled:
+            return
+        key = name, tuple(sorted(labels.items()))
+        with self.lock:
+            if (hist := self.histograms.get(key)) is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Record how long the body of the with statement took in the given histogram."""
+
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def dump(self):
+        """Return everything recorded so far as a JSON-compatible dict."""
+
+        with self.lock:
+            return {
+                'buckets':
+                    list(BUCKETS),
+                'counters': [{
+                    'name': name,
+                    'labels': dict(labels),
+                    'value': value,
+                } for (name, labels), value in sorted(self.counters.items(), key=_sortkey)],
+                'gauges': [{
+                    'name': name,
+                    'labels': dict(labels),
+                    'value': value,
+                } for (name, labels), value in sorted(self.gauges.items(), key=_sortkey)],
+                'histograms': [{
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': hist.count,
+                    'sum': hist.sum,
+                    'counts': list(hist.counts),
+                } for (name, labels), hist in sorted(self.histograms.items(), key=_sortkey)],
+            }
+
+    def reset(self):
+        """Forget everything recorded so far."""
+
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+def quantile(counts, fraction):
+    """Return the upper bound of the bucket containing the given fraction of all counts."""
+
+    target = fraction * sum(counts)
+    seen = 0
+    for bound, count in zip(BUCKETS, counts):
+        seen += count
+        if count and seen >= target:
+            return bound
+    return float('inf')
+
+
+def render(data):
+    """Format the output of dump() in the Prometheus text exposition format."""
+
+    lines = []
+    for kind, suffix in (('counter', '_total'), ('gauge', '')):
+        for entry in _typed(lines, data[kind + 's'], kind):
+            lines.append(f"metabot_{entry['name']}{suffix}{_labelstr(entry['labels'])} "
+                         f"{entry['value']}")
+    for entry in _typed(lines, data['histograms'], 'histogram'):
+        name, labels = 'metabot_' + entry['name'], entry['labels']
+        seen = 0
+        for bound, count in zip(data['buckets'] + ['+Inf'], entry['counts']):
+            seen += count
+            lines.append(f'{name}_bucket{_labelstr(labels, le=bound)} {seen}')
+        lines.append(f"{name}_sum{_labelstr(labels)} {entry['sum']}")
+        lines.append(f"{name}_count{_labelstr(labels)} {entry['count']}")
+    return ''.join(line + '\n' for line in lines)
+
+
+def _typed(lines, entries, kind):
+    # Entries are sorted by name, so each name's # TYPE line only needs to be emitted once.
+    last = None
+    for entry in entries:
+        if entry['name'] != last:
+            last = entry['name']
+            suffix = kind == 'counter' and '_total' or ''
+            lines.append(f'# TYPE metabot_{last}{suffix} {kind}')
+        yield entry
+
+
+def _labelstr(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):  # pylint: disable=invalid-name,missing-function-docstring
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render(dump()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def serve(port, host='127.0.0.1'):
+    """Serve everything recorded in the default registry at http://host:port/metrics."""
+
+    REGISTRY.enable()
+    server = http.server.ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info('Serving metrics at http://%s:%s/metrics.', host, server.server_port)
+    return server
+
+
+def _sortkey(item):
+    (name, labels), unused_value = item
+    return name, [(k, str(v)) for k, v in labels]
+
+
+# The default registry doesn't record anything until something (like serve() or the stats module)
+# enables it, so instrumented code paths cost next to nothing otherwise.
+REGISTRY = Registry(enabled=False)
+enable = REGISTRY.enable
+increment = REGISTRY.increment
+gauge = REGISTRY.gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+dump = REGISTRY.dump
+reset = REGISTRY.reset
@@ -1,5 +1,7 @@
 """Simplified interface to https://docs.python.org/2/library/pickle.html."""
 
+import logging
+import os
 import pickle
 import pickletools
 
@@ -18,6 +20,37 @@ def load(fname):
         pass
 
 
+def load_all(fname):
+    """Load every record appended to fname, stopping at the first damaged record.
+
+    A damaged record (like one left half-written by a crash partway through append) is truncated
+    away, along with anything after it, so records appended later aren't hidden behind it.
+    """
+
+    records = []
+    try:
+        fobj = open(fname, 'rb')
+    except IOError:
+        return records
+
+    with fobj:
+        good = 0
+        while True:
+            try:
+                records.append(pickle.load(fobj))
+            except Exception:  # pylint: disable=broad-except
+                # A torn record can fail in many ways (EOFError, UnpicklingError, ValueError,
+                # struct.error, AttributeError, IndexError, ...).
+                break
+            good = fobj.tell()
+        damaged = fobj.seek(0, os.SEEK_END) > good
+
+    if damaged:
+        logging.warning('Truncating damaged records at offset %s of %r.', good, fname)
+        os.truncate(fname, good)
+    return records
+
+
 def optimize(obj, store=None):
     """Return a copy of obj with normalized and deduplicated strings."""
 
@@ -48,8 +81,26 @@ def optimize(obj, store=None):
 def dump(fname, obj, store=None):
     """Optimize obj, then save it as a Pickle file to fname."""
 
-    obj = optimize(obj, store=store)
+    return write(fname, optimize(obj, store=store))
+
+
+def write(fname, obj):
+    """Save obj as a Pickle file to fname, replacing any existing file atomically."""
+
     data = pickletools.optimize(pickle.dumps(obj, -1))
-    with open(fname, 'wb') as fobj:
+    tmpname = fname + '.tmp'
+    with open(tmpname, 'wb') as fobj:
         fobj.write(data)
+    os.replace(tmpname, fname)
     return obj
+
+
+def append(fname, obj):
+    """Append obj to fname as a single Pickle record, returning the new size of fname."""
+
+    data = pickle.dumps(obj, -1)
+    with open(fname, 'ab') as fobj:
+        fobj.write(data)
+        fobj.flush()
+        os.fsync(fobj.fileno())
+        return fobj.tell()
@@ -0,0 +1,139 @@
+"""Per-event RSVPs, stored in SQLite alongside precomputed going/maybe/note counts."""
+
+import logging
+import sqlite3
+import threading
+
+
+class RSVPStore:
+    """Per-event RSVPs, stored in SQLite alongside precomputed going/maybe/note counts."""
+
+    def __init__(self, fname=':memory:'):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(fname, check_same_thread=False)
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS rsvp (bot TEXT, local_id TEXT, '
+                            'user_id INTEGER, going TEXT, note TEXT, '
+                            'PRIMARY KEY (bot, local_id, user_id)) WITHOUT ROWID')
+            self.db.execute('CREATE TABLE IF NOT EXISTS counts (bot TEXT, local_id TEXT, '
+                            'going INTEGER, maybe INTEGER, notes INTEGER, end REAL, '
+                            'PRIMARY KEY (bot, local_id)) WITHOUT ROWID')
+            self.db.execute('CREATE INDEX IF NOT EXISTS counts_end ON counts (end)')
+        # There's only one counts row per event (not per RSVP), so keep them all in memory.
+        self._counts = {}
+        self.reload()
+
+    def reload(self):
+        """Re-read all counts from the database (after another process has changed them)."""
+
+        with self.lock:
+            self._counts = {
+                (bot, local_id): (going, maybe, notes) for bot, local_id, going, maybe, notes in
+                self.db.execute('SELECT bot, local_id, going, maybe, notes FROM counts')
+            }
+
+    def counts(self, bot, local_id):
+        """Return the number of (going, maybe, note) RSVPs for the given event."""
+
+        return self._counts.get((bot, local_id), (0, 0, 0))
+
+    def get(self, bot, local_id, user_id):
+        """Return the given user's RSVP for the given event, as {'going': ..., 'note': ...}."""
+
+        with self.lock:
+            row = self.db.execute(
+                'SELECT going, note FROM rsvp WHERE bot = ? AND local_id = ? AND user_id = ?',
+                (bot, local_id, user_id)).fetchone()
+        return _to_dict(row)
+
+    def event(self, bot, local_id):
+        """Return [(user_id, rsvp), ...] for all users who RSVPed to the given event."""
+
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT user_id, going, note FROM rsvp WHERE bot = ? AND local_id = ?',
+                (bot, local_id)).fetchall()
+        return [(user_id, _to_dict((going, note))) for user_id, going, note in rows]
+
+    def update(self, bot, event, user_id, **changes):
+        """Set the given user's RSVP 'going' and/or 'note' for the given event (None clears).
+
+        The event's counts are adjusted in the same transaction, and its end time is recorded for
+        prune().
+        """
+
+        local_id = event['local_id']
+        with self.lock, self.db:
+            row = self.db.execute(
+                'SELECT going, note FROM rsvp WHERE bot = ? AND local_id = ? AND user_id = ?',
+                (bot, local_id, user_id)).fetchone()
+            orig = _to_dict(row)
+            rsvp = dict(orig, **changes)
+            rsvp = {k: v for k, v in rsvp.items() if v}
+            if rsvp == orig:
+                return rsvp
+            logging.info('[rsvp] %s %s %s: %r -> %r', bot, local_id, user_id, orig, rsvp)
+            if rsvp:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO rsvp (bot, local_id, user_id, going, note) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (bot, local_id, user_id, rsvp.get('going'), rsvp.get('note')))
+            else:
+                self.db.execute('DELETE FROM rsvp WHERE bot = ? AND local_id = ? AND user_id = ?',
+                                (bot, local_id, user_id))
+            counts = [
+                count - _tally(orig)[i] + _tally(rsvp)[i]
+                for i, count in enumerate(self.counts(bot, local_id))
+            ]
+            if any(counts):
+                self.db.execute(
+                    'INSERT OR REPLACE INTO counts (bot, local_id, going, maybe, notes, end) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', (bot, local_id, *counts, event['end']))
+                self._counts[bot, local_id] = tuple(counts)
+            else:
+                self.db.execute('DELETE FROM counts WHERE bot = ? AND local_id = ?',
+                                (bot, local_id))
+                self._counts.pop((bot, local_id), None)
+        return rsvp
+
+    def prune(self, before, get_event):
+        """Remove all RSVPs for events that ended before the given time.
+
+        get_event(local_id) should return the current version of the event (or None if it no
+        longer exists), in case it has been rescheduled since its end time was recorded.
+        """
+
+        with self.lock:
+            rows = self.db.execute('SELECT bot, local_id FROM counts WHERE end < ?',
+                                   (before,)).fetchall()
+        removed = 0
+        for bot, local_id in rows:
+            with self.lock, self.db:
+                if (event := get_event(local_id)) and event['end'] >= before:
+                    self.db.execute('UPDATE counts SET end = ? WHERE bot = ? AND local_id = ?',
+                                    (event['end'], bot, local_id))
+                    continue
+                self.db.execute('DELETE FROM rsvp WHERE bot = ? AND local_id = ?', (bot, local_id))
+                self.db.execute('DELETE FROM counts WHERE bot = ? AND local_id = ?',
+                                (bot, local_id))
+                self._counts.pop((bot, local_id), None)
+                removed += 1
+        if removed:
+            logging.info('Pruned RSVPs for %s ended events.', removed)
+        return removed
+
+
+def _to_dict(row):
+    rsvp = {}
+    if row:
+        going, note = row
+        if going:
+            rsvp['going'] = going
+        if note:
+            rsvp['note'] = note
+    return rsvp
+
+
+def _tally(rsvp):
+    going = rsvp.get('going')
+    return (going == '+' and 1 or 0, going == '?' and 1 or 0, rsvp.get('note') and 1 or 0)
@@ -0,0 +1,181 @@
+"""Store an ImplicitTrackingDict tree in SQLite as one row per leaf, loading subtrees lazily."""
+
+import json
+import sqlite3
+import threading
+
+from metabot.util import dicttools
+
+# Each path is stored as its JSON-encoded keys joined by _SEP. JSON escapes all control characters
+# (and, with ensure_ascii, everything past '\x7f'), so _SEP never appears inside an encoded key,
+# every descendant of a path p sorts between p + _SEP and p + _END, and every path sorts before
+# _ROOT_END.
+_SEP = '\x1f'
+_END = '\x20'
+_ROOT_END = '\x80'
+
+
+def _encode(path):
+    return _SEP.join(json.dumps(key) for key in path)
+
+
+class Store:
+    """A SQLite file holding one (path, value) row for each leaf of a tree of dicts."""
+
+    def __init__(self, fname):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(fname, check_same_thread=False)
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS conf '
+                            '(path TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID')
+
+    def __bool__(self):
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM conf LIMIT 1').fetchone() is not None
+
+    def children(self, path):
+        """Yield (key, value) for each child of path, where value is None for subtrees.
+
+        Only one row is read per child, regardless of how large the child's subtree is.
+        """
+
+        if path:
+            prefix = _encode(path) + _SEP
+            end = prefix[:-1] + _END
+        else:
+            prefix = ''
+            end = _ROOT_END
+        cursor = prefix
+        while True:
+            with self.lock:
+                row = self.db.execute(
+                    'SELECT path, value FROM conf WHERE path >= ? AND path < ? ORDER BY path '
+                    'LIMIT 1', (cursor, end)).fetchone()
+            if not row:
+                return
+            enckey, subtree, _ = row[0][len(prefix):].partition(_SEP)
+            if subtree:
+                yield json.loads(enckey), None
+            else:
+                yield json.loads(enckey), json.loads(row[1])
+            # Skip past the rest of this child's subtree.
+            cursor = prefix + enckey + _END
+
+    def commit(self, rows):
+        """Write {path: value} in a single transaction, where a value of None deletes path.
+
+        Setting a path also deletes any rows for its ancestors and descendants, since a leaf can't
+        also be a branch.
+        """
+
+        with self.lock, self.db:
+            for path, value in rows.items():
+                encpath = _encode(path)
+                self.db.execute('DELETE FROM conf WHERE path >= ? AND path < ?',
+                                (encpath + _SEP, encpath + _END))
+                if value is None:
+                    self.db.execute('DELETE FROM conf WHERE path = ?', (encpath,))
+                    continue
+                for i in range(1, len(path)):
+                    self.db.execute('DELETE FROM conf WHERE path = ?', (_encode(path[:i]),))
+                self.db.execute('INSERT OR REPLACE INTO conf (path, value) VALUES (?, ?)',
+                                (encpath, json.dumps(value)))
+
+
+def populate(node, store):
+    """Fill the (empty) ImplicitTrackingDict node with its children from store, without logging.
+
+    Subtrees are added as unloaded LazyDicts.
+    """
+
+    for key, value in store.children(node.path):
+        path = node.path + (key,)
+        if value is None:
+            value = LazyDict(store, node.log, path, node.maybe_empty)
+        elif isinstance(value, list):
+            items, value = value, dicttools.TrackingList(log=node.log, path=path)
+            # Like the dict.__setitem__ below, skip the audit log.
+            list.extend(value, items)
+        dict.__setitem__(node, key, value)
+
+
+class LazyDict(dicttools.ImplicitTrackingDict):
+    """An ImplicitTrackingDict whose children are read from a Store the first time it's used."""
+
+    def __init__(self, store, log, path, maybe_empty):
+        super().__init__(log=log, path=path, maybe_empty=maybe_empty)
+        self.store = store
+        self.loaded = False
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        """Read this dict's children from the store (if they haven't been already)."""
+
+        if not self.loaded:
+            # Another thread may be halfway through loading, in which case wait for it to finish.
+            with self._load_lock:
+                if not self.loaded:
+                    populate(self, self.store)
+                    self.loaded = True
+
+    def __bool__(self):
+        # A subtree is only stored if it has at least one leaf, so there's no need to load it.
+        return not self.loaded or super().__len__() > 0
+
+    def __contains__(self, key):
+        self.load()
+        return super().__contains__(key)
+
+    def __eq__(self, other):
+        self.load()
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        self.load()
+        return super().__ne__(other)
+
+    __hash__ = None
+
+    def __getitem__(self, key):
+        self.load()
+        return super().__getitem__(key)
+
+    def __iter__(self):
+        self.load()
+        return super().__iter__()
+
+    def __len__(self):
+        self.load()
+        return super().__len__()
+
+    def __repr__(self):
+        self.load()
+        return super().__repr__()
+
+    def __setitem__(self, key, value):
+        self.load()
+        return super().__setitem__(key, value)
+
+    def copy(self):
+        self.load()
+        return dict(self)
+
+    def get(self, key, default=None):
+        self.load()
+        return super().get(key, default)
+
+    def items(self):
+        self.load()
+        return super().items()
+
+    def keys(self):
+        self.load()
+        return super().keys()
+
+    def pop(self, key, default=None):
+        self.load()
+        return super().pop(key, default)
+
+    def values(self):
+        self.load()
+        return super().values()
@@ -0,0 +1,106 @@
+"""Tests for metabot.util.asyncloop."""
+
+import asyncio
+import http.server
+import json
+import threading
+
+import ntelebot
+import pytest
+
+from metabot.util import asyncloop
+
+
+def test_loop():
+    """Verify bots are polled from the event loop, and queued jobs are run in another thread."""
+
+    requests = []
+
+    class _Handler(http.server.BaseHTTPRequestHandler):
+
+        def do_POST(self):  # pylint: disable=invalid-name,missing-function-docstring
+            params = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            requests.append((self.path, params))
+            result = []
+            if 'offset' not in params:
+                result.append({'update_id': 5, 'message': {'text': 'test'}})
+            body = json.dumps({'ok': True, 'result': result}).encode('ascii')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    bot = ntelebot.bot.Bot('1234:token')
+    bot._username = 'asynctestbot'  # pylint: disable=protected-access
+    bot.url = f'http://127.0.0.1:{server.server_port}/bot1234:token/'
+    loop = asyncloop.AsyncLoop()
+    updates = []
+    threads = []
+
+    def _dispatcher(unused_bot, update):
+        updates.append(update)
+        threads.append(threading.current_thread())
+        loop.queue.put(loop.stop)
+
+    loop.queue.put(lambda: threads.append(threading.current_thread()))
+    loop.add(bot, _dispatcher)
+    loop.run()
+    server.shutdown()
+
+    assert updates == [{'update_id': 5, 'message': {'text': 'test'}}]
+    assert requests[0] == ('/bot1234:token/getupdates', {'timeout': 10})
+    assert len(set(threads)) == 2
+
+
+def test_connection():
+    """Verify Connection reuses its connection, and checks the response status."""
+
+    clients = []
+
+    class _Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):  # pylint: disable=invalid-name,missing-function-docstring
+            self.rfile.read(int(self.headers['Content-Length']))
+            clients.append(self.client_address)
+            if self.path.endswith('/ok'):
+                status, body = 200, b'{"ok": true, "result": []}'
+            elif self.path.endswith('/conflict'):
+                status, body = 409, b'{"ok": false, "description": "Conflict"}'
+            else:
+                status, body = 502, b'<html>Bad Gateway</html>'
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    async def _requests():
+        conn = asyncloop.Connection(f'http://127.0.0.1:{server.server_port}/bot1234:token/')
+        try:
+            assert await conn.post('ok', {}, timeout=5) == {'ok': True, 'result': []}
+            assert await conn.post('conflict', {}, timeout=5) == {
+                'ok': False,
+                'description': 'Conflict'
+            }
+            with pytest.raises(asyncloop.HTTPError):
+                await conn.post('bad', {}, timeout=5)
+            assert await conn.post('ok', {}, timeout=5) == {'ok': True, 'result': []}
+        finally:
+            conn.close()
+
+    asyncio.run(_requests())
+    server.shutdown()
+    assert len(clients) == 4
+    assert len(set(clients)) == 1
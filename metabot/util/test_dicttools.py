@@ -107,6 +107,75 @@ def test_missing():
     assert list(iter(cont)) == []
 
 
+def test_trim():
+    """Verify finalize trims only dicts created or shrunk since the last finalize."""
+
+    cont = dicttools.ImplicitTrackingDict()
+    cont['alpha']['bravo']['charlie'] = 1
+    cont['delta']['echo']['foxtrot']  # pylint: disable=pointless-statement
+    cont['golf'] = {'hotel': {}}
+    assert cont.finalize() == {('alpha', 'bravo', 'charlie'): (1, None)}
+    assert cont == {'alpha': {'bravo': {'charlie': 1}}}
+    assert not cont.maybe_empty
+
+    # An empty dict that wasn't touched in this window isn't even looked at.
+    untouched = dicttools.ImplicitTrackingDict()
+    dict.__setitem__(cont['alpha'], 'untouched', untouched)
+    cont['alpha']['bravo'].pop('charlie')
+    assert cont.finalize() == {('alpha', 'bravo', 'charlie'): (None, 1)}
+    assert cont == {'alpha': {'untouched': {}}}
+
+    # Finalizing a subtree only trims within it.
+    cont['alpha']['india']  # pylint: disable=pointless-statement
+    cont['juliet']  # pylint: disable=pointless-statement
+    cont['alpha'].finalize()
+    assert cont == {'alpha': {'untouched': {}}, 'juliet': {}}
+    cont.finalize()
+    assert cont == {'alpha': {'untouched': {}}}
+
+
+def test_peek():
+    """Verify peek reads nested values without creating anything."""
+
+    cont = dicttools.ImplicitTrackingDict({'alpha': {'bravo': 'charlie'}})
+    cont.finalize()
+    assert cont.peek('alpha', 'bravo') == 'charlie'
+    assert cont.peek('alpha', 'bravo', 'charlie') is None
+    assert cont.peek('delta', 'echo') is None
+    assert cont.peek('delta', 'echo', default={}) == {}
+    assert cont == {'alpha': {'bravo': 'charlie'}}
+    assert not cont.maybe_empty
+
+
+def test_view():
+    """Verify view only adds the dict to the tree once something is set in it."""
+
+    cont = dicttools.ImplicitTrackingDict()
+    view = cont.view('alpha').view('bravo')
+    assert view == {}
+    assert view.get('charlie') is None
+    assert view.peek('charlie', 'delta') is None
+    view['charlie'] = None
+    assert cont == {}
+    assert not cont.maybe_empty
+
+    view['charlie'] = 'delta'
+    assert cont == {'alpha': {'bravo': {'charlie': 'delta'}}}
+    assert cont['alpha']['bravo'] is view
+    assert cont.view('alpha').view('bravo') is view
+    assert cont.finalize() == {('alpha', 'bravo', 'charlie'): ('delta', None)}
+
+    # If the dict was created some other way in the meantime, changes go there instead.
+    view = cont.view('echo')
+    cont['echo']['foxtrot'] = 'golf'
+    view['hotel'] = 'india'
+    assert cont['echo'] == {'foxtrot': 'golf', 'hotel': 'india'}
+    assert cont.finalize() == {
+        ('echo', 'foxtrot'): ('golf', None),
+        ('echo', 'hotel'): ('india', None),
+    }
+
+
 def test_list():
     """Test TrackingList (via ImplicitTrackingDict.__setitem__)."""
 
@@ -148,3 +217,30 @@ def test_list():
 
     cont['alpha'].clear()
     assert cont.finalize() == {('alpha',): ((), (5, 4, 3))}
+
+
+def test_list_bulk():
+    """Verify bulk TrackingList operations are logged once, with the final value."""
+
+    cont = dicttools.ImplicitTrackingDict({'alpha': [1, 2, 3]})
+    cont.finalize()
+
+    alpha = cont['alpha']
+    alpha.extend(range(4, 1000))
+    alpha[1:3] = [20, 30]
+    del alpha[3:]
+    alpha += [40]
+    assert cont.log == {('alpha',): (alpha, (1, 2, 3))}
+    assert cont.finalize() == {('alpha',): ((1, 20, 30, 40), (1, 2, 3))}
+
+    alpha[1:3] = [20, 30]
+    alpha.extend(())
+    assert cont.finalize() == {}
+
+    alpha.clear()
+    alpha.extend([1, 20, 30, 40])
+    assert cont.finalize() == {}
+
+    cont['alpha'] = [5]
+    cont['alpha'].append(6)
+    assert cont.finalize() == {('alpha',): ((5, 6), (1, 20, 30, 40))}
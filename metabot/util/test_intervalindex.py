@@ -0,0 +1,45 @@
+"""Tests for metabot.util.intervalindex."""
+
+import random
+
+from metabot.util import intervalindex
+
+
+def test_empty():
+    """Verify an empty index finds nothing."""
+
+    index = intervalindex.IntervalIndex([], [])
+    assert len(index) == 0
+    assert list(index.search(0, 1000)) == []
+
+
+def test_search():
+    """Verify boundary conditions of IntervalIndex.search."""
+
+    #   |1000  2000|
+    #        |1500                  5000|
+    #               |2500 3000|
+    index = intervalindex.IntervalIndex([1000, 1500, 2500], [2000, 5000, 3000])
+    assert len(index) == 3
+    assert list(index.search(0, 999)) == []
+    assert list(index.search(0, 1000)) == [0]
+    assert list(index.search(2000, 2000)) == [0, 1]
+    assert list(index.search(2001, 2499)) == [1]
+    assert list(index.search(2001, 2500)) == [1, 2]
+    assert list(index.search(4000, 6000)) == [1]
+    assert list(index.search(5001, 6000)) == []
+
+
+def test_brute_force():
+    """Compare IntervalIndex.search against a linear scan over random data."""
+
+    rand = random.Random(1234)
+    for size in (1, 2, 3, 10, 100, 257):
+        starts = sorted(rand.randrange(10000) for _ in range(size))
+        ends = [start + rand.choice((0, 10, 100, 5000)) for start in starts]
+        index = intervalindex.IntervalIndex(starts, ends)
+        for _ in range(50):
+            start = rand.randrange(-100, 11000)
+            end = start + rand.randrange(1000)
+            expected = [i for i in range(size) if starts[i] <= end and ends[i] >= start]
+            assert list(index.search(start, end)) == expected
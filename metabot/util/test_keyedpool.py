@@ -0,0 +1,63 @@
+"""Tests for metabot.util.keyedpool."""
+
+import threading
+import time
+
+from metabot.util import keyedpool
+
+
+def test_ordering():
+    """Verify tasks sharing a key run in order, while other keys aren't blocked."""
+
+    pool = keyedpool.KeyedPool(4)
+    release = threading.Event()
+    results = []
+
+    def _task(key, i):
+        if (key, i) == ('slow', 0):
+            release.wait()
+        results.append((key, i))
+
+    for i in range(3):
+        pool.submit('slow', _task, 'slow', i)
+    for i in range(3):
+        pool.submit('fast', _task, 'fast', i)
+    pool.submit('fast', lambda: 1 / 0)  # Errors are logged, not raised.
+    pool.submit('fast', release.set)
+    pool.shutdown()
+
+    assert [i for key, i in results if key == 'slow'] == [0, 1, 2]
+    assert [i for key, i in results if key == 'fast'] == [0, 1, 2]
+    assert results.index(('fast', 2)) < results.index(('slow', 0))
+    assert not pool.queues
+
+
+def test_batch():
+    """Verify a busy key yields its worker to other keys after each batch."""
+
+    pool = keyedpool.KeyedPool(1, batch=2)
+    release = threading.Event()
+    results = []
+
+    def _task(key, i):
+        if (key, i) == ('busy', 0):
+            release.wait()
+        results.append((key, i))
+
+    for i in range(4):
+        pool.submit('busy', _task, 'busy', i)
+    pool.submit('other', _task, 'other', 0)
+    release.set()
+    while len(results) < 5:
+        time.sleep(.01)
+    assert results == [('busy', 0), ('busy', 1), ('other', 0), ('busy', 2), ('busy', 3)]
+
+    # Once the pool is shutting down, the remaining tasks are just run in place.
+    release.clear()
+    results.clear()
+    for i in range(4):
+        pool.submit('busy', _task, 'busy', i)
+    threading.Timer(.05, release.set).start()
+    pool.shutdown()
+    assert results == [('busy', 0), ('busy', 1), ('busy', 2), ('busy', 3)]
+    assert not pool.queues
@@ -0,0 +1,87 @@
+"""Tests for metabot.util.logutil."""
+
+import json
+import logging
+
+from metabot.util import logutil
+
+
+def test_lazy(caplog):
+    """Verify Lazy arguments are only rendered if the record is emitted, and only once."""
+
+    calls = []
+
+    def _render():
+        calls.append(None)
+        return 'rendered'
+
+    lazy = logutil.Lazy(_render)
+    caplog.set_level(logging.INFO)
+    logging.debug('%s', lazy)
+    assert calls == []
+    logging.info('%s', lazy)
+    logging.info('again: %s', lazy)
+    assert caplog.messages == ['rendered', 'again: rendered']
+    assert len(calls) == 1
+
+
+def test_log_update(caplog, monkeypatch):
+    """Verify per-update-type levels and sampling."""
+
+    monkeypatch.setattr(logutil, '_LEVELS', {'inline_query': None, 'edited_message': logging.DEBUG})
+    caplog.set_level(logging.INFO)
+    logutil.log_update({'update_id': 1, 'message': {'text': 'hi'}})
+    logutil.log_update({'update_id': 2, 'inline_query': {'query': 'hi'}})
+    logutil.log_update({'update_id': 3, 'edited_message': {'text': 'hi'}})
+    assert caplog.messages == [
+        '{\033[31mmessage\033[0m={\033[31mtext\033[0m=\033[32;1m\'hi\'\033[0m}, '
+        '\033[31mupdate_id\033[0m=\033[32;1m1\033[0m}'
+    ]
+    assert caplog.records[0].fields == {
+        'type': 'message',
+        'update': {
+            'update_id': 1,
+            'message': {
+                'text': 'hi'
+            }
+        },
+    }
+
+    caplog.clear()
+    monkeypatch.setattr(logutil, '_SAMPLE', .5)
+    monkeypatch.setattr('random.random', lambda: .7)
+    logutil.log_update({'update_id': 4, 'message': {'text': 'hi'}})
+    assert caplog.messages == []
+    monkeypatch.setattr('random.random', lambda: .3)
+    logutil.log_update({'update_id': 5, 'message': {'text': 'hi'}})
+    assert len(caplog.messages) == 1
+
+
+def test_json(caplog):
+    """Verify JSONFormatter emits structured fields as-is."""
+
+    caplog.set_level(logging.INFO)
+    logutil.log_changes(logutil.Lazy(lambda: '1000 @user'), {
+        ('bots', 'modbot', 'admins'): ((1000,), None),
+        ('users', 1000, 'name'): ('User', 'Old'),
+    })
+    assert caplog.messages == [
+        "[1000 @user] bots.modbot.admins: None -> (1000,)",
+        "[1000 @user] users.1000.name: 'Old' -> 'User'",
+    ]
+    formatter = logutil.JSONFormatter()
+    entry = json.loads(formatter.format(caplog.records[1]))
+    assert entry.pop('time')
+    assert entry.pop('line')
+    assert entry == {
+        'level': 'INFO',
+        'thread': 'MainThread',
+        'file': 'test_logutil.py',
+        'source': '1000 @user',
+        'path': ['users', 1000, 'name'],
+        'orig': 'Old',
+        'value': 'User',
+    }
+
+    record = logging.LogRecord('root', logging.INFO, 'test.py', 1, 'plain %s', ('message',), None)
+    assert json.loads(formatter.format(record))['message'] == 'plain message'
@@ -0,0 +1,115 @@
+"""Tests for metabot.util.metrics."""
+
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metabot.util import metrics
+
+
+def test_registry():
+    """Verify counters and histograms are kept separately per set of labels."""
+
+    registry = metrics.Registry()
+    registry.increment('errors', module='a')
+    registry.increment('errors', 2, module='a')
+    registry.increment('errors', module='b')
+    registry.observe('seconds', .003, module='a')
+    registry.observe('seconds', .004, module='a')
+    registry.observe('seconds', 60, module='a')
+    with pytest.raises(ValueError), registry.timer('seconds', module='b'):
+        raise ValueError
+
+    data = registry.dump()
+    assert data['counters'] == [
+        {
+            'name': 'errors',
+            'labels': {
+                'module': 'a'
+            },
+            'value': 3
+        },
+        {
+            'name': 'errors',
+            'labels': {
+                'module': 'b'
+            },
+            'value': 1
+        },
+    ]
+    hist, other = data['histograms']
+    assert hist['labels'] == {'module': 'a'}
+    assert hist['count'] == 3
+    assert hist['counts'][2] == 2
+    assert hist['counts'][-1] == 1
+    assert other['labels'] == {'module': 'b'}
+    assert other['count'] == 1
+
+    registry.reset()
+    assert registry.dump()['histograms'] == []
+
+    registry = metrics.Registry(enabled=False)
+    registry.increment('errors')
+    registry.gauge('events', 5)
+    with registry.timer('seconds'):
+        pass
+    assert registry.dump() == {
+        'buckets': list(metrics.BUCKETS),
+        'counters': [],
+        'gauges': [],
+        'histograms': []
+    }
+
+
+def test_quantile():
+    """Verify quantile reports the bucket bound containing the requested fraction."""
+
+    counts = [0] * (len(metrics.BUCKETS) + 1)
+    counts[0] = 50
+    counts[3] = 45
+    counts[-1] = 5
+    assert metrics.quantile(counts, .5) == .001
+    assert metrics.quantile(counts, .51) == .01
+    assert metrics.quantile(counts, .95) == .01
+    assert metrics.quantile(counts, .99) == float('inf')
+
+
+def test_render():
+    """Verify the Prometheus text format."""
+
+    registry = metrics.Registry()
+    registry.increment('updates', bot='a"b')
+    registry.gauge('events', 5)
+    registry.observe('seconds', .003)
+    text = metrics.render(registry.dump())
+    assert text.startswith('# TYPE metabot_updates_total counter\n'
+                           'metabot_updates_total{bot="a\\"b"} 1\n'
+                           '# TYPE metabot_events gauge\n'
+                           'metabot_events 5\n'
+                           '# TYPE metabot_seconds histogram\n'
+                           'metabot_seconds_bucket{le="0.001"} 0\n'
+                           'metabot_seconds_bucket{le="0.0025"} 0\n'
+                           'metabot_seconds_bucket{le="0.005"} 1\n')
+    assert text.endswith('metabot_seconds_bucket{le="+Inf"} 1\n'
+                         'metabot_seconds_sum 0.003\n'
+                         'metabot_seconds_count 1\n')
+
+
+def test_serve(monkeypatch):
+    """Verify serving enables the default registry, and serves it at /metrics."""
+
+    metrics.reset()
+    monkeypatch.setattr(metrics.REGISTRY, 'enabled', False)
+    server = metrics.serve(0)
+    assert metrics.REGISTRY.enabled
+    metrics.increment('updates', bot='modulestestbot')
+    try:
+        url = f'http://127.0.0.1:{server.server_port}'
+        with urllib.request.urlopen(url + '/metrics') as response:
+            assert response.read() == (b'# TYPE metabot_updates_total counter\n'
+                                       b'metabot_updates_total{bot="modulestestbot"} 1\n')
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + '/other')  # pylint: disable=consider-using-with
+    finally:
+        server.shutdown()
@@ -1,6 +1,7 @@
 """Tests for metabot.util.pickleutil."""
 
 import json
+import pickle
 
 from metabot.util import pickleutil
 
@@ -96,3 +97,50 @@ def test_dump_load(tmpdir):
     obj = {b'key': [b'value', b'value']}
     assert pickleutil.dump(tmpfile.strpath, obj) == obj
     assert pickleutil.load(tmpfile.strpath) == obj
+
+
+def test_append_load_all(tmpdir):
+    """Verify records can be appended and replayed, ignoring a damaged trailing record."""
+
+    tmpfile = tmpdir.join('test.journal')
+    assert pickleutil.load_all(tmpfile.strpath) == []
+
+    size = pickleutil.append(tmpfile.strpath, {'alpha': 1})
+    assert size == tmpfile.size()
+    assert pickleutil.append(tmpfile.strpath, ('bravo', None)) > size
+    assert pickleutil.load_all(tmpfile.strpath) == [{'alpha': 1}, ('bravo', None)]
+
+    data = tmpfile.read_binary()
+    tmpfile.write_binary(data[:-3])
+    assert pickleutil.load_all(tmpfile.strpath) == [{'alpha': 1}]
+
+
+def test_write(tmpdir):
+    """Verify write replaces the existing file without leaving a temporary file behind."""
+
+    tmpfile = tmpdir.join('test.pickle')
+    tmpfile.write('bogus data')
+    obj = {'key': 'value'}
+    assert pickleutil.write(tmpfile.strpath, obj) is obj
+    assert pickleutil.load(tmpfile.strpath) == obj
+    assert tmpdir.listdir() == [tmpfile]
+
+
+def test_load_all_damaged(tmpdir):
+    """Verify a damaged record is truncated away, so later appends are still loaded."""
+
+    fname = tmpdir.join('test.journal').strpath
+    pickleutil.append(fname, 'alpha')
+    with open(fname, 'ab') as fobj:
+        fobj.write(pickle.dumps('bravo', -1)[:-3])
+    assert pickleutil.load_all(fname) == ['alpha']
+
+    pickleutil.append(fname, 'charlie')
+    assert pickleutil.load_all(fname) == ['alpha', 'charlie']
+
+    # Damage can also surface as errors besides EOFError and UnpicklingError.
+    with open(fname, 'ab') as fobj:
+        fobj.write(b'\x80\x04\x8c\x08builtins\x94\x8c\x03nop\x94\x93\x94.')
+    assert pickleutil.load_all(fname) == ['alpha', 'charlie']
+    pickleutil.append(fname, 'delta')
+    assert pickleutil.load_all(fname) == ['alpha', 'charlie', 'delta']
@@ -0,0 +1,79 @@
+"""Tests for metabot.util.rsvpdb."""
+
+from metabot.util import rsvpdb
+
+
+def test_update(tmpdir):
+    """Verify counts are maintained as RSVPs change, and survive a reload."""
+
+    fname = tmpdir.join('rsvps.sqlite3').strpath
+    store = rsvpdb.RSVPStore(fname)
+    alpha = {'local_id': 'cal:alpha', 'end': 2000}
+    assert store.counts('bot', 'cal:alpha') == (0, 0, 0)
+    assert store.get('bot', 'cal:alpha', 1000) == {}
+
+    assert store.update('bot', alpha, 1000, going='+') == {'going': '+'}
+    assert store.update('bot', alpha, 2000, going='?', note='Maybe') == {
+        'going': '?',
+        'note': 'Maybe',
+    }
+    assert store.update('bot', alpha, 3000, note='Note') == {'note': 'Note'}
+    assert store.update('otherbot', alpha, 1000, going='+') == {'going': '+'}
+    assert store.counts('bot', 'cal:alpha') == (1, 1, 2)
+    assert store.counts('otherbot', 'cal:alpha') == (1, 0, 0)
+
+    assert store.update('bot', alpha, 2000, going='+') == {'going': '+', 'note': 'Maybe'}
+    assert store.update('bot', alpha, 3000, note=None) == {}
+    assert store.counts('bot', 'cal:alpha') == (2, 0, 1)
+    assert sorted(store.event('bot', 'cal:alpha')) == [
+        (1000, {
+            'going': '+'
+        }),
+        (2000, {
+            'going': '+',
+            'note': 'Maybe'
+        }),
+    ]
+
+    store = rsvpdb.RSVPStore(fname)
+    assert store.counts('bot', 'cal:alpha') == (2, 0, 1)
+    assert store.get('bot', 'cal:alpha', 2000) == {'going': '+', 'note': 'Maybe'}
+
+    store.update('bot', alpha, 1000, going=None)
+    store.update('bot', alpha, 2000, going=None, note=None)
+    assert store.counts('bot', 'cal:alpha') == (0, 0, 0)
+    assert store.event('bot', 'cal:alpha') == []
+
+
+def test_prune():
+    """Verify prune removes RSVPs for ended events, but not for rescheduled ones."""
+
+    store = rsvpdb.RSVPStore()
+    alpha = {'local_id': 'cal:alpha', 'end': 2000}
+    bravo = {'local_id': 'cal:bravo', 'end': 3000}
+    charlie = {'local_id': 'cal:charlie', 'end': 5000}
+    for event in (alpha, bravo, charlie):
+        store.update('bot', event, 1000, going='+')
+
+    current = {'cal:bravo': dict(bravo, end=6000), 'cal:charlie': charlie}
+    assert store.prune(4000, current.get) == 1
+    assert store.counts('bot', 'cal:alpha') == (0, 0, 0)
+    assert store.event('bot', 'cal:alpha') == []
+    assert store.counts('bot', 'cal:bravo') == (1, 0, 0)
+
+    assert store.prune(5500, current.get) == 1
+    assert store.counts('bot', 'cal:bravo') == (1, 0, 0)
+    assert store.counts('bot', 'cal:charlie') == (0, 0, 0)
+
+
+def test_reload(tmpdir):
+    """Verify reload picks up counts pruned by another process sharing the database."""
+
+    fname = tmpdir.join('rsvps.sqlite3').strpath
+    store = rsvpdb.RSVPStore(fname)
+    store.update('bot', {'local_id': 'cal:alpha', 'end': 2000}, 1000, going='+')
+    other = rsvpdb.RSVPStore(fname)
+    assert other.prune(4000, {}.get) == 1
+    assert store.counts('bot', 'cal:alpha') == (1, 0, 0)
+    store.reload()
+    assert store.counts('bot', 'cal:alpha') == (0, 0, 0)
@@ -0,0 +1,112 @@
+"""Tests for metabot.util.sqliteconf."""
+
+import threading
+
+from metabot.util import dicttools
+from metabot.util import sqliteconf
+
+
+def test_store(tmpdir):
+    """Verify Store.commit and Store.children."""
+
+    store = sqliteconf.Store(tmpdir.join('test.sqlite3').strpath)
+    assert not store
+    assert list(store.children(())) == []
+
+    store.commit({
+        ('alpha', 'bravo', 'charlie'): 'delta',
+        ('alpha', 'bravo', 'echo'): [1, 'two'],
+        ('alpha', 'foxtrot'): 1000,
+        ('alpha', 1000, 'golf'): 'hotel',
+        ('alpha', '1000'): 'india',
+        ('alphabet',): 'soup',
+    })
+    assert store
+    assert list(store.children(())) == [('alpha', None), ('alphabet', 'soup')]
+    assert sorted(store.children(('alpha',)), key=repr) == [
+        ('1000', 'india'),
+        ('bravo', None),
+        ('foxtrot', 1000),
+        (1000, None),
+    ]
+    assert list(store.children(('alpha', 'bravo'))) == [('charlie', 'delta'), ('echo', [1, 'two'])]
+    assert list(store.children(('missing',))) == []
+
+    # Replacing a branch with a leaf (or vice versa) removes the old rows.
+    store.commit({('alpha', 'bravo'): 'leaf', ('alphabet', 'letter'): 'a'})
+    assert list(store.children(())) == [('alpha', None), ('alphabet', None)]
+    assert ('bravo', 'leaf') in list(store.children(('alpha',)))
+    assert list(store.children(('alpha', 'bravo'))) == []
+
+    store.commit({('alpha', 'bravo'): None, ('alphabet', 'letter'): None})
+    assert list(store.children(())) == [('alpha', None)]
+    assert 'bravo' not in dict(store.children(('alpha',)))
+
+
+def test_lazy(tmpdir):
+    """Verify LazyDicts only read from the store when used, and log mutations normally."""
+
+    store = sqliteconf.Store(tmpdir.join('test.sqlite3').strpath)
+    store.commit({
+        ('alpha', 'bravo', 'charlie'): 'delta',
+        ('alpha', 'echo'): ['foxtrot'],
+        ('golf', 'hotel'): 'india',
+    })
+
+    root = dicttools.ImplicitTrackingDict()
+    sqliteconf.populate(root, store)
+    assert sorted(root) == ['alpha', 'golf']
+    assert not root['alpha'].loaded
+    assert root['alpha']
+    assert not root['alpha'].loaded
+    root.finalize()
+    assert not root['alpha'].loaded
+
+    assert root['alpha']['echo'] == ['foxtrot']
+    assert root['alpha'].loaded
+    assert not root['alpha']['bravo'].loaded
+    assert root['alpha']['bravo'] == {'charlie': 'delta'}
+    assert not root['golf'].loaded
+    assert root.log == {}
+
+    root['alpha']['bravo']['charlie'] = 'new'
+    root['alpha']['echo'].append('kilo')
+    root['golf'].clear()
+    assert root.finalize() == {
+        ('alpha', 'bravo', 'charlie'): ('new', 'delta'),
+        ('alpha', 'echo'): (('foxtrot', 'kilo'), ('foxtrot',)),
+        ('golf', 'hotel'): (None, 'india'),
+    }
+
+
+def test_concurrent_load(monkeypatch, tmpdir):
+    """Verify a LazyDict being loaded by one thread isn't seen half-loaded by another."""
+
+    store = sqliteconf.Store(tmpdir.join('test.sqlite3').strpath)
+    store.commit({('alpha', 'bravo'): 'charlie', ('alpha', 'delta'): ['echo']})
+    root = dicttools.ImplicitTrackingDict()
+    sqliteconf.populate(root, store)
+    alpha = root['alpha']
+
+    populating = threading.Event()
+    proceed = threading.Event()
+    populate = sqliteconf.populate
+
+    def _populate(node, store):
+        populating.set()
+        proceed.wait()
+        populate(node, store)
+
+    monkeypatch.setattr(sqliteconf, 'populate', _populate)
+    loader = threading.Thread(target=alpha.load)
+    loader.start()
+    populating.wait()
+    assert not alpha.loaded
+    seen = []
+    reader = threading.Thread(target=lambda: seen.append(dict(alpha)))
+    reader.start()
+    proceed.set()
+    loader.join()
+    reader.join()
+    assert seen == [{'bravo': 'charlie', 'delta': ['echo']}]
+    assert root.finalize() == {}
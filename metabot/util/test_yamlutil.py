@@ -1,5 +1,8 @@
 """Tests for metabot.util.yamlutil."""
 
+import pytest
+import yaml
+
 from metabot.util import yamlutil
 
 
@@ -42,3 +45,39 @@ def test_dump_load(tmpdir):
     obj = {'key': ['value', 'value']}
     assert yamlutil.dump(tmpfile.strpath, obj) == obj
     assert yamlutil.load(tmpfile.strpath) == obj
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason='LibYAML not available')
+def test_libyaml_matches_python():
+    """Verify the LibYAML dumper formats a config exactly like the pure-Python one."""
+
+    # pylint: disable=protected-access
+
+    obj = {
+        'bot%s' % i: {
+            'issue37': {
+                'echo': {
+                    'multiline': {
+                        'text': 'Line one\nLine "two": \xe9 \U0001f600',
+                        'paginate': True,
+                        'private': None,
+                    },
+                },
+                'moderator': {
+                    -1001000000000 - i: {
+                        'admins': [1000, 2000],
+                        'daily': {
+                            'hour': 5,
+                            'text': 'x' * 300,
+                        },
+                    },
+                },
+                'events': {
+                    'rsvp': ['', 'yes', 'null', '1e3', 1.5],
+                },
+            },
+        } for i in range(10)
+    }
+    expected = yaml.dump_all([obj], indent=4, width=200, Dumper=yamlutil._SimplifyingDumper)
+    assert yaml.dump_all([obj], indent=4, width=200, Dumper=yamlutil._Dumper) == expected
+    assert yaml.load(expected, Loader=yamlutil._SafeLoader) == obj
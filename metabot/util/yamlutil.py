@@ -1,7 +1,16 @@
 """Simplified interface to https://pyyaml.org/wiki/PyYAMLDocumentation."""
 
+import os
+
 import yaml
 
+try:
+    from yaml import CSafeLoader as _SafeLoader
+    from yaml.cyaml import CEmitter as _Emitter
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader as _SafeLoader
+    _Emitter = None
+
 
 def load(fname):
     """Load fname as a YAML file, silently returning None on any error."""
@@ -12,17 +21,23 @@ def load(fname):
         return
 
     try:
-        return yaml.safe_load(data)
+        return yaml.load(data, Loader=_SafeLoader)
     except yaml.error.YAMLError:
         pass
 
 
 def dump(fname, obj):
-    """Save obj as a YAML file to fname."""
+    """Save obj as a YAML file to fname (atomically, by writing to a temp file then renaming)."""
 
-    data = yaml.dump_all([obj], indent=4, width=200, Dumper=_SimplifyingDumper).encode('ascii')
-    with open(fname, 'wb') as fobj:
+    dumper = _Dumper
+    if not isinstance(obj, (dict, list)):
+        # LibYAML doesn't end a document consisting of a bare scalar with '...'.
+        dumper = _SimplifyingDumper
+    data = yaml.dump_all([obj], indent=4, width=200, Dumper=dumper).encode('ascii')
+    tmpname = fname + '.tmp'
+    with open(tmpname, 'wb') as fobj:
         fobj.write(data)
+    os.replace(tmpname, fname)
     return obj
 
 
@@ -72,3 +87,48 @@ class _SimplifyingDumper(yaml.emitter.Emitter, yaml.serializer.Serializer, _Simp
                                          default_flow_style=default_flow_style,
                                          sort_keys=sort_keys)
         yaml.resolver.Resolver.__init__(self)
+
+
+if _Emitter:
+
+    class _CSimplifyingDumper(_Emitter, _SimplifyingRepresenter, yaml.resolver.Resolver):
+        """A _SimplifyingDumper that uses LibYAML's emitter (which also does the serializing)."""
+
+        # pylint: disable=too-many-arguments,too-many-locals
+        def __init__(self,
+                     stream,
+                     *,
+                     default_style=None,
+                     default_flow_style=False,
+                     canonical=None,
+                     indent=None,
+                     width=None,
+                     allow_unicode=None,
+                     line_break=None,
+                     encoding=None,
+                     explicit_start=None,
+                     explicit_end=None,
+                     version=None,
+                     tags=None,
+                     sort_keys=True):
+            _Emitter.__init__(self,
+                              stream,
+                              canonical=canonical,
+                              indent=indent,
+                              width=width,
+                              encoding=encoding,
+                              allow_unicode=allow_unicode,
+                              line_break=line_break,
+                              explicit_start=explicit_start,
+                              explicit_end=explicit_end,
+                              version=version,
+                              tags=tags)
+            _SimplifyingRepresenter.__init__(self,
+                                             default_style=default_style,
+                                             default_flow_style=default_flow_style,
+                                             sort_keys=sort_keys)
+            yaml.resolver.Resolver.__init__(self)
+
+    _Dumper = _CSimplifyingDumper
+else:  # pragma: no cover
+    _Dumper = _SimplifyingDumper